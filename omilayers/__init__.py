@@ -1,16 +1,20 @@
 from os import read
+import contextlib
 import duckdb
 from typing import Union
 import pandas as pd
 from omilayers.core import Stack
+from omilayers.core.cache import ResultCache
+from omilayers.core import parallel
 
 class Omilayers:
 
-    def __init__(self, db:str, config:dict={"threads":1}, read_only:bool=False, engine:str='duckdb'):
+    def __init__(self, db:str, config:dict={"threads":1}, read_only:bool=False, engine:str='duckdb', persistent:bool=False, cache:Union[ResultCache,None]=None):
         self.config = config
         self.db = db
         self.read_only = read_only
         self.engine = engine
+        self.persistent = persistent
 
         if self._is_engine_supported():
             if engine == "duckdb":
@@ -19,8 +23,71 @@ class Omilayers:
                 from omilayers.engines.sqlite.dbclass import DButils
 
         self._dbutils = DButils(db, config, read_only=read_only)
+        # Opt-in cache of the results of layer reads.
+        self._dbutils._result_cache = cache
+        if persistent:
+            self._dbutils._open_session()
         self.layers = Stack(db, config, read_only, self._dbutils)
 
+    def __enter__(self):
+        self._dbutils._open_session()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        """Close the long-lived connection of a persistent session and the threads of parallel_map."""
+        pool = getattr(self._dbutils, "_worker_pool", None)
+        if pool is not None:
+            pool.close()
+        self._dbutils._close_session()
+
+    def parallel_map(self, func, items, workers:int=4) -> list:
+        """
+        Apply a function to each item in parallel, e.g. to run many lookups on a read-only project.
+
+        The function runs on a persistent pool of threads that share the connection of the session, so that the project is opened once and the results are not pickled. Each thread queries the database with its own cursor (DuckDB) or pooled connection (SQLite). The threads are kept until close(). Without a persistent session, the session is opened for the call and closed when it returns.
+
+        Parameters
+        ----------
+        func: callable
+            Function whose arguments are this Omilayers object and an item.
+        items: iterable
+            The items to be processed.
+        workers: int
+            The number of threads.
+
+        Returns
+        -------
+        List with the results in the order of the items.
+
+        Examples
+        --------
+        omi = Omilayers("project.duckdb", read_only=True)
+        results = omi.parallel_map(lambda omi, region: omi.layers['vcf'].query("CHROM = ? AND POS = ?", params=list(region)), regions, workers=8)
+        """
+        return parallel._get_pool(self._dbutils).map(lambda item: func(self, item), items, workers)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Run all enclosed writes of the calling thread on one connection in a single transaction, which is committed on exit. If an error is raised, all enclosed writes are rolled back.
+
+        Writes that are not stored in the database, like the arrays of dense layers, are not rolled back.
+
+        Examples
+        --------
+        with omi.batch():
+            omi.layers['foo'] = df
+            omi.layers['foo'].set_tag("data")
+            omi.layers['foo'].set_info("Description of foo.")
+        """
+        with self._dbutils._transaction():
+            yield self
+
+    transaction = batch
+
     def _is_engine_supported(self) -> bool:
         supported_engines = ['sqlite', 'duckdb']
         if self.engine in supported_engines:
@@ -28,7 +95,7 @@ class Omilayers:
         else:
             raise ValueError(f"Engine name is not in supported engines: {supported_engines}")
 
-    def run(self, query:str, fetchdf=False) -> Union[pd.DataFrame, None]:
+    def run(self, query:str, fetchdf=False, params:Union[list,dict,None]=None) -> Union[pd.DataFrame, None]:
         """
         Execute a SQL query.
 
@@ -38,6 +105,8 @@ class Omilayers:
             Query to execute.
         fetchdf: bool
             Pass True in cases the query fetches data.
+        params: list, dict, None
+            Values bound to the placeholders of the query. A list for "?" placeholders, or a dict for named placeholders ("$name" with DuckDB, ":name" with SQLite).
 
         Returns
         -------
@@ -49,12 +118,16 @@ class Omilayers:
         Examples
         --------
         omi.run("SELECT * from tables_info", fetchdf=True)
+        omi.run("SELECT * from tables_info WHERE tag = ?", fetchdf=True, params=["metabolomics"])
 
         """
-        return self._dbutils._run_query(query, fetchdf=fetchdf)
+        return self._dbutils._run_query(query, fetchdf=fetchdf, params=params)
 
 
     def config_settings(self) -> pd.DataFrame:
         """Print duckdb config settings"""
         return self._dbutils._get_db_config_settings()
             
+
+
+from omilayers.aio import AsyncOmilayers
@@ -0,0 +1,205 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Union
+import pandas as pd
+from omilayers import Omilayers
+from omilayers.core import Stack, Layer
+from omilayers.core.cache import ResultCache
+
+
+class AsyncOmilayers:
+    """
+    Asyncio facade of Omilayers for async applications, e.g. web services.
+
+    The methods of the stack and the layers are awaitable and run on a bounded pool of threads, so that they do not block the event loop. The database is opened in a persistent session, in which each thread gets its own cursor (DuckDB) or pooled connection (SQLite). At most max_pending calls are queued or running at a time, and further calls wait until a call finishes. Cancelling a call that has not started drops it, and cancelling a running call interrupts its query.
+
+    Parameters
+    ----------
+    db: str
+        The database file.
+    config: dict
+        The configuration of the connections, as in Omilayers.
+    read_only: bool
+        If True, the database is opened read-only.
+    engine: str
+        "duckdb" or "sqlite".
+    cache: ResultCache, None
+        Opt-in cache of the results of layer reads.
+    max_workers: int
+        The number of threads that run the calls.
+    max_pending: int
+        The maximum number of calls that are queued or running.
+
+    Examples
+    --------
+    async with AsyncOmilayers("dbname.duckdb", read_only=True) as omi:
+        df = await omi.layers['foo'].query("DP > ?", params=[10])
+    """
+
+    def __init__(self, db:str, config:dict={"threads":1}, read_only:bool=False, engine:str='duckdb', cache:Union[ResultCache,None]=None, max_workers:int=4, max_pending:int=64):
+        if max_workers < 1 or max_pending < 1:
+            raise ValueError("max_workers and max_pending should be positive.")
+        if engine == "sqlite":
+            # Each thread holds a pooled connection.
+            config = dict(config, pool_size=max(config.get("pool_size", 4), max_workers))
+        self._omi = Omilayers(db, config=config, read_only=read_only, engine=engine, persistent=True, cache=cache)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="omilayers")
+        self._slots = asyncio.Semaphore(max_pending)
+        self.layers = AsyncStack(self, self._omi.layers)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self) -> None:
+        """Wait for the running calls and close the threads and the connections."""
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        self._omi.close()
+
+    async def _run(self, func:Callable, *args, **kwargs):
+        """
+        Run a blocking function on the pool of threads.
+
+        Parameters
+        ----------
+        func: callable
+            The function to run.
+        args, kwargs:
+            The arguments of the function.
+        """
+        thread = {}
+        def call():
+            thread["id"] = threading.get_ident()
+            return func(*args, **kwargs)
+        async with self._slots:
+            future = self._executor.submit(call)
+            waiter = asyncio.wrap_future(future)
+            try:
+                return await asyncio.shield(waiter)
+            except asyncio.CancelledError:
+                if not future.cancel():
+                    # The call is running, so its query is interrupted and the slot is kept until it stops.
+                    if "id" in thread:
+                        self._omi._dbutils._interrupt(thread["id"])
+                    await asyncio.wait([waiter])
+                    # The error of the interrupted query is expected.
+                    waiter.exception()
+                raise
+
+    async def call(self, func:Callable, *args, **kwargs):
+        """
+        Run a function of the synchronous API on the pool of threads, e.g. a lazy query.
+
+        Parameters
+        ----------
+        func: callable
+            Function whose first argument is the synchronous Omilayers object.
+        args, kwargs:
+            The other arguments of the function.
+
+        Examples
+        --------
+        await omi.call(lambda omi: omi.layers['foo'].lazy().filter("DP > 10").head(5).collect())
+        """
+        return await self._run(func, self._omi, *args, **kwargs)
+
+    async def run(self, query:str, fetchdf=False, params:Union[list,dict,None]=None) -> Union[pd.DataFrame, None]:
+        """Awaitable counterpart of Omilayers.run."""
+        return await self._run(self._omi.run, query, fetchdf=fetchdf, params=params)
+
+
+def _method(cls, name:str) -> Callable:
+    """Awaitable counterpart of a method of the synchronous class."""
+    @functools.wraps(getattr(cls, name))
+    async def method(self, *args, **kwargs):
+        return await self._omi._run(lambda: getattr(self._target(), name)(*args, **kwargs))
+    return method
+
+def _property(cls, name:str) -> Callable:
+    """Awaitable method that gets a property of the synchronous class."""
+    @functools.wraps(getattr(cls, name).fget)
+    async def method(self):
+        return await self._omi._run(lambda: getattr(self._target(), name))
+    return method
+
+
+class AsyncStack:
+    """Awaitable counterpart of Stack. Layers are accessed with omi.layers['name'] and their data are set with await omi.layers.set('name', df)."""
+
+    def __init__(self, omi:AsyncOmilayers, stack:Stack) -> None:
+        self._omi = omi
+        self._stack = stack
+
+    def _target(self) -> Stack:
+        return self._stack
+
+    refresh = _method(Stack, "refresh")
+    drop = _method(Stack, "drop")
+    rename = _method(Stack, "rename")
+    search = _method(Stack, "search")
+    from_csv = _method(Stack, "from_csv")
+    from_vcf = _method(Stack, "from_vcf")
+    from_parquet = _method(Stack, "from_parquet")
+
+    async def set(self, layer:str, data:Union[pd.DataFrame,None]) -> None:
+        """Awaitable counterpart of omi.layers['name'] = data."""
+        await self._omi._run(self._stack.__setitem__, layer, data)
+
+    async def __call__(self, tag:Union[None,str]=None) -> pd.DataFrame:
+        """Awaitable counterpart of omi.layers(tag)."""
+        return await self._omi._run(self._stack, tag)
+
+    def __getitem__(self, layer:str):
+        return AsyncLayer(self._omi, self._stack, layer)
+
+
+class AsyncLayer:
+    """Awaitable counterpart of Layer. Properties of Layer, e.g. columns or info, are awaitable methods."""
+
+    def __init__(self, omi:AsyncOmilayers, stack:Stack, name:str) -> None:
+        self._omi = omi
+        self._stack = stack
+        self.name = name
+
+    def _target(self) -> Layer:
+        # Looking up the layer may query the database, so it runs on the pool of threads.
+        return self._stack[self.name]
+
+    exists = _property(Layer, "exists")
+    columns = _property(Layer, "columns")
+    dtypes = _property(Layer, "dtypes")
+    stats = _property(Layer, "stats")
+    info = _property(Layer, "info")
+    tag = _property(Layer, "tag")
+    indexes = _property(Layer, "indexes")
+    create_index = _method(Layer, "create_index")
+    drop_index = _method(Layer, "drop_index")
+    set_info = _method(Layer, "set_info")
+    set_tag = _method(Layer, "set_tag")
+    set_data = _method(Layer, "set_data")
+    insert = _method(Layer, "insert")
+    select = _method(Layer, "select")
+    query = _method(Layer, "query")
+    range = _method(Layer, "range")
+    ranges = _method(Layer, "ranges")
+    update = _method(Layer, "update")
+    assign = _method(Layer, "assign")
+    rename = _method(Layer, "rename")
+    drop = _method(Layer, "drop")
+    to_df = _method(Layer, "to_df")
+    to_arrow = _method(Layer, "to_arrow")
+    to_polars = _method(Layer, "to_polars")
+    to_parquet = _method(Layer, "to_parquet")
+    to_json = _method(Layer, "to_json")
+
+    async def get(self, features):
+        """Awaitable counterpart of layer[features]."""
+        return await self._omi._run(lambda: self._target()[features])
+
+    async def set(self, feature:str, data) -> None:
+        """Awaitable counterpart of layer[feature] = data."""
+        await self._omi._run(lambda: self._target().__setitem__(feature, data))
@@ -2,6 +2,15 @@ import duckdb
 from pathlib import Path
 from typing import List, Dict, Union
 from omilayers import utils
+from omilayers.utils import vcf
+from omilayers.utils import stats
+from omilayers.core.matrix import MatrixLayer, SAMPLES_SUFFIX, FEATURES_SUFFIX
+from omilayers.core.dense import DenseLayer, arrays_path
+from omilayers.core.cache import ResultCache
+from omilayers.core.lazy import LazyQuery
+from omilayers.core import parallel
+from omilayers.core import ingest
+import shutil
 import pandas as pd
 import numpy as np
 import inspect
@@ -14,11 +23,34 @@ class Stack:
         self.read_only = read_only
         # self._dbutils = DButils(db, config, read_only=read_only)
         self._dbutils = dbutilsClass
+        # Cache of layers metadata that is shared with the engine.
+        self._catalog = self._dbutils._catalog
         self._layers = dict()
         if Path(self.db).exists():
             layerNames = self._dbutils._get_tables_names()
             for name in layerNames:
-                self._layers[name] = Layer(name, data=None, dbutilsClass=self._dbutils)
+                self._layers[name] = self._load_layer(name)
+
+    def _load_layer(self, name:str):
+        """Create the object of an existing layer."""
+        if MatrixLayer._is_matrix(name, self._dbutils):
+            return MatrixLayer(name, self._dbutils)
+        if self._is_dense(name):
+            return DenseLayer(name, self._dbutils, arrays_path(self.db, name))
+        return Layer(name, data=None, dbutilsClass=self._dbutils)
+
+    def _is_dense(self, name:str) -> bool:
+        """Check whether a layer is stored as a dense layer."""
+        return DenseLayer._is_dense(arrays_path(self.db, name)) and name not in self._dbutils._get_all_tables_names()
+
+    def refresh(self) -> None:
+        """
+        Drop the cached metadata of the layers and reload the layers from the database. Useful when the database was changed by another process or connection.
+        """
+        self._catalog.invalidate()
+        self._layers = dict()
+        for name in self._dbutils._get_tables_names():
+            self._layers[name] = self._load_layer(name)
 
     def drop(self, layer:str) -> None:
         """
@@ -30,8 +62,17 @@ class Stack:
             The name of the layer to delete.
         """
         self._layers.pop(layer, None)
+        isMatrix = MatrixLayer._is_matrix(layer, self._dbutils)
+        isDense = self._is_dense(layer)
         if self._dbutils._table_exists(layer):  
             self._dbutils._drop_table(layer)
+        if isMatrix:
+            self._dbutils._drop_table(layer + SAMPLES_SUFFIX)
+            self._dbutils._drop_table(layer + FEATURES_SUFFIX)
+        if isDense:
+            shutil.rmtree(arrays_path(self.db, layer))
+            if not any(arrays_path(self.db).iterdir()):
+                arrays_path(self.db).rmdir()
 
     def rename(self, layer:str, new_name:str) -> None:
         """
@@ -45,50 +86,98 @@ class Stack:
             The new name of the layer.
         """
         self._layers.pop(layer, None)
-        self._layers[new_name] = Layer(new_name, data=None, dbutilsClass=self._dbutils)
-        self._dbutils._rename_table(layer, new_name)
+        if MatrixLayer._is_matrix(layer, self._dbutils):
+            self._dbutils._rename_table(layer + SAMPLES_SUFFIX, new_name + SAMPLES_SUFFIX)
+            self._dbutils._rename_table(layer + FEATURES_SUFFIX, new_name + FEATURES_SUFFIX)
+        if self._is_dense(layer):
+            arrays_path(self.db, layer).rename(arrays_path(self.db, new_name))
+        else:
+            self._dbutils._rename_table(layer, new_name)
         self._dbutils._update_tables_info(layer, "name", new_name)
+        self._layers[new_name] = self._load_layer(new_name)
 
-    def search(self, term:str) -> None:
+    def search(self, term:str, fuzzy:bool=False, limit:Union[int,None]=None) -> pd.DataFrame:
         """
-        Search for layers based on a given term. Useful in situations where there are many layers and there is doubt which table holds a given information or data. The term is searched across layer names, layer columns and layer descriptions. 
+        Search for layers based on a given term. Useful in situations where there are many layers and there is doubt which table holds a given information or data. The term is searched across layer names, layer columns and layer descriptions using the search index of the database.
 
         Parameters
         ----------
         term: str
-            Term to be search across layer names, layer columns and layer descriptions.
+            Term to be search across layer names, layer columns and layer descriptions. Matched case-insensitively as substring, so that prefixes of feature names (e.g. "ENSG0000012") also match.
+        fuzzy: bool
+            If True, layer names and columns that are similar to the term (e.g. misspelled) are also matched.
+        limit: int, None
+            The maximum number of layers to be returned. If None, all matched layers are returned.
 
         Returns
         -------
-        Prints the names of the layers that matched the searched term.
-        """
-        JSON = {}
-        for layer in self._layers.keys():
-            if term.lower() in layer.lower():
-                if not JSON.get(layer, False):
-                    JSON[layer] = "found"
-            if term.lower() in self._layers[layer].info.lower():
-                if not JSON.get(layer, False):
-                    JSON[layer] = "found"
-
-            layerCols = self._layers[layer].columns
-            for col in layerCols:
-                if term.lower() in col.lower():
-                    if not JSON.get(layer, False):
-                        JSON[layer] = "found"
-
-        if len(JSON.keys()) > 0:
-            layers = list(JSON.keys())
-            tableCols = self._dbutils._get_table_column_names("tables_info")
-            df = self._dbutils._select_rows(table="tables_info", cols=tableCols, where="name", values=layers)
-            df = df[tableCols] # order column names
-            print(df.to_string(index=False))
-        else:
-            print("Term was not found in any layer.")
+        pandas.DataFrame with the name, tag, shape and info of the matched layers, ranked by score. Exact matches score 1, prefix matches 0.8, substring matches 0.6 and fuzzy matches up to 0.5. The "matches" column lists the best matched terms as "kind:term", where kind is "name", "info" or "column".
+        """
+        hits = self._dbutils._search_layers(term, fuzzy=fuzzy)
+        cols = ['name', 'tag', 'shape', 'info', 'score', 'matches']
+        if hits.empty:
+            return pd.DataFrame(columns=cols)
+        hits = hits.sort_values(['score', 'term'], ascending=[False, True])
+        hits['match'] = hits['kind'] + ":" + hits['term']
+        matches = hits.groupby('layer', sort=False).agg(score=('score', 'max'), matches=('match', lambda match: ", ".join(match.head(5))))
+        # Only the shapes of the matched layers are looked up.
+        tables = [row for row in self._dbutils._get_tables_metadata() if row['name'] in matches.index]
+        df = pd.DataFrame(tables, columns=['name', 'tag', 'info']).merge(matches, left_on='name', right_index=True)
+        df['shape'] = [self._dbutils._get_table_shape(name) for name in df['name']]
+        df = df.sort_values(['score', 'name'], ascending=[False, True])
+        if limit is not None:
+            df = df.head(limit)
+        return df[cols].reset_index(drop=True)
+
+    def create_matrix(self, layer:str, data:Union[pd.DataFrame,None]=None, dtype:str="float64") -> MatrixLayer:
+        """
+        Create a matrix layer that stores a samples x features matrix in long (COO) format, i.e. one row (sample_id, feature_id, value) per non-zero value. The names of the samples and the features are stored once in the dictionary tables "{layer}__samples" and "{layer}__features". Suited to sparse matrices (e.g. single-cell counts) and to matrices with more features than the columns a layer can hold.
 
-    def from_csv(self, layer:str, filename:str, chunksize:Union[int,None]=None, *args, **kwargs) -> None:
+        Parameters
+        ----------
+        layer: str
+            The name of the layer to be created.
+        data: pandas.DataFrame, None
+            The values with the samples as index and the features as columns. If None, an empty matrix is created.
+        dtype: str
+            The dtype of the stored values, e.g. "float32" or "int32".
+
+        Returns
+        -------
+        MatrixLayer
         """
-        Create layer from a csv file. For large csv files, set chunksize to the number of rows that will be read each time from the file.
+        if self._dbutils._table_exists(layer):
+            raise ValueError(f"Layer '{layer}' already exists.")
+        self._layers[layer] = MatrixLayer._create(layer, self._dbutils, dtype=dtype)
+        if data is not None:
+            self._layers[layer].add_samples(data)
+        return self._layers[layer]
+
+    def create_dense(self, layer:str, data:pd.DataFrame, dtype:Union[str,None]=None) -> DenseLayer:
+        """
+        Create a dense layer from a purely numeric matrix (e.g. RNA-seq counts or metabolite intensities). The values are stored as memory-mapped .npy files in the directory "{db}.arrays/{layer}" next to the database file, and reading them needs neither a query nor a copy. If the layer exists, it is replaced.
+
+        Parameters
+        ----------
+        layer: str
+            The name of the layer to be created.
+        data: pandas.DataFrame
+            The numeric values with the row labels as index and the column labels as columns.
+        dtype: str, None
+            The dtype of the stored values, e.g. "float32". If None, the common dtype of the columns is used.
+
+        Returns
+        -------
+        DenseLayer
+        """
+        if layer in self._layers:
+            self.drop(layer)
+        self._layers[layer] = DenseLayer._create(layer, self._dbutils, arrays_path(self.db, layer), data, dtype=dtype)
+        return self._layers[layer]
+
+    def from_csv(self, layer:str, filename:str, chunksize:Union[int,None]=None, *args, native:bool=False, workers:int=1, **kwargs) -> None:
+        """
+        Create layer from a csv file. For large csv files, set chunksize to the number of rows that will be read each time from the file, and workers to parse the chunks in parallel.
 
         Parameters
         ----------
@@ -98,38 +187,133 @@ class Stack:
             The input csv file.
         chunksize: int, None
             The number of rows that will be read each time from the file. If None, the whole csv file will be read.
+        native: bool
+            If True and the engine has its own csv reader (DuckDB), the file is read by the engine in parallel and with type sniffing instead of pandas. Keywords are passed to the reader of the engine, where the pandas keywords "sep", "header", "dtype", "skiprows" and "na_values" are translated. The dtypes are mapped to the types of the engine. The chunksize is ignored in that case.
+        workers: int
+            If larger than 1, the chunks are parsed by that many worker processes while the parsed chunks are written to the layer in a single transaction, so that parsing and writing overlap. The chunksize defaults to 100000 rows. Fields with quoted line breaks and the keywords "skiprows", "nrows" and "skipfooter" are not supported in that case.
         *args, **kwargs: arguments and keywords as defined by pandas.read_csv
         """
-        if chunksize is not None:
-            layerExists = self._dbutils._table_exists(layer)
+        if native and hasattr(self._dbutils, "_create_table_from_csv"):
+            if args:
+                raise ValueError("Pass the options of the native csv reader as keywords.")
+            self._dbutils._create_table_from_csv(table=layer, filename=filename, options=kwargs)
+            self._layers[layer] = Layer(layer, data=None, dbutilsClass=self._dbutils)
+            return
+
+        if workers > 1:
+            if args:
+                raise ValueError("Pass the options of pandas.read_csv as keywords when workers are used.")
+            chunks = ingest.iter_csv_parallel(filename, chunksize or ingest.DEFAULT_CHUNKSIZE, workers, kwargs)
+            try:
+                # The process is the only writer and commits once.
+                with self._dbutils._transaction():
+                    self._write_chunks(layer, chunks)
+            finally:
+                chunks.close()
+        elif chunksize is not None:
             with pd.read_csv(filename, chunksize=chunksize, *args, **kwargs) as infile:
-                for dftmp in infile:
-                    if not layerExists:
-                        self._layers[layer] = Layer(layer, data=dftmp, dbutilsClass=self._dbutils)
-                        layerExists = True
-                    else:
-                        self._dbutils._insert_rows(table=layer, data=dftmp, ordered=True)
+                self._write_chunks(layer, infile)
         else:
             data = pd.read_csv(filename, *args, **kwargs)
             self._layers[layer] = Layer(layer, data, self._dbutils)
 
+    def _write_chunks(self, layer:str, chunks) -> None:
+        """Create layer from the first chunk, or append it if the layer exists, and append the other chunks."""
+        layerExists = self._dbutils._table_exists(layer)
+        for dftmp in chunks:
+            if not layerExists:
+                self._layers[layer] = Layer(layer, data=dftmp, dbutilsClass=self._dbutils)
+                layerExists = True
+            else:
+                self._dbutils._insert_rows(table=layer, data=dftmp, ordered=True)
+
+    def from_vcf(self, layer:str, filename:str, fields:Union[List,None]=None, layout:str="wide", info:Union[bool,List]=True, info_sep:str=";", chunksize:int=100000) -> None:
+        """
+        Create layer from a VCF file. The file is streamed in chunks and the FORMAT fields of each sample are stored as typed columns.
+
+        Parameters
+        ----------
+        layer: str
+            The name of the layer to be created.
+        filename: str
+            Plain or gzip compressed VCF file.
+        fields: list, None
+            The FORMAT fields to be stored (e.g. ["GT", "DS"]). If None, all the fields in the FORMAT of the first record are stored.
+        layout: str
+            If "wide", one row per variant with the columns "{sample}_{field}" for each sample and field. If "long", one row per variant and sample with the columns CHROM, POS, ID, REF, ALT, SAMPLE and one column per field.
+        info: bool, list
+            Only for the wide layout. If True, each INFO key is stored as a separate column. If list, only the given INFO keys are stored. If False, the INFO column is stored as is.
+        info_sep: str
+            The separator of the INFO key/value pairs.
+        chunksize: int
+            The number of variants that will be read each time from the file.
+        """
+        layerCreated = False
+        for dftmp in vcf.iter_vcf_chunks(filename, fields=fields, layout=layout, info=info, info_sep=info_sep, chunksize=chunksize):
+            if not layerCreated:
+                self._layers[layer] = Layer(layer, data=dftmp, dbutilsClass=self._dbutils)
+                layerCreated = True
+            else:
+                self._dbutils._insert_rows(table=layer, data=dftmp, ordered=True)
+        if not layerCreated:
+            raise ValueError(f"No variants were found in '{filename}'.")
+        for col in self._dbutils._get_table_column_names(layer):
+            if col in ["CHROM", "SAMPLE", "GT"] or col.endswith("_GT"):
+                self._dbutils._convert_to_enum(layer, col)
+
+    def from_parquet(self, layer:str, filename:Union[str,List], external:bool=False, batch_size:int=100000) -> None:
+        """
+        Create layer from one or more Parquet files.
+
+        Parameters
+        ----------
+        layer: str
+            The name of the layer to be created.
+        filename: str, list
+            Parquet file, list of Parquet files or glob pattern (e.g. "counts/*.parquet").
+        external: bool
+            If True, the layer is a view over the Parquet files and the data are not copied in the database (DuckDB only). The files should not be moved while the layer is in use and the layer is read-only.
+        batch_size: int
+            The number of rows that will be read each time from the files when the engine cannot read Parquet files (SQLite).
+        """
+        if hasattr(self._dbutils, "_create_table_from_parquet"):
+            self._dbutils._create_table_from_parquet(table=layer, filename=filename, external=external)
+            self._layers[layer] = Layer(layer, data=None, dbutilsClass=self._dbutils)
+            return
+        if external:
+            raise NotImplementedError("External layers are supported only by the DuckDB engine.")
+
+        utils._import_optional("pyarrow")
+        import pyarrow.parquet as pq
+        filenames = [filename] if isinstance(filename, str) else filename
+        layerCreated = False
+        for name in filenames:
+            for batch in pq.ParquetFile(name).iter_batches(batch_size=batch_size):
+                dftmp = batch.to_pandas()
+                if not layerCreated:
+                    self._layers[layer] = Layer(layer, data=dftmp, dbutilsClass=self._dbutils)
+                    layerCreated = True
+                else:
+                    self._dbutils._insert_rows(table=layer, data=dftmp, ordered=True)
+
     def __getitem__(self, layer:str) -> pd.DataFrame:
         if not self._layers.get(layer, False):
             raise ValueError(f"Layer '{layer}' does not exist.")
         return self._layers[layer]
 
     def __setitem__(self, layer:str, data:Union[pd.DataFrame,None]):
+        if isinstance(self._layers.get(layer), (MatrixLayer, DenseLayer)):
+            self.drop(layer)
         self._layers[layer] = Layer(layer, data, self._dbutils)
 
     def __call__(self, tag:Union[None,str]=None) -> pd.DataFrame:
-        df = self._dbutils._select_cols(table="tables_info", cols="*")
-        if tag is None:
-            return df
-        return df.query(f"tag == '{tag}'")
+        df = self._dbutils._get_tables_info(tag)
+        # The shapes come from the statistics of the tables, so the shapes of dense layers are read from their arrays.
+        df['shape'] = [f"{self._layers[name].shape[0]}x{self._layers[name].shape[1]}" if isinstance(self._layers.get(name), DenseLayer) else shape for name,shape in zip(df['name'], df['shape'])]
+        return df
 
     def __repr__(self):
-        df = self._dbutils._get_tables_info()
-        return df.to_string(index=False)
+        return self().to_string(index=False)
 
 
 class Selector:
@@ -155,6 +339,8 @@ class Layer:
         self._dbutils = dbutilsClass
         self.name = name
         self.loc = Selector(name, self._dbutils)
+        # Backend used by Layer[...] where no backend can be passed.
+        self.backend = "pandas"
         if data is not None:
             try:
                 self._dbutils._create_table_from_pandas(table=name, data=data)
@@ -173,6 +359,20 @@ class Layer:
         """Get the columns of the layer."""
         return self._dbutils._get_table_column_names(self.name)
 
+    @property
+    def dtypes(self) -> Dict:
+        """Get the columns of the layer with their database types."""
+        return self._dbutils._get_table_column_types(self.name)
+
+    @property
+    def stats(self) -> pd.DataFrame:
+        """
+        Get the number of non-null values, the number of nulls, the minimum, the maximum and the number of distinct values of each column.
+
+        The statistics of the columns are computed when first requested, stored in the database and kept up to date by the writes of the layer. Statistics that writes cannot maintain, like the number of distinct values after rows are inserted or all statistics after rows are deleted, are computed again when requested. DuckDB approximates the number of distinct values.
+        """
+        return stats.to_dataframe(self._dbutils._get_table_stats(self.name), self.columns)
+
     @property
     def info(self) -> Union[str,List]:
         """Get the description of the layer."""
@@ -183,6 +383,43 @@ class Layer:
         """Get the assigned tag of the layer."""
         return self._dbutils._get_from_tables_info(table=self.name, col="tag")
 
+    @property
+    def indexes(self) -> pd.DataFrame:
+        """Get the indexes of the layer with their names, indexed columns and uniqueness."""
+        return pd.DataFrame(self._dbutils._get_indexes(self.name), columns=['name', 'columns', 'unique'])
+
+    def create_index(self, cols:Union[str,List], unique:bool=False, name:Union[str,None]=None) -> str:
+        """
+        Create an index on one or more columns of the layer. Lookups with select, query and loc that filter the indexed columns by value do not scan the whole layer.
+
+        Parameters
+        ----------
+        cols: str, list
+            One or more columns to be indexed.
+        unique: bool
+            If True, the values of the indexed columns should be unique.
+        name: str, None
+            The name of the index. If None, the name is created from the names of the layer and the columns.
+
+        Returns
+        -------
+        The name of the index.
+        """
+        if isinstance(cols, str):
+            cols = [cols]
+        return self._dbutils._create_index(table=self.name, cols=cols, unique=unique, name=name)
+
+    def drop_index(self, name:str) -> None:
+        """
+        Delete an index of the layer.
+
+        Parameters
+        ----------
+        name: str
+            The name of the index as shown in Layer.indexes.
+        """
+        self._dbutils._drop_index(table=self.name, name=name)
+
     def set_info(self, value:str) -> None:
         """Change the description of the layer."""
         self._dbutils._update_tables_info(table=self.name, col="info", value=value)
@@ -203,9 +440,14 @@ class Layer:
         try:
             layerCurrentInfo = self.info
             layerCurrentTag = self.tag
+            layerCurrentIndexes = self._dbutils._get_indexes(self.name)
             self._dbutils._create_table_from_pandas(table=self.name, data=data)
             self.set_info(layerCurrentInfo)
             self.set_tag(layerCurrentTag)
+            # Rebuild the indexes whose columns are still in the layer.
+            for index in layerCurrentIndexes:
+                if set(index['columns']).issubset(data.columns):
+                    self._dbutils._create_index(table=self.name, cols=index['columns'], unique=index['unique'], name=index['name'])
         except Exception as error:
             print(error)
 
@@ -231,7 +473,22 @@ class Layer:
         else:
             self._dbutils._insert_rows(table=self.name, data=data, ordered=ordered)
 
-    def select(self, cols:Union[str,List], where:str, values:Union[str,int,float,slice,np.ndarray,List], exclude:Union[str,List,None]=None) -> pd.DataFrame:
+    def _cached(self, key:tuple, backend:str, load):
+        """Read through the result cache of the engine, if any."""
+        cache = getattr(self._dbutils, "_result_cache", None)
+        if cache is None:
+            return load()
+        return cache._get_or_load(self.name, self._dbutils, key, backend, load)
+
+    def _columns_expression(self, cols:Union[str,List]) -> str:
+        """Columns of a SELECT statement for one or more columns, or all columns if cols='*'."""
+        if isinstance(cols, list):
+            return ",".join(utils._sanitize_column_names(cols))
+        elif isinstance(cols, str) and cols != "*":
+            return f'"{cols}"'
+        return self._dbutils._all_columns
+
+    def select(self, cols:Union[str,List], where:Union[str,List], values:Union[str,int,float,slice,np.ndarray,List], exclude:Union[str,List,None]=None, backend:str="pandas") -> pd.DataFrame:
         """
         Select columns from layer where a reference column has rows with certain values.
 
@@ -239,23 +496,23 @@ class Layer:
         ----------
         cols: str, list
             The columns to select from layer. If cols='*' all columns are selected.
-        where: str
-            The name of the reference column in the layer.
+        where: str, list
+            The name of the reference column in the layer. A list of columns for composite keys.
         values: str, int, float, np.ndarray, list
-            The values the reference column to be used during row selection. 
+            The values the reference column to be used during row selection. For a list of reference columns, a list of tuples or a pandas.DataFrame.
         exclude: str, list
             Useful in cases where large number of columns need to selected except few ones.
+        backend: str
+            The format of the returned data. One of "pandas", "pandas_pyarrow", "arrow", "polars" or "numpy".
 
         Returns
         -------
-        A pandas.DataFrame with the selected columns and the filtered rows.
+        A pandas.DataFrame with the selected columns and the filtered rows, or the corresponding object of the given backend.
         """
-        df = self._dbutils._select_rows(table=self.name, cols=cols, where=where, values=values)
-        if df.shape[1] == 1:
-            return df.iloc[:, 0].values
-        return df
+        result = self._cached(("select", cols, where, values, exclude), backend, lambda: self._dbutils._select_rows(table=self.name, cols=cols, where=where, values=values, exclude=exclude, backend=backend))
+        return utils._squeeze(result, backend)
 
-    def query(self, condition:str, cols:Union[str,List]='*') -> pd.DataFrame:
+    def query(self, condition:str, cols:Union[str,List]='*', backend:str="pandas", params:Union[List,dict,None]=None) -> pd.DataFrame:
         """
         Select one or more columns from layer given condition.
 
@@ -264,23 +521,219 @@ class Layer:
         cols: str, list
             One or more columns to be selected from layer. If col='*' all columns will be selected.
         condition: str
-            The condition to be matched during selection. For instance, when a given column has a given value.
+            The condition to be matched during selection. For instance, when a given column has a given value. Values can be passed as "?" placeholders that are bound to params.
+        backend: str
+            The format of the returned data. One of "pandas", "pandas_pyarrow", "arrow", "polars" or "numpy".
+        params: list, dict, None
+            Values bound to the placeholders of the condition. A list for "?" placeholders, or a dict for named placeholders ("$name" with DuckDB, ":name" with SQLite).
 
         Returns
         -------
-        A pandas.DataFrame with the selected columns and the filtered rows.
+        A pandas.DataFrame with the selected columns and the filtered rows, or the corresponding object of the given backend.
+
+        Examples
+        --------
+        omi.layers['vcf'].query("CHROM = ? AND POS BETWEEN ? AND ?", params=["chr15", 48000000, 48100000])
         """
-        if isinstance(cols, list):
-            cols = ",".join(utils._sanitize_column_names(cols))
-        elif isinstance(cols, str) and cols != "*":
-            cols = f'"{cols}"'
-        condition = condition.replace('`', '"')
-        queryText = f'SELECT rowid,{cols} FROM {self.name} WHERE {condition}'
-        df = self._dbutils._execute_select_query(queryText)
-        if df.shape[1] == 1:
-            return df.iloc[:, 0].values
-        df = df.set_index("rowid")
-        return df
+        return self.lazy().filter(condition, params=params).select(cols).collect(backend=backend)
+
+    def select_many(self, condition:str, params:List, cols:Union[str,List]='*', backend:str="pandas", workers:int=4) -> List:
+        """
+        Run the same query with many sets of parameters in parallel, e.g. thousands of region lookups.
+
+        The queries run on a persistent pool of threads that share the connection of the session, so that the database is opened once and the results are not pickled. The pool is kept until Omilayers.close().
+
+        Parameters
+        ----------
+        condition: str
+            The condition of the query with "?" or named placeholders.
+        params: list
+            One list or dict of values for each query.
+        cols: str, list
+            One or more columns to be selected from layer. If col='*' all columns will be selected.
+        backend: str
+            The format of the returned data. One of "pandas", "pandas_pyarrow", "arrow", "polars" or "numpy".
+        workers: int
+            The number of threads.
+
+        Returns
+        -------
+        List with the result of each query in the order of params.
+
+        Examples
+        --------
+        omi.layers['vcf'].select_many("CHROM = ? AND POS = ?", params=[["chr1", 100001], ["chr10", 100002]], cols=["SA096", "SA098"], workers=8)
+        """
+        lazyQuery = self.lazy().select(cols)
+        return parallel._get_pool(self._dbutils).map(lambda values: lazyQuery.filter(condition, params=values).collect(backend=backend), params, workers)
+
+    def lazy(self) -> LazyQuery:
+        """
+        Start a lazy query of the layer. Filters, column selections, sorting and limits are compiled to a single query that is executed by collect(), so that only the selected columns are fetched.
+
+        Examples
+        --------
+        omi.layers['vcf'].lazy().filter("CHROM = ?", params=["chr15"])[["ID", "SA010"]].head(100).collect()
+        """
+        return LazyQuery(self)
+
+    def iter_batches(self, batch_size:int=100000, cols:Union[str,List]='*', condition:Union[str,None]=None, backend:str="pandas", params:Union[List,dict,None]=None):
+        """
+        Iterate over the rows of layer in batches without loading the whole layer in memory.
+
+        Parameters
+        ----------
+        batch_size: int
+            The maximum number of rows of each batch.
+        cols: str, list
+            One or more columns to be selected from layer. If col='*' all columns will be selected.
+        condition: str, None
+            The condition to be matched by the rows. If None, all rows will be iterated.
+        backend: str
+            The format of each batch. One of "pandas", "pandas_pyarrow", "arrow", "polars" or "numpy". With "arrow", batches are pyarrow.RecordBatch objects.
+        params: list, dict, None
+            Values bound to the placeholders of the condition.
+
+        Yields
+        ------
+        Batches of rows as pandas.DataFrame with the rowid as index, or as the corresponding object of the given backend.
+
+        Examples
+        --------
+        for batch in omi.layers['vcf'].iter_batches(500000, cols=['ID', 'SA010'], condition="CHROM == 'chr1'"):
+            ...
+        """
+        cols = self._columns_expression(cols)
+        queryText = f'SELECT rowid,{cols} FROM {self.name}'
+        if condition is not None:
+            condition = condition.replace('`', '"')
+            queryText += f' WHERE {condition}'
+        for batch in self._dbutils._iter_batches(queryText, batch_size=batch_size, backend=backend, params=params, table=self.name):
+            yield utils._set_rowid_index(batch, backend)
+
+    def set_genomic_layout(self, chrom_col:str="CHROM", pos_col:str="POS") -> None:
+        """
+        Organize the layer by chromosome and position so that range and ranges read only the rows in the requested regions instead of the whole layer. With the DuckDB engine, the rows are sorted by chromosome and position and their rowids are renumbered. With the SQLite engine, an index is created on the two columns.
+
+        Parameters
+        ----------
+        chrom_col: str
+            The column with the chromosomes.
+        pos_col: str
+            The column with the positions.
+        """
+        self._dbutils._create_genomic_layout(table=self.name, chrom_col=chrom_col, pos_col=pos_col)
+
+    def _range_condition(self, chrom:str, start:int, end:int, chrom_col:str, pos_col:str) -> str:
+        """WHERE condition for the rows of a genomic region."""
+        chrom = str(chrom).replace("'", "''")
+        return f'"{chrom_col}" = \'{chrom}\' AND "{pos_col}" BETWEEN {int(start)} AND {int(end)}'
+
+    def range(self, chrom:str, start:int, end:int, cols:Union[str,List]='*', chrom_col:str="CHROM", pos_col:str="POS", backend:str="pandas") -> pd.DataFrame:
+        """
+        Select the rows of a genomic region. For large layers, use set_genomic_layout first.
+
+        Parameters
+        ----------
+        chrom: str
+            The chromosome of the region.
+        start: int
+            The first position of the region.
+        end: int
+            The last position of the region (inclusive).
+        cols: str, list
+            One or more columns to be selected from layer. If col='*' all columns will be selected.
+        chrom_col: str
+            The column with the chromosomes.
+        pos_col: str
+            The column with the positions.
+        backend: str
+            The format of the returned data. One of "pandas", "pandas_pyarrow", "arrow", "polars" or "numpy".
+
+        Returns
+        -------
+        A pandas.DataFrame with the rows of the region in the order of the layer, or the corresponding object of the given backend.
+        """
+        condition = self._range_condition(chrom, start, end, chrom_col, pos_col)
+        queryText = f'SELECT rowid,{self._columns_expression(cols)} FROM {self.name} WHERE {condition} ORDER BY rowid'
+        result = self._dbutils._execute_select_query(queryText, backend=backend, table=self.name)
+        return utils._set_rowid_index(result, backend)
+
+    def ranges(self, regions:pd.DataFrame, cols:Union[str,List]='*', chrom_col:str="CHROM", pos_col:str="POS", batch_size:int=200) -> pd.DataFrame:
+        """
+        Select the rows of multiple genomic regions. The regions are queried in batches with one query per batch. For large layers, use set_genomic_layout first.
+
+        Parameters
+        ----------
+        regions: pandas.DataFrame
+            The regions with the columns "chrom", "start" and "end". Start and end positions are inclusive.
+        cols: str, list
+            One or more columns to be selected from layer. If col='*' all columns will be selected.
+        chrom_col: str
+            The column with the chromosomes.
+        pos_col: str
+            The column with the positions.
+        batch_size: int
+            The number of regions in each query.
+
+        Returns
+        -------
+        A pandas.DataFrame with the column "region" that holds the index of the region in the regions DataFrame, followed by the selected columns. Rows that fall in overlapping regions are returned once per region.
+        """
+        missing = [col for col in ["chrom", "start", "end"] if col not in regions.columns]
+        if missing:
+            raise ValueError(f"Regions are missing the column(s): {', '.join(missing)}.")
+        if regions.empty:
+            raise ValueError("No regions were given.")
+        cols = self._columns_expression(cols)
+        results = []
+        for first in range(0, len(regions), batch_size):
+            batch = regions.iloc[first:first+batch_size]
+            queries = []
+            for number,(chrom,start,end) in enumerate(zip(batch["chrom"], batch["start"], batch["end"]), start=first):
+                condition = self._range_condition(chrom, start, end, chrom_col, pos_col)
+                queries.append(f'SELECT {number} AS region, rowid,{cols} FROM {self.name} WHERE {condition}')
+            queryText = f'SELECT * FROM ({" UNION ALL ".join(queries)}) ORDER BY region, rowid'
+            results.append(self._dbutils._execute_select_query(queryText, table=self.name))
+        result = pd.concat(results, ignore_index=True)
+        result["region"] = regions.index[result["region"].to_numpy()]
+        return utils._set_rowid_index(result, "pandas")
+
+    def update(self, col:str, values:Union[pd.Series,np.ndarray,List], rowids:Union[np.ndarray,List,None]=None) -> None:
+        """
+        Update the values of an existing column in layer.
+
+        Parameters
+        ----------
+        col: str
+            Name of column in layer.
+        values: pandas.Series, numpy.ndarray, list
+            The new values of the column.
+        rowids: numpy.ndarray, list, None
+            The rowids of the rows to be updated. If None, values should hold a value for every row of the layer in the order the rows are stored.
+        """
+        self._dbutils._update_column(table=self.name, col=col, data=values, rowids=rowids)
+
+    def assign(self, data:pd.DataFrame, rowids:Union[np.ndarray,List,None]=None) -> None:
+        """
+        Add or update multiple columns of layer at once.
+
+        Parameters
+        ----------
+        data: pandas.DataFrame
+            A pandas.DataFrame object. Columns that exist in layer will be updated and the rest will be added to layer.
+        rowids: numpy.ndarray, list, None
+            The rowids of the rows to be updated. If None, data should hold a row for every row of the layer in the order the rows are stored.
+        """
+        existing_features = self._dbutils._get_table_column_names(self.name)
+        newCols = [col for col in data.columns if col not in existing_features]
+        if newCols and rowids is not None:
+            raise ValueError("New columns cannot be added to a subset of rows.")
+        if newCols:
+            self._dbutils._add_multiple_columns(table=self.name, cols=newCols, data=data[newCols])
+        updatedCols = [col for col in data.columns if col in existing_features]
+        if updatedCols:
+            self._dbutils._update_columns(table=self.name, data=data[updatedCols], where_values=rowids)
 
     def rename(self, col:str, new_name:str) -> None:
         """
@@ -295,20 +748,20 @@ class Layer:
         """
         self._dbutils._rename_column(table=self.name, col=col, new_name=new_name)
 
-    def drop(self, col:Union[str,None]=None, values:Union[None,str,int,float,List]=None) -> None:
+    def drop(self, col:Union[str,List,None]=None, values:Union[None,str,int,float,List]=None) -> None:
         """
         Delete column or rows from layer.
 
         Parameters
         ----------
-        col: str, None
-            Name of column in layer.
+        col: str, list, None
+            Name of column in layer. A list of columns to delete rows by composite keys.
         values: str, int, float, list, None
-            if None, whole column will be deleted. Otherwise, rows that match values in column will be deleted. If column is None, values correspond to rowids.
+            if None, whole column will be deleted. Otherwise, rows that match values in column will be deleted. For a list of columns, a list of tuples or a pandas.DataFrame. If column is None, values correspond to rowids.
         """
 
         if col is None:
-            if not isinstance(values, int) or not isinstance(values, list):
+            if not isinstance(values, int) and not isinstance(values, list):
                 raise ValueError("Pass integer or list of integers when not specifying column.")
             self._dbutils._delete_rows(table=self.name, where_col="rowid", where_values=values)
         else:
@@ -317,7 +770,7 @@ class Layer:
             else:
                 self._dbutils._delete_rows(table=self.name, where_col=col, where_values=values)
 
-    def to_df(self, index:Union[str,None]=None) -> pd.DataFrame:
+    def to_df(self, index:Union[str,None]=None, backend:str="pandas") -> pd.DataFrame:
         """
         Load layer as pandas.DataFrame.
 
@@ -325,10 +778,71 @@ class Layer:
         ----------
         index: str, None
             The column to be used as pandas.DataFrame index.
+        backend: str
+            The format of the returned data. One of "pandas", "pandas_pyarrow", "arrow", "polars" or "numpy". Backends other than pandas keep the rowid as column.
         """
+        if index and backend not in ["pandas", "pandas_pyarrow"]:
+            raise ValueError("An index column can be set only for the pandas backends.")
+        result = self._cached(("to_df",), backend, lambda: self._dbutils._select_cols(table=self.name, cols="*", backend=backend))
         if index:
-            return self._dbutils._select_cols(table=self.name, cols="*").set_index(index)
-        return self._dbutils._select_cols(table=self.name, cols="*")
+            return result.set_index(index)
+        return result
+
+    def to_arrow(self, cols:Union[str,List]="*"):
+        """
+        Load layer as pyarrow.Table. Requires pyarrow.
+
+        Parameters
+        ----------
+        cols: str, list
+            One or more columns to be loaded. If cols='*' all columns will be loaded.
+        """
+        return self._dbutils._select_cols(table=self.name, cols=cols, backend="arrow")
+
+    def to_polars(self, cols:Union[str,List]="*"):
+        """
+        Load layer as polars.DataFrame. Requires polars and pyarrow.
+
+        Parameters
+        ----------
+        cols: str, list
+            One or more columns to be loaded. If cols='*' all columns will be loaded.
+        """
+        return self._dbutils._select_cols(table=self.name, cols=cols, backend="polars")
+
+    def to_parquet(self, filename:str, cols:Union[str,List]="*", row_group_size:Union[int,None]=None, compression:str="zstd") -> None:
+        """
+        Write layer to a Parquet file. The layer is streamed to the file without being loaded in memory.
+
+        Parameters
+        ----------
+        filename: str
+            The output Parquet file.
+        cols: str, list
+            One or more columns to be written. If cols='*' all columns will be written.
+        row_group_size: int, None
+            The number of rows in each row group. If None, the default of the engine is used.
+        compression: str
+            One of "zstd", "snappy", "gzip", "lz4" or "uncompressed".
+        """
+        names = [cols] if isinstance(cols, str) and cols != "*" else cols
+        cols = self._columns_expression(cols)
+        if hasattr(self._dbutils, "_export_to_parquet"):
+            self._dbutils._export_to_parquet(table=self.name, cols=cols, filename=filename, row_group_size=row_group_size, compression=compression)
+            return
+
+        utils._import_optional("pyarrow")
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        declaredTypes = self._dbutils._get_table_column_types(self.name)
+        if names != "*":
+            declaredTypes = {name:declaredTypes[name] for name in names}
+        # The schema is taken from the declared types, since a column may have only nulls in the first batch.
+        schema = utils._arrow_schema(declaredTypes, self._dbutils._declared_types)
+        batchSize = row_group_size if row_group_size is not None else 100000
+        with pq.ParquetWriter(filename, schema, compression=compression) as writer:
+            for batch in self._dbutils._iter_batches(f"SELECT {cols} FROM {self.name}", batch_size=batchSize, backend="arrow", table=self.name):
+                writer.write_table(pa.Table.from_batches([batch]).cast(schema), row_group_size=row_group_size)
 
     def to_json(self, key_col:str, value_col:str) -> dict:
         """
@@ -351,14 +865,12 @@ class Layer:
     def __getitem__(self, features:Union[str,int,List,slice]) -> pd.DataFrame:
         if isinstance(features, slice) or isinstance(features, int):
             columns = self._dbutils._get_table_column_names(self.name)
-            df = self._dbutils._select_cols(table=self.name, cols=columns[features])
+            df = self._dbutils._select_cols(table=self.name, cols=columns[features], backend=self.backend)
         elif isinstance(features, str):
-            df = self._dbutils._select_cols(table=self.name, cols=[features])
+            df = self._dbutils._select_cols(table=self.name, cols=[features], backend=self.backend)
         elif isinstance(features, list):
-            df = self._dbutils._select_cols(table=self.name, cols=features)
-        if df.shape[1] == 1:
-            df = df.iloc[:,0].values
-        return df
+            df = self._dbutils._select_cols(table=self.name, cols=features, backend=self.backend)
+        return utils._squeeze(df, self.backend)
 
     def __setitem__(self, feature:str, data:Union[pd.Series,np.ndarray,List]):
         existing_features = self._dbutils._get_table_column_names(self.name)
@@ -0,0 +1,188 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Union
+import pandas as pd
+from omilayers import utils
+
+# Backends whose results can be written to the disk tier as Arrow IPC files.
+DISK_BACKENDS = ["pandas", "pandas_pyarrow", "arrow"]
+
+# Copy-on-write is always enabled since pandas 3, so that shallow copies of cached results are safe to return.
+COPY_ON_WRITE = int(pd.__version__.split(".")[0]) >= 3
+
+
+class ResultCache:
+    """
+    Opt-in cache of the results of Layer.query, Layer.select and Layer.to_df.
+
+    Results are keyed by the layer, the normalized query and its parameters, and the version of the layer, which every write path of the engines increases. Results of unchanged layers are returned from memory, where the least recently used results are evicted once max_bytes is exceeded. If disk_dir is given, results are also written as Arrow IPC files that outlive the process and are valid as long as the database files are not modified.
+
+    Parameters
+    ----------
+    max_bytes: int
+        The memory budget of the cached results in bytes.
+    disk_dir: str, None
+        Directory for the on-disk tier. If None, results are cached only in memory. Requires pyarrow.
+    max_disk_bytes: int
+        The budget of the on-disk tier in bytes. The least recently used files are deleted once it is exceeded.
+    """
+
+    def __init__(self, max_bytes:int=256*1024**2, disk_dir:Union[str,None]=None, max_disk_bytes:int=1024**3) -> None:
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir is not None else None
+        self.max_disk_bytes = max_disk_bytes
+        if self.disk_dir is not None:
+            utils._import_optional("pyarrow")
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._stats = {"hits":0, "disk_hits":0, "misses":0}
+
+    @property
+    def stats(self) -> dict:
+        """Get the number of memory hits, disk hits and misses, and the number and size of the results in memory."""
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), nbytes=self._nbytes)
+
+    def clear(self) -> None:
+        """Drop all cached results from memory and disk."""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+            if self.disk_dir is not None:
+                for filename in self.disk_dir.glob("*.arrow"):
+                    filename.unlink(missing_ok=True)
+
+    def _get_or_load(self, layer:str, dbutilsClass, key:tuple, backend:str, load:Callable):
+        """
+        Get cached result or load it and cache it.
+
+        Parameters
+        ----------
+        layer: str
+            The name of the layer that is read.
+        dbutilsClass: DButils
+            The engine of the database that holds the versions of the layers.
+        key: tuple
+            The kind of the read, the normalized query and its parameters.
+        backend: str
+            The backend of the result.
+        load: callable
+            Function without arguments that reads the result from the database.
+        """
+        version = dbutilsClass._catalog.version(layer)
+        memoryKey = _digest((layer, version, backend, key))
+        with self._lock:
+            if memoryKey in self._entries:
+                self._entries.move_to_end(memoryKey)
+                self._stats["hits"] += 1
+                return _share(self._entries[memoryKey][0])
+
+        diskFile = None
+        if self.disk_dir is not None and backend in DISK_BACKENDS:
+            diskFile = self.disk_dir / f"{_digest((layer, _fingerprint(dbutilsClass.db), backend, key))}.arrow"
+            result = self._read_disk(diskFile, backend)
+            if result is not None:
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+                self._put(memoryKey, result)
+                return _share(result)
+
+        result = load()
+        with self._lock:
+            self._stats["misses"] += 1
+        # The result is cached only if the layer was not written while it was loaded.
+        if dbutilsClass._catalog.version(layer) == version:
+            self._put(memoryKey, result)
+            if diskFile is not None:
+                self._write_disk(diskFile, result)
+        return _share(result)
+
+    def _put(self, key:str, result) -> None:
+        """Add result to memory and evict the least recently used results."""
+        nbytes = _nbytes(result)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (result, nbytes)
+            self._nbytes += nbytes
+            while self._nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._nbytes -= evicted
+
+    def _read_disk(self, filename:Path, backend:str):
+        """Read result from the disk tier. None if the file does not exist."""
+        import pyarrow as pa
+        try:
+            with pa.memory_map(str(filename)) as source:
+                table = pa.ipc.open_file(source).read_all()
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+        os.utime(filename)
+        if backend == "arrow":
+            return table
+        if backend == "pandas_pyarrow":
+            return table.to_pandas(types_mapper=pd.ArrowDtype)
+        return table.to_pandas()
+
+    def _write_disk(self, filename:Path, result) -> None:
+        """Write result to the disk tier and delete the least recently used files over the budget."""
+        import pyarrow as pa
+        table = result if isinstance(result, pa.Table) else pa.Table.from_pandas(result)
+        tmpFile = filename.with_suffix(".tmp")
+        with pa.OSFile(str(tmpFile), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmpFile, filename)
+        files = sorted(self.disk_dir.glob("*.arrow"), key=lambda name: name.stat().st_mtime)
+        total = sum(name.stat().st_size for name in files)
+        for name in files:
+            if total <= self.max_disk_bytes:
+                break
+            total -= name.stat().st_size
+            name.unlink(missing_ok=True)
+
+
+def _digest(key:tuple) -> str:
+    """Stable hash of a cache key. Pickling keeps all values of arrays and lists in the key."""
+    return hashlib.sha256(pickle.dumps(key)).hexdigest()
+
+def _normalize_query(query:str) -> str:
+    """Query with whitespace collapsed, so that reformatted queries share results."""
+    return " ".join(query.split())
+
+def _fingerprint(db:str) -> tuple:
+    """Modification time and size of the database file and its write-ahead log, which change on every write."""
+    stats = []
+    for filename in [db, db + ".wal", db + "-wal"]:
+        if os.path.exists(filename):
+            stat = os.stat(filename)
+            stats.append((filename, stat.st_mtime_ns, stat.st_size))
+    return tuple(stats)
+
+def _nbytes(result) -> int:
+    """Size of a result in memory."""
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return int(result.memory_usage(deep=True).sum()) if isinstance(result, pd.DataFrame) else int(result.memory_usage(deep=True))
+    if isinstance(result, dict):
+        return sum(values.nbytes for values in result.values())
+    if hasattr(result, "nbytes"):
+        return int(result.nbytes)
+    if hasattr(result, "estimated_size"):
+        return int(result.estimated_size())
+    return 0
+
+def _share(result):
+    """Result that can be returned to the caller without exposing the cached object to modifications."""
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return result.copy(deep=not COPY_ON_WRITE)
+    if isinstance(result, dict):
+        return {col:values.copy() for col,values in result.items()}
+    return result
@@ -0,0 +1,155 @@
+import shutil
+from pathlib import Path
+from typing import List, Union
+import pandas as pd
+import numpy as np
+
+# Number of rows written at a time when a dense layer is created.
+WRITE_CHUNK_ROWS = 10000
+
+
+def arrays_path(db:str, layer:Union[str,None]=None) -> Path:
+    """Directory next to the database file that holds the arrays of the dense layers, or of a given dense layer."""
+    db = Path(db)
+    path = db.with_name(db.name + ".arrays")
+    if layer is None:
+        return path
+    return path / layer
+
+
+class DenseLayer:
+    """
+    Layer that stores a purely numeric matrix as memory-mapped .npy files next to the database file.
+
+    The values are kept in "{db}.arrays/{layer}/values.npy" in row-major order and the row and column labels in "index.npy" and "columns.npy". The name, tag, info and shape of the layer are stored in tables_info like any other layer. Reading the layer maps the files in memory, so that the values are read from the page cache without a query and without copies.
+    """
+
+    def __init__(self, name:str, dbutilsClass, path:Path) -> None:
+        self._dbutils = dbutilsClass
+        self.name = name
+        self._path = Path(path)
+
+    @classmethod
+    def _create(cls, name:str, dbutilsClass, path:Path, data:pd.DataFrame, dtype:Union[str,None]=None):
+        """
+        Write the arrays of a dense layer and register the layer.
+
+        Parameters
+        ----------
+        name: str
+            The name of the layer.
+        dbutilsClass: DButils
+            The engine of the database.
+        path: Path
+            The directory of the arrays of the layer.
+        data: pandas.DataFrame
+            The values with the row labels as index and the column labels as columns.
+        dtype: str, None
+            The dtype of the stored values. If None, the common dtype of the columns is used.
+        """
+        nonNumeric = [str(col) for col,colDtype in data.dtypes.items() if not pd.api.types.is_numeric_dtype(colDtype)]
+        if nonNumeric:
+            raise ValueError(f"Dense layers store numeric values only. Non-numeric columns: {', '.join(nonNumeric[:5])}.")
+        dtype = np.dtype(dtype) if dtype is not None else data.iloc[:0].to_numpy().dtype
+        if not (np.issubdtype(dtype, np.number) or np.issubdtype(dtype, np.bool_)):
+            raise ValueError(f"Dense layers store numeric values only, got dtype '{dtype}'.")
+        path = Path(path)
+        tmpPath = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmpPath, ignore_errors=True)
+        tmpPath.mkdir(parents=True)
+        values = np.lib.format.open_memmap(tmpPath / "values.npy", mode="w+", dtype=dtype, shape=data.shape)
+        for start in range(0, data.shape[0], WRITE_CHUNK_ROWS):
+            values[start:start+WRITE_CHUNK_ROWS] = data.iloc[start:start+WRITE_CHUNK_ROWS].to_numpy(dtype=dtype)
+        values.flush()
+        del values
+        np.save(tmpPath / "index.npy", _labels_array(data.index), allow_pickle=False)
+        np.save(tmpPath / "columns.npy", _labels_array(data.columns), allow_pickle=False)
+        shutil.rmtree(path, ignore_errors=True)
+        tmpPath.rename(path)
+        dbutilsClass._register_layer(table=name, shape=data.shape)
+        return cls(name, dbutilsClass, path)
+
+    @staticmethod
+    def _is_dense(path:Path) -> bool:
+        """Check whether the arrays of a dense layer exist in the given directory."""
+        return (Path(path) / "values.npy").exists()
+
+    @property
+    def exists(self) -> bool:
+        """Check layer exists."""
+        return self._dbutils._table_exists(self.name) and self._is_dense(self._path)
+
+    @property
+    def info(self) -> Union[str,List]:
+        """Get the description of the layer."""
+        return self._dbutils._get_from_tables_info(table=self.name, col="info")
+
+    @property
+    def tag(self) -> Union[str,List]:
+        """Get the assigned tag of the layer."""
+        return self._dbutils._get_from_tables_info(table=self.name, col="tag")
+
+    def set_info(self, value:str) -> None:
+        """Change the description of the layer."""
+        self._dbutils._update_tables_info(table=self.name, col="info", value=value)
+
+    def set_tag(self, value:str) -> None:
+        """Change the assigned tag of the layer."""
+        self._dbutils._update_tables_info(table=self.name, col="tag", value=value)
+
+    @property
+    def index(self) -> pd.Index:
+        """Get the row labels."""
+        return pd.Index(np.load(self._path / "index.npy", allow_pickle=False))
+
+    @property
+    def columns(self) -> List:
+        """Get the column labels."""
+        return np.load(self._path / "columns.npy", allow_pickle=False).tolist()
+
+    @property
+    def shape(self) -> tuple:
+        """Get the number of rows and columns."""
+        return self.to_numpy().shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Get the dtype of the values."""
+        return self.to_numpy().dtype
+
+    def to_numpy(self) -> np.ndarray:
+        """Get the values as read-only memory-mapped numpy.ndarray of shape (rows, columns)."""
+        return np.load(self._path / "values.npy", mmap_mode="r", allow_pickle=False)
+
+    def to_df(self) -> pd.DataFrame:
+        """Get the layer as pandas.DataFrame that is a view of the memory-mapped values."""
+        return pd.DataFrame(self.to_numpy(), index=self.index, columns=self.columns, copy=False)
+
+    def __getitem__(self, features:Union[str,int,List,slice]) -> Union[pd.DataFrame,pd.Series]:
+        values = self.to_numpy()
+        columns = pd.Index(self.columns)
+        if isinstance(features, str):
+            position = columns.get_loc(features)
+            return pd.Series(values[:, position], index=self.index, name=features, copy=False)
+        if isinstance(features, int):
+            return pd.Series(values[:, features], index=self.index, name=columns[features], copy=False)
+        if isinstance(features, slice):
+            # Slices of the columns are views of the memory-mapped values.
+            return pd.DataFrame(values[:, features], index=self.index, columns=columns[features], copy=False)
+        positions = columns.get_indexer(features)
+        if (positions == -1).any():
+            missing = [feature for feature,position in zip(features, positions) if position == -1]
+            raise ValueError(f"Columns do not exist in layer '{self.name}': {', '.join(map(str, missing))}.")
+        return pd.DataFrame(values[:, positions], index=self.index, columns=columns[positions])
+
+    def __repr__(self) -> str:
+        Nrows, Ncols = self.shape
+        return f"Dense layer '{self.name}' with {Nrows} rows, {Ncols} columns and dtype {self.dtype}."
+
+
+def _labels_array(labels:pd.Index) -> np.ndarray:
+    """Labels as numpy array that can be saved without pickling."""
+    array = np.asarray(labels)
+    if array.dtype.kind in "biuf":
+        return array
+    return array.astype(str)
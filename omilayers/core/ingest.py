@@ -0,0 +1,94 @@
+import bz2
+import collections
+import gzip
+import io
+import itertools
+import lzma
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import pandas as pd
+
+# Number of rows parsed by a worker at a time if no chunksize is given.
+DEFAULT_CHUNKSIZE = 100000
+
+# Number of chunks that are parsed ahead of the writer by each worker.
+CHUNKS_AHEAD = 2
+
+# Keywords of pandas.read_csv that depend on the position in the file and cannot be applied to each chunk.
+UNSUPPORTED_KEYWORDS = ["skiprows", "nrows", "skipfooter", "chunksize", "iterator"]
+
+# Start method of the worker processes. Workers are not forked from the calling process, which may hold the threads of the engine and an open transaction.
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+OPENERS = {"gzip":gzip.open, "bz2":bz2.open, "xz":lzma.open}
+SUFFIXES = {".gz":"gzip", ".bz2":"bz2", ".xz":"xz"}
+
+
+def _open_text(filename:str, compression, encoding:str):
+    """Open a plain or compressed text file."""
+    if compression == "infer":
+        compression = SUFFIXES.get(Path(filename).suffix)
+    if compression is None:
+        return open(filename, "rt", encoding=encoding, newline="")
+    if compression not in OPENERS:
+        raise ValueError(f"Compression is not in supported compressions: {list(OPENERS.keys())}")
+    return OPENERS[compression](filename, "rt", encoding=encoding, newline="")
+
+def _parse_block(header:str, block:str, kwargs:dict) -> pd.DataFrame:
+    """Parse the lines of a chunk with the header of the file."""
+    return pd.read_csv(io.StringIO(header + block), **kwargs)
+
+def iter_csv_parallel(filename:str, chunksize:int, workers:int, kwargs:dict):
+    """
+    Read a csv file in chunks that are parsed in parallel by worker processes.
+
+    The lines of the file are read and split in chunks by the calling process, the chunks are parsed to typed pandas.DataFrames by the workers, and the parsed chunks are yielded in the order of the file. While a chunk is consumed, e.g. written to the database, the next chunks are parsed. Fields with quoted line breaks are not supported, since chunks are split at line breaks.
+
+    Parameters
+    ----------
+    filename: str
+        Plain or compressed (".gz", ".bz2", ".xz") csv file.
+    chunksize: int
+        The number of rows of each chunk.
+    workers: int
+        The number of worker processes.
+    kwargs: dict
+        Keywords of pandas.read_csv.
+    """
+    if workers < 1:
+        raise ValueError("The number of workers should be positive.")
+    unsupported = [key for key in UNSUPPORTED_KEYWORDS if key in kwargs]
+    if unsupported:
+        raise ValueError(f"Keywords are not supported when the csv file is parsed by workers: {', '.join(unsupported)}.")
+    kwargs = dict(kwargs)
+    header = kwargs.get("header", "infer")
+    if header not in ["infer", 0, None]:
+        raise ValueError("Only the first line can be the header when the csv file is parsed by workers.")
+    compression = kwargs.pop("compression", "infer")
+    encoding = kwargs.pop("encoding", None) or "utf-8"
+    hasHeader = header == 0 or (header == "infer" and "names" not in kwargs)
+
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(START_METHOD))
+    try:
+        with _open_text(filename, compression, encoding) as infile:
+            headerLine = next(infile, "") if hasHeader else ""
+            pending = collections.deque()
+
+            def submit() -> bool:
+                lines = list(itertools.islice(infile, chunksize))
+                if not lines:
+                    return False
+                pending.append(executor.submit(_parse_block, headerLine, "".join(lines), kwargs))
+                return True
+
+            more = True
+            while more and len(pending) < CHUNKS_AHEAD * workers:
+                more = submit()
+            while pending:
+                data = pending.popleft().result()
+                if more:
+                    more = submit()
+                yield data
+    finally:
+        executor.shutdown(cancel_futures=True)
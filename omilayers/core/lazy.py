@@ -0,0 +1,124 @@
+from typing import List, Union
+from omilayers import utils
+from omilayers.core.cache import _normalize_query
+
+
+class LazyQuery:
+    """
+    Lazy query of a layer. Filters, column selections, sorting and limits are collected without reading the layer and are compiled to a single query when collect() is called, so that only the selected columns and the matched rows are fetched.
+
+    Each method returns a new LazyQuery, so that partial queries can be reused.
+
+    Examples
+    --------
+    layer.lazy().filter("DP > ?", params=[10]).select(["ID", "SA010"]).sort("POS").head(100).collect()
+    """
+
+    def __init__(self, layer, conditions:Union[List,None]=None, params:Union[List,dict,None]=None, cols:Union[str,List]="*", order:Union[List,None]=None, limit:Union[int,None]=None) -> None:
+        self._layer = layer
+        self._conditions = conditions if conditions is not None else []
+        self._params = params
+        self._cols = cols
+        self._order = order if order is not None else []
+        self._limit = limit
+
+    def _replace(self, **changes):
+        state = {"conditions":self._conditions, "params":self._params, "cols":self._cols, "order":self._order, "limit":self._limit}
+        state.update(changes)
+        return LazyQuery(self._layer, **state)
+
+    def filter(self, condition:str, params:Union[List,dict,None]=None):
+        """
+        Keep the rows that match a condition. Conditions of successive calls are combined with AND.
+
+        Parameters
+        ----------
+        condition: str
+            SQL condition on the columns of the layer, e.g. "CHROM = 'chr1' AND DP > 10". Column names with spaces or special characters are enclosed in backticks.
+        params: list, dict, None
+            Values bound to the placeholders of the condition.
+        """
+        if self._limit is not None:
+            raise ValueError("Apply filter before head.")
+        return self._replace(conditions=self._conditions + [condition.replace('`', '"')], params=_combine_params(self._params, params))
+
+    def select(self, cols:Union[str,List]):
+        """
+        Keep only the given columns.
+
+        Parameters
+        ----------
+        cols: str, list
+            One or more columns of the layer.
+        """
+        return self._replace(cols=cols)
+
+    def sort(self, by:Union[str,List], descending:bool=False):
+        """
+        Sort the rows by one or more columns. Columns of successive calls are used to break ties.
+
+        Parameters
+        ----------
+        by: str, list
+            One or more columns of the layer.
+        descending: bool
+            If True, the rows are sorted in descending order.
+        """
+        if self._limit is not None:
+            raise ValueError("Apply sort before head.")
+        by = [by] if isinstance(by, str) else list(by)
+        direction = "DESC" if descending else "ASC"
+        return self._replace(order=self._order + [f"{col} {direction}" for col in utils._sanitize_column_names(by)])
+
+    def head(self, n:int=5):
+        """Keep the first n rows."""
+        return self._replace(limit=n if self._limit is None else min(n, self._limit))
+
+    @property
+    def sql(self) -> str:
+        """The query that is executed by collect()."""
+        query = f"SELECT rowid,{self._layer._columns_expression(self._cols)} FROM {self._layer.name}"
+        if self._conditions:
+            query += " WHERE " + " AND ".join(f"({condition})" for condition in self._conditions)
+        if self._order:
+            query += " ORDER BY " + ", ".join(self._order)
+        if self._limit is not None:
+            query += f" LIMIT {int(self._limit)}"
+        return query
+
+    def collect(self, backend:str="pandas"):
+        """
+        Execute the query.
+
+        Parameters
+        ----------
+        backend: str
+            The format of the returned data. One of "pandas", "pandas_pyarrow", "arrow", "polars" or "numpy".
+
+        Returns
+        -------
+        A pandas.DataFrame with the selected columns and the matched rows indexed by rowid, or the corresponding object of the given backend.
+        """
+        query = self.sql
+        layer = self._layer
+        result = layer._cached(("query", _normalize_query(query), self._params), backend, lambda: layer._dbutils._execute_select_query(query, backend=backend, params=self._params, table=layer.name))
+        return utils._set_rowid_index(result, backend)
+
+    def __getitem__(self, cols:Union[str,List]):
+        return self.select(cols)
+
+    def __repr__(self) -> str:
+        return f"LazyQuery({self.sql})"
+
+
+def _combine_params(params:Union[List,dict,None], new:Union[List,dict,None]) -> Union[List,dict,None]:
+    """Combine the parameters of two conditions."""
+    if params is None:
+        return new
+    if new is None:
+        return params
+    if isinstance(params, dict) and isinstance(new, dict):
+        return {**params, **new}
+    if isinstance(params, dict) or isinstance(new, dict):
+        raise ValueError("Positional and named parameters can not be combined.")
+    return list(params) + list(new)
@@ -0,0 +1,245 @@
+from typing import List, Dict, Union
+from omilayers import utils
+import pandas as pd
+import numpy as np
+
+# Suffixes of the dictionary tables that hold the names of the samples and the features of a matrix layer.
+SAMPLES_SUFFIX = "__samples"
+FEATURES_SUFFIX = "__features"
+
+
+class MatrixLayer:
+    """
+    Layer that stores a samples x features matrix in long (COO) format.
+
+    The layer table holds one row (sample_id, feature_id, value) per non-zero value. The names of the samples and the features are stored once in two dictionary tables, "{layer}__samples" and "{layer}__features", where the id of each name is its position. Adding samples or features appends rows instead of altering the layer table.
+    """
+
+    def __init__(self, name:str, dbutilsClass) -> None:
+        self._dbutils = dbutilsClass
+        self.name = name
+        self._samples = name + SAMPLES_SUFFIX
+        self._features = name + FEATURES_SUFFIX
+
+    @classmethod
+    def _create(cls, name:str, dbutilsClass, dtype:str="float64"):
+        """
+        Create the tables of an empty matrix layer.
+
+        Parameters
+        ----------
+        name: str
+            The name of the layer.
+        dbutilsClass: DButils
+            The engine of the database.
+        dtype: str
+            The dtype of the values, e.g. "float32" or "int32".
+        """
+        entries = pd.DataFrame({
+            "sample_id": np.array([], dtype="int32"),
+            "feature_id": np.array([], dtype="int32"),
+            "value": np.array([], dtype=dtype),
+            })
+        names = pd.DataFrame({"id": np.array([], dtype="int32"), "name": pd.Series([], dtype=str)})
+        with dbutilsClass._transaction():
+            dbutilsClass._create_table_from_pandas(table=name, data=entries)
+            dbutilsClass._create_internal_table(table=name + SAMPLES_SUFFIX, data=names)
+            dbutilsClass._create_internal_table(table=name + FEATURES_SUFFIX, data=names)
+        dbutilsClass._create_index(table=name, cols=["sample_id"])
+        dbutilsClass._create_index(table=name, cols=["feature_id"])
+        return cls(name, dbutilsClass)
+
+    @staticmethod
+    def _is_matrix(name:str, dbutilsClass) -> bool:
+        """Check whether a layer is stored as a matrix layer."""
+        tables = dbutilsClass._get_all_tables_names()
+        return name + SAMPLES_SUFFIX in tables and name + FEATURES_SUFFIX in tables
+
+    @property
+    def exists(self) -> bool:
+        """Check layer exists."""
+        return self._dbutils._table_exists(self.name)
+
+    @property
+    def info(self) -> Union[str,List]:
+        """Get the description of the layer."""
+        return self._dbutils._get_from_tables_info(table=self.name, col="info")
+
+    @property
+    def tag(self) -> Union[str,List]:
+        """Get the assigned tag of the layer."""
+        return self._dbutils._get_from_tables_info(table=self.name, col="tag")
+
+    def set_info(self, value:str) -> None:
+        """Change the description of the layer."""
+        self._dbutils._update_tables_info(table=self.name, col="info", value=value)
+
+    def set_tag(self, value:str) -> None:
+        """Change the assigned tag of the layer."""
+        self._dbutils._update_tables_info(table=self.name, col="tag", value=value)
+
+    def _names(self, table:str) -> pd.Series:
+        """Names of a dictionary table ordered by their ids."""
+        df = self._dbutils._execute_select_query(f"SELECT name FROM {table} ORDER BY id")
+        return df["name"]
+
+    @property
+    def samples(self) -> List:
+        """Get the names of the samples in the order they were added."""
+        return self._names(self._samples).tolist()
+
+    @property
+    def features(self) -> List:
+        """Get the names of the features in the order they were added."""
+        return self._names(self._features).tolist()
+
+    @property
+    def nnz(self) -> int:
+        """Get the number of stored (non-zero) values."""
+        df = self._dbutils._execute_select_query(f"SELECT count(*) AS nnz FROM {self.name}")
+        return int(df["nnz"].iloc[0])
+
+    @property
+    def shape(self) -> tuple:
+        """Get the number of samples and features."""
+        return len(self.samples), len(self.features)
+
+    def add_samples(self, data:pd.DataFrame) -> None:
+        """
+        Append samples to the matrix. Features that are not yet in the matrix are added, and zeros are not stored.
+
+        Parameters
+        ----------
+        data: pandas.DataFrame
+            The values with the samples as index and the features as columns. Use data.T if the samples are the columns.
+        """
+        samples = self._names(self._samples)
+        newSamples = pd.Index(data.index.astype(str))
+        if newSamples.has_duplicates:
+            raise ValueError("Sample names should be unique.")
+        existing = newSamples.intersection(samples)
+        if len(existing) > 0:
+            raise ValueError(f"Samples already exist in matrix layer '{self.name}': {', '.join(existing[:5])}.")
+        features = self._names(self._features)
+        dataFeatures = pd.Index(data.columns.astype(str))
+        if dataFeatures.has_duplicates:
+            raise ValueError("Feature names should be unique.")
+        newFeatures = dataFeatures.difference(features, sort=False)
+        featureIds = pd.Series(np.arange(len(features)), index=features.values)
+        featureIds = pd.concat([featureIds, pd.Series(np.arange(len(features), len(features) + len(newFeatures)), index=newFeatures)])
+
+        values = data.to_numpy()
+        rows, cols = np.nonzero(values != 0)
+        entries = pd.DataFrame({
+            "sample_id": (rows + len(samples)).astype("int32"),
+            "feature_id": featureIds.loc[dataFeatures].to_numpy()[cols].astype("int32"),
+            "value": values[rows, cols].astype(self._value_dtype()),
+            })
+        with self._dbutils._transaction():
+            if len(newFeatures) > 0:
+                self._dbutils._insert_rows(table=self._features, data=pd.DataFrame({"id": np.arange(len(features), len(features) + len(newFeatures), dtype="int32"), "name": newFeatures}), ordered=True)
+            self._dbutils._insert_rows(table=self._samples, data=pd.DataFrame({"id": np.arange(len(samples), len(samples) + len(newSamples), dtype="int32"), "name": newSamples}), ordered=True)
+            if not entries.empty:
+                self._dbutils._insert_rows(table=self.name, data=entries, ordered=True)
+
+    def add_sample(self, name:str, values:Union[pd.Series,Dict]) -> None:
+        """
+        Append a sample to the matrix.
+
+        Parameters
+        ----------
+        name: str
+            The name of the sample.
+        values: pandas.Series, dict
+            The values of the sample by feature name.
+        """
+        self.add_samples(pd.DataFrame([pd.Series(values)], index=[name]))
+
+    def _value_dtype(self) -> str:
+        """The dtype of the stored values, from the declared type of the value column. SQLite does not restore the dtype of REAL and INTEGER columns on read."""
+        declaredType = self._dbutils._get_table_column_types(self.name)["value"].upper()
+        dtypes = {sqlType:dtype for dtype,sqlType in self._dbutils._declared_types.items()}
+        return dtypes.get(declaredType, "float64")
+
+    def _get_vector(self, by:str, name:str, dense:bool) -> pd.Series:
+        """Get the values of a sample (by="sample") or a feature (by="feature")."""
+        other = "feature" if by == "sample" else "sample"
+        byTable = self._samples if by == "sample" else self._features
+        otherTable = self._features if by == "sample" else self._samples
+        found = self._dbutils._execute_select_query(f"SELECT id FROM {byTable} WHERE name = ?", params=[name])
+        if found.empty:
+            raise ValueError(f"{by.capitalize()} '{name}' does not exist in matrix layer '{self.name}'.")
+        query = f"""
+        SELECT o.name AS name, m.value AS value
+        FROM {self.name} AS m
+        JOIN {otherTable} AS o ON o.id = m.{other}_id
+        WHERE m.{by}_id = ?
+        ORDER BY o.id
+        """
+        df = self._dbutils._execute_select_query(query, params=[int(found["id"].iloc[0])], table=self.name)
+        values = pd.Series(df["value"].to_numpy(dtype=self._value_dtype()), index=df["name"].values, name=name)
+        if dense:
+            values = values.reindex(self._names(otherTable).values, fill_value=0)
+        return values
+
+    def get_sample(self, name:str, dense:bool=True) -> pd.Series:
+        """
+        Get the values of a sample.
+
+        Parameters
+        ----------
+        name: str
+            The name of the sample.
+        dense: bool
+            If True, the values of all features are returned with zeros included. If False, only the stored (non-zero) values are returned.
+
+        Returns
+        -------
+        pandas.Series with the feature names as index.
+        """
+        return self._get_vector("sample", name, dense)
+
+    def get_feature(self, name:str, dense:bool=True) -> pd.Series:
+        """
+        Get the values of a feature.
+
+        Parameters
+        ----------
+        name: str
+            The name of the feature.
+        dense: bool
+            If True, the values of all samples are returned with zeros included. If False, only the stored (non-zero) values are returned.
+
+        Returns
+        -------
+        pandas.Series with the sample names as index.
+        """
+        return self._get_vector("feature", name, dense)
+
+    def _coo(self) -> tuple:
+        """Row ids, column ids and values of the stored entries."""
+        df = self._dbutils._execute_select_query(f"SELECT sample_id, feature_id, value FROM {self.name}", table=self.name)
+        return df["sample_id"].to_numpy(), df["feature_id"].to_numpy(), df["value"].to_numpy(dtype=self._value_dtype())
+
+    def to_dense(self) -> pd.DataFrame:
+        """Get the matrix as pandas.DataFrame with the samples as index and the features as columns."""
+        samples, features = self.samples, self.features
+        rows, cols, values = self._coo()
+        dense = np.zeros((len(samples), len(features)), dtype=self._value_dtype())
+        dense[rows, cols] = values
+        return pd.DataFrame(dense, index=samples, columns=features)
+
+    def to_scipy_sparse(self):
+        """
+        Get the matrix as scipy.sparse.csr_matrix. Rows follow the order of Matrix.samples and columns the order of Matrix.features.
+
+        Requires scipy.
+        """
+        utils._import_optional("scipy")
+        from scipy import sparse
+        rows, cols, values = self._coo()
+        return sparse.csr_matrix((values, (rows, cols)), shape=self.shape)
+
+    def __repr__(self) -> str:
+        Nsamples, Nfeatures = self.shape
+        return f"Matrix layer '{self.name}' with {Nsamples} samples, {Nfeatures} features and {self.nnz} stored values."
@@ -0,0 +1,77 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List
+
+
+class WorkerPool:
+    """
+    Persistent pool of threads that read from the session of an engine.
+
+    The threads share the engine, so the database is opened once and the metadata of the layers are read once. Each thread runs its queries on its own cursor (DuckDB) or pooled connection (SQLite), and both engines release the GIL while a query runs. Results are returned in the memory of the calling process without being pickled.
+    """
+
+    def __init__(self, dbutilsClass) -> None:
+        self._dbutils = dbutilsClass
+        self._lock = threading.Lock()
+        self._executor = None
+        self._workers = 0
+        # Number of running calls of map and whether the session was opened by them.
+        self._running = 0
+        self._owns_session = False
+
+    def map(self, func:Callable, items:Iterable, workers:int) -> List:
+        """
+        Apply a function to each item on the threads of the pool.
+
+        Parameters
+        ----------
+        func: callable
+            Function with one argument.
+        items: iterable
+            The arguments of the function.
+        workers: int
+            The number of threads. The pool is recreated if it has a different number of threads.
+
+        Returns
+        -------
+        List with the results in the order of the items.
+        """
+        if workers < 1:
+            raise ValueError("The number of workers should be positive.")
+        with self._lock:
+            if self._running == 0 and self._dbutils._session is None:
+                # Threads share the connection of a session instead of opening the database each. A session opened here is closed when the last running map returns, so that the database is not kept open (and locked) by a non-persistent engine.
+                self._dbutils._open_session()
+                self._owns_session = True
+            if self._executor is None or self._workers != workers:
+                if self._executor is not None:
+                    self._executor.shutdown()
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="omilayers")
+                self._workers = workers
+            executor = self._executor
+            self._running += 1
+        try:
+            return list(executor.map(func, items))
+        finally:
+            with self._lock:
+                self._running -= 1
+                if self._running == 0 and self._owns_session:
+                    self._dbutils._close_session()
+                    self._owns_session = False
+
+    def close(self) -> None:
+        """Wait for the running tasks and stop the threads."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+                self._workers = 0
+
+
+def _get_pool(dbutilsClass) -> WorkerPool:
+    """Get the pool of threads of an engine, which is created on first use."""
+    pool = getattr(dbutilsClass, "_worker_pool", None)
+    if pool is None:
+        pool = WorkerPool(dbutilsClass)
+        dbutilsClass._worker_pool = pool
+    return pool
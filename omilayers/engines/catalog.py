@@ -0,0 +1,106 @@
+import threading
+from typing import Callable, Union
+
+
+class Catalog:
+    """
+    In-process cache of layer metadata: layer names, tags, info, column names/types and shapes.
+
+    Entries are loaded from the database on first access and are dropped by the write paths of the engines. Changes made to the database by other processes are seen after Stack.refresh().
+
+    The catalog also keeps a version for each layer that is increased whenever the layer is written, so that cached query results can be checked for staleness.
+    """
+
+    # Entries that hold information for all layers.
+    GLOBAL_KEYS = ("tables", "views", "shapes", "alltables")
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._generation = 0
+        # Versions of the layers. The epoch is increased when all layers may have changed.
+        self._versions = {}
+        self._epoch = 0
+
+    def get(self, key:tuple, load:Callable):
+        """
+        Get cached entry or load it from the database.
+
+        Parameters
+        ----------
+        key: tuple
+            The key of the entry. The first item is the kind of the entry and the second item, if any, is the name of the layer.
+        load: callable
+            Function without arguments that fetches the entry from the database.
+        """
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key]
+            generation = self._generation
+        value = load()
+        with self._lock:
+            # Entries loaded while a write invalidated the catalog may already be stale.
+            if generation == self._generation:
+                self._entries[key] = value
+        return value
+
+    def set(self, key:tuple, value) -> None:
+        """Store an entry that was just written to the database."""
+        with self._lock:
+            self._entries[key] = value
+
+    def discard(self, key:tuple) -> None:
+        """Drop a single entry without changing the versions of the layers."""
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def invalidate(self, table:Union[str,None]=None) -> None:
+        """
+        Drop the entries of a layer and the entries that hold information for all layers.
+
+        Parameters
+        ----------
+        table: str, None
+            The name of the layer whose metadata changed. If None, all entries are dropped.
+        """
+        with self._lock:
+            self._generation += 1
+            if table is None:
+                self._entries.clear()
+                self._epoch += 1
+                return
+            self._versions[table] = self._versions.get(table, 0) + 1
+            for key in list(self._entries.keys()):
+                if key[0] in self.GLOBAL_KEYS or key[1:] == (table,):
+                    del self._entries[key]
+
+    def invalidate_shapes(self, table:Union[str,None]=None) -> None:
+        """
+        Drop the shapes of the layers after rows were inserted or deleted.
+
+        Parameters
+        ----------
+        table: str, None
+            The name of the layer whose rows changed. If None, the versions of all layers are increased.
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(("shapes",), None)
+            self._bump(table)
+
+    def invalidate_data(self, table:str) -> None:
+        """Increase the version of a layer after its values were updated. The metadata of the layer are kept."""
+        with self._lock:
+            self._bump(table)
+
+    def _bump(self, table:Union[str,None]) -> None:
+        if table is None:
+            self._epoch += 1
+        else:
+            self._versions[table] = self._versions.get(table, 0) + 1
+
+    def version(self, table:str) -> tuple:
+        """Get the version of a layer. The version changes whenever the layer is written by this process or the catalog is refreshed."""
+        with self._lock:
+            return (self._epoch, self._versions.get(table, 0))
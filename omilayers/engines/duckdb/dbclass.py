@@ -4,16 +4,143 @@ import duckdb
 import numpy as np
 import pandas as pd
 from omilayers import utils
+from omilayers.utils import stats
+from omilayers.engines.catalog import Catalog
+import contextlib
+import threading
+import os
+import re
+import uuid
 
 
 class DButils:
 
+    # Expansion of "*" that skips the rowid column of external layers.
+    _all_columns = "COLUMNS(c -> c != 'rowid')"
+    # Declared types of the columns of the tables created from pandas.DataFrame objects, by dtype.
+    _declared_types = utils.DUCKDB_TYPES
+
     def __init__(self, db, config, read_only):
         self.db = db
         self.config = config
         self.read_only = read_only
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+        self._local = threading.local()
+        self._cursors = []
+        # Connections in use by each thread, so that their queries can be interrupted.
+        self._active = {}
+        self._catalog = Catalog()
+        self._search_index_stale = False
         if not Path(db).exists():
             self._create_table_for_tables_metadata()
+            self._create_table_for_tables_stats()
+            self._create_search_index()
+
+    def _open_session(self) -> None:
+        """Open a long-lived configured connection that is reused by all subsequent calls."""
+        with self._session_lock:
+            if self._session is not None and self._session_pid == os.getpid():
+                return
+            self._session = duckdb.connect(self.db, read_only=self.read_only)
+            self._configureDB(self._session)
+            self._session_pid = os.getpid()
+            self._local = threading.local()
+            self._cursors = []
+
+    def _close_session(self) -> None:
+        """Close the long-lived connection and the cursors handed out from it."""
+        with self._session_lock:
+            if self._session is None:
+                return
+            if self._session_pid == os.getpid():
+                for cursor in self._cursors:
+                    cursor.close()
+                self._session.close()
+            self._session = None
+            self._session_pid = None
+            self._local = threading.local()
+            self._cursors = []
+
+    @contextlib.contextmanager
+    def _connect(self, dedicated:bool=False):
+        """
+        Yield a configured connection to the database.
+
+        Inside a transaction the connection of the transaction is yielded. Without an open session a new connection is opened and closed on exit. Within a session, each thread reuses its own cursor of the session connection, unless a dedicated cursor is requested which is closed on exit.
+        """
+        transaction = getattr(self._local, "transaction", None)
+        if transaction is not None and not dedicated:
+            yield transaction
+            return
+        if self._session is None:
+            with duckdb.connect(self.db, read_only=self.read_only) as con:
+                self._configureDB(con)
+                with self._track(con):
+                    yield con
+            return
+        if self._session_pid != os.getpid():
+            # Connections cannot be shared with forked processes.
+            self._open_session()
+        if dedicated:
+            with self._session.cursor() as cursor:
+                self._configureDB(cursor)
+                with self._track(cursor):
+                    yield cursor
+            return
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            with self._session_lock:
+                cursor = self._session.cursor()
+                self._configureDB(cursor)
+                self._cursors.append(cursor)
+            self._local.cursor = cursor
+        with self._track(cursor):
+            yield cursor
+
+    @contextlib.contextmanager
+    def _track(self, con):
+        """Register the connection used by the calling thread while the enclosed statements run."""
+        connections = self._active.setdefault(threading.get_ident(), [])
+        connections.append(con)
+        try:
+            yield
+        finally:
+            connections.pop()
+
+    def _interrupt(self, thread:int) -> None:
+        """
+        Interrupt the query that a thread is running. The query raises an error in that thread.
+
+        Parameters
+        ----------
+        thread: int
+            The identifier of the thread, as returned by threading.get_ident().
+        """
+        for con in list(self._active.get(thread, [])):
+            con.interrupt()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Run all enclosed statements of the calling thread in a single transaction. Nested calls join the outer transaction."""
+        transaction = getattr(self._local, "transaction", None)
+        if transaction is not None:
+            yield transaction
+            return
+        with self._connect() as con:
+            con.execute("BEGIN TRANSACTION")
+            self._local.transaction = con
+            try:
+                yield con
+            except BaseException:
+                con.execute("ROLLBACK")
+                self._catalog.invalidate()
+                raise
+            else:
+                con.execute("COMMIT")
+            finally:
+                self._local.transaction = None
 
     def _configureDB(self, connection) -> None:
         """Configure duckdb database based on session connection."""
@@ -25,30 +152,390 @@ class DButils:
 
     def _get_db_config_settings(self) -> pd.DataFrame:
         """Get duckdb configuration settings for session"""
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
+        with self._connect() as con:
             return con.sql("SELECT * FROM duckdb_settings()").fetchdf()
 
     def _create_table_for_tables_metadata(self) -> None:
         """Creates table with name 'tables_info' where layers info will be stored"""
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
+        with self._connect() as con:
             query = "CREATE TABLE IF NOT EXISTS tables_info (name VARCHAR PRIMARY KEY, tag VARCHAR, info VARCHAR)"
             con.execute(query)
 
+    def _create_table_for_tables_stats(self) -> None:
+        """Creates table with name 'tables_stats' where the number of rows of the layers and the statistics of their columns are stored."""
+        with self._connect() as con:
+            query = "CREATE TABLE IF NOT EXISTS tables_stats (layer VARCHAR, col VARCHAR, nrows BIGINT, nulls BIGINT, min_num DOUBLE, max_num DOUBLE, min_text VARCHAR, max_text VARCHAR, distinct_count BIGINT, stale BOOLEAN)"
+            con.execute(query)
+        self._catalog.discard(("statstable",))
+
+    def _stats_table_exists(self) -> bool:
+        """Check if the statistics table exists. Databases created by older versions get it when statistics are first stored. Cached in the catalog."""
+        def load():
+            with self._connect() as con:
+                query = "SELECT count(*) FROM duckdb_tables() WHERE table_name = 'tables_stats'"
+                return con.execute(query).fetchone()[0] > 0
+        return self._catalog.get(("statstable",), load)
+
+    def _load_all_stats(self) -> dict:
+        """Get the stored statistics of all layers with a single query and cache them in the catalog."""
+        if not self._stats_table_exists():
+            return {}
+        with self._connect() as con:
+            rows = con.execute(f"SELECT {','.join(stats.STATS_COLUMNS)} FROM tables_stats").fetchall()
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row[0], []).append(row[1:])
+        allStats = {table:stats.from_rows(tableRows) for table,tableRows in grouped.items()}
+        for table,layerStats in allStats.items():
+            self._catalog.set(("stats", table), layerStats)
+        return allStats
+
+    def _load_stats(self, table:str) -> dict:
+        """Get the stored statistics of a layer. Empty if none are stored. Cached in the catalog."""
+        def load():
+            if not self._stats_table_exists():
+                return {}
+            with self._connect() as con:
+                query = f"SELECT {','.join(stats.STATS_COLUMNS[1:])} FROM tables_stats WHERE layer = ?"
+                return stats.from_rows(con.execute(query, [table]).fetchall())
+        return self._catalog.get(("stats", table), load)
+
+    def _write_stats(self, table:str, layerStats:dict) -> None:
+        """Store the statistics of a layer. With a read-only connection, the statistics are kept only in the catalog."""
+        if not self.read_only:
+            if not self._stats_table_exists():
+                self._create_table_for_tables_stats()
+            statsLocal = pd.DataFrame(stats.to_rows(table, layerStats), columns=stats.STATS_COLUMNS)
+            with self._transaction() as con:
+                con.execute("DELETE FROM tables_stats WHERE layer = ?", [table])
+                con.register("statsLocal", statsLocal)
+                try:
+                    con.execute("INSERT INTO tables_stats SELECT * FROM statsLocal")
+                finally:
+                    con.unregister("statsLocal")
+        self._catalog.set(("stats", table), layerStats)
+        self._catalog.discard(("shapes",))
+
+    def _update_stats(self, table:str, change) -> None:
+        """Apply change, a function of the current statistics, to the stored statistics of a layer. Layers without statistics are skipped, since their statistics are computed when requested."""
+        layerStats = self._load_stats(table)
+        if layerStats:
+            self._write_stats(table, change(layerStats))
+
+    def _compute_stats(self, table:str, cols:List) -> dict:
+        """Compute the number of rows of a layer and the statistics of the given columns from the table. The numbers of distinct values are approximate."""
+        types = self._get_table_column_types(table)
+        queries = stats.aggregate_queries(table, cols, types, approximate=True)
+        if not queries:
+            queries = [([], f"SELECT count(*) FROM {table}")]
+        layerStats = {}
+        with self._connect() as con:
+            for queryCols,query in queries:
+                layerStats.update(stats.parse_aggregate(con.execute(query).fetchone(), queryCols, types))
+        return layerStats
+
+    def _get_table_stats(self, table:str) -> dict:
+        """
+        Get the number of rows of a layer and the statistics of its columns. Statistics that are missing or stale are computed from the table and stored.
+
+        Returns
+        -------
+        Dictionary with the statistics of each column and, under the key "", the number of rows.
+        """
+        layerStats = self._load_stats(table)
+        columns = self._get_table_column_names(table)
+        rowsNeeded, cols = stats.needs_update(layerStats, columns)
+        dropped = set(layerStats) - set(columns) - {stats.LAYER_ROW}
+        if rowsNeeded or cols or dropped:
+            layerStats = {col:row for col,row in layerStats.items() if col not in dropped}
+            layerStats.update(self._compute_stats(table, cols))
+            self._write_stats(table, layerStats)
+        return layerStats
+
+    def _count_rows(self, table:str) -> int:
+        """Get the number of rows of a layer from its statistics. If they are missing or stale, the rows are counted and the number is stored without computing the statistics of the columns."""
+        layerStats = self._load_stats(table)
+        layerRow = layerStats.get(stats.LAYER_ROW)
+        if layerRow is not None and not layerRow["stale"]:
+            return layerRow["nrows"]
+        with self._connect() as con:
+            nrows = con.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+        self._write_stats(table, stats.set_nrows(layerStats, nrows))
+        return nrows
+
+    def _mark_stats_stale(self, tables:List) -> None:
+        """Mark the statistics of the given layers to be recomputed, e.g. after an arbitrary query wrote to them. Names are matched case-insensitively."""
+        tables = {table.lower() for table in tables}
+        layers = [name for name in self._get_tables_names() if name.lower() in tables]
+        if layers and not self.read_only and self._stats_table_exists():
+            with self._connect() as con:
+                con.execute(f"UPDATE tables_stats SET stale = true WHERE layer IN ({','.join('?' * len(layers))})", layers)
+
+    def _create_search_index(self) -> None:
+        """Creates table with name 'tables_search' that indexes the names, descriptions and columns of layers."""
+        with self._connect() as con:
+            query = "CREATE TABLE IF NOT EXISTS tables_search (layer VARCHAR, kind VARCHAR, term VARCHAR)"
+            con.execute(query)
+        self._catalog.invalidate()
+
+    def _search_index_exists(self) -> bool:
+        """Check if the search index exists. Cached in the catalog."""
+        def load():
+            with self._connect() as con:
+                query = "SELECT count(*) FROM duckdb_tables() WHERE table_name = 'tables_search'"
+                return con.execute(query).fetchone()[0] > 0
+        return self._catalog.get(("search",), load)
+
+    def _ensure_search_index(self) -> bool:
+        """Create and fill the search index of databases created by older versions. Returns False if the index is missing and the database is read-only."""
+        if not self._search_index_exists():
+            if self.read_only:
+                return False
+            self._create_search_index()
+            self._rebuild_search_index()
+        elif self._search_index_stale and not self.read_only:
+            self._rebuild_search_index()
+        return True
+
+    def _search_index_rows(self, table:str) -> List:
+        """Get the rows of the search index for a layer."""
+        rows = [(table, "name", table)]
+        info = self._get_from_tables_info(table=table, col="info")
+        if info:
+            rows.append((table, "info", info))
+        # Layers that are not stored in the database, e.g. dense layers, have no columns to describe.
+        if table in self._get_all_tables_names() or table in self._get_views_names():
+            rows.extend((table, "column", col) for col in self._get_table_column_names(table))
+        return rows
+
+    def _insert_search_rows(self, con, rows:List) -> None:
+        """Insert rows to the search index in one statement."""
+        if rows:
+            search_rows = pd.DataFrame(rows, columns=["layer", "kind", "term"])
+            con.register("search_rows", search_rows)
+            try:
+                con.execute("INSERT INTO tables_search SELECT * FROM search_rows")
+            finally:
+                con.unregister("search_rows")
+
+    def _index_layer(self, table:str) -> None:
+        """Update the rows of a layer in the search index."""
+        if not self._ensure_search_index():
+            return
+        rows = self._search_index_rows(table) if self._table_exists(table) else []
+        with self._transaction() as con:
+            con.execute("DELETE FROM tables_search WHERE layer = ?", [table])
+            self._insert_search_rows(con, rows)
+
+    def _unindex_layer(self, table:str) -> None:
+        """Remove a layer from the search index."""
+        if self._search_index_exists() and not self.read_only:
+            with self._connect() as con:
+                con.execute("DELETE FROM tables_search WHERE layer = ?", [table])
+
+    def _rebuild_search_index(self) -> None:
+        """Fill the search index with all layers."""
+        rows = []
+        for table in self._get_tables_names():
+            rows.extend(self._search_index_rows(table))
+        with self._transaction() as con:
+            con.execute("DELETE FROM tables_search")
+            self._insert_search_rows(con, rows)
+        self._search_index_stale = False
+
+    def _search_layers(self, term:str, fuzzy:bool=False) -> pd.DataFrame:
+        """
+        Search the index for a term.
+
+        Parameters
+        ----------
+        term: str
+            The term to search. Matched case-insensitively as substring of layer names, descriptions and columns.
+        fuzzy: bool
+            If True, layer names and columns similar to the term are also matched by their Jaro-Winkler similarity.
+
+        Returns
+        -------
+        pandas.DataFrame with the matched layer, the kind of the matched term ("name", "info" or "column"), the matched term and its score. Exact matches score 1, prefix matches 0.8, substring matches 0.6 and fuzzy matches up to 0.5.
+        """
+        if not self._ensure_search_index():
+            raise ValueError("The database has no search index. Open it once without read_only to build the index.")
+        query = """SELECT layer, kind, term, CASE
+                    WHEN lower(term) = lower($term) THEN 1.0
+                    WHEN starts_with(lower(term), lower($term)) THEN 0.8
+                    WHEN contains(lower(term), lower($term)) THEN 0.6
+                    ELSE 0.5 * jaro_winkler_similarity(lower(term), lower($term)) END AS score
+                FROM tables_search
+                WHERE contains(lower(term), lower($term))
+                OR ($fuzzy AND kind != 'info' AND jaro_winkler_similarity(lower(term), lower($term)) >= 0.85)"""
+        with self._connect() as con:
+            return con.execute(query, {"term":term, "fuzzy":fuzzy}).fetchdf()
+
+    def _get_indexes(self, table:str) -> List:
+        """
+        Get the secondary indexes of a table. Cached in the catalog.
+
+        Parameters
+        ----------
+        table: str
+            Name of the table.
+
+        Returns
+        -------
+        List of dictionaries with the name, the indexed columns and the uniqueness of each index.
+        """
+        def load():
+            with self._connect() as con:
+                query = "SELECT index_name, expressions, is_unique FROM duckdb_indexes() WHERE table_name = ? ORDER BY index_name"
+                rows = con.execute(query, [table]).fetchall()
+            indexes = []
+            for name, expressions, unique in rows:
+                # Quoted identifiers are listed as '"col"' and the rest as col.
+                cols = [quoted.replace('""', '"') if quoted else plain for quoted,plain in re.findall(r"""'"((?:[^"]|"")*)"'|([^,\[\]\s]+)""", expressions)]
+                indexes.append({'name':name, 'columns':cols, 'unique':bool(unique)})
+            return indexes
+        return self._catalog.get(("indexes", table), load)
+
+    def _create_index(self, table:str, cols:List, unique:bool=False, name:Union[str,None]=None) -> str:
+        """
+        Create a secondary index on one or more columns of a table.
+
+        Parameters
+        ----------
+        table: str
+            Name of the table.
+        cols: list
+            The columns to be indexed.
+        unique: bool
+            If True, the index enforces unique values.
+        name: str, None
+            The name of the index. If None, the name is created from the names of the table and the columns.
+
+        Returns
+        -------
+        The name of the index.
+        """
+        if name is None:
+            name = utils._index_name(table, cols)
+        uniqueString = "UNIQUE " if unique else ""
+        with self._connect() as con:
+            query = f'CREATE {uniqueString}INDEX "{name}" ON {table} ({",".join(utils._sanitize_column_names(cols))})'
+            con.execute(query)
+        self._catalog.invalidate(table)
+        return name
+
+    def _drop_index(self, table:str, name:str) -> None:
+        """
+        Delete a secondary index of a table.
+
+        Parameters
+        ----------
+        table: str
+            Name of the table.
+        name: str
+            Name of the index.
+        """
+        with self._connect() as con:
+            con.execute(f'DROP INDEX IF EXISTS "{name}"')
+        self._catalog.invalidate(table)
+
+    @contextlib.contextmanager
+    def _indexes_suspended(self, table:str, new_table:Union[str,None]=None, renamed:Union[dict,None]=None, dropped:Union[List,None]=None):
+        """
+        Drop the indexes of a table for statements that duckdb does not allow on indexed tables (e.g. renaming or dropping columns) and recreate them afterwards.
+
+        Parameters
+        ----------
+        table: str
+            Name of the table.
+        new_table: str, None
+            The name of the table after the enclosed statements, if the table is renamed.
+        renamed: dict, None
+            Columns renamed by the enclosed statements, as old name to new name.
+        dropped: list, None
+            Columns dropped by the enclosed statements. Their indexes are not recreated.
+        """
+        indexes = self._get_indexes(table)
+        for index in indexes:
+            self._drop_index(table, index['name'])
+        try:
+            yield
+        except BaseException:
+            for index in indexes:
+                self._create_index(table, index['columns'], unique=index['unique'], name=index['name'])
+            raise
+        renamed = renamed or {}
+        for index in indexes:
+            if set(index['columns']).intersection(dropped or []):
+                continue
+            cols = [renamed.get(col, col) for col in index['columns']]
+            self._create_index(new_table or table, cols, unique=index['unique'], name=index['name'])
+
+    def _register_layer(self, table:str, shape:tuple) -> None:
+        """
+        Add a layer whose data are not stored in a table of the database, e.g. a dense layer, to tables_info. The layer has no statistics, so its shape is not stored.
+
+        Parameters
+        ----------
+        table: str
+            The name of the layer.
+        shape: tuple
+            The number of rows and columns of the layer.
+        """
+        if self._table_exists(table):
+            self._drop_table(table)
+        with self._connect() as con:
+            con.execute("INSERT INTO tables_info (name) VALUES (?)", [table])
+        self._catalog.invalidate(table)
+        self._index_layer(table)
+
     def _table_exists(self, table:str) -> bool:
         tables = self._get_tables_names() 
         if table in tables:
             return True
         return False
 
+    def _get_all_tables_names(self) -> List:
+        """Get the names of all tables in the database, including the tables that are not layers. Cached in the catalog."""
+        def load():
+            with self._connect() as con:
+                return [row[0] for row in con.execute("SELECT table_name FROM duckdb_tables()").fetchall()]
+        return self._catalog.get(("alltables",), load)
+
+    def _create_internal_table(self, table:str, data:pd.DataFrame) -> None:
+        """
+        Create a table that is not registered as a layer, e.g. the dictionary tables of matrix layers.
+
+        Parameters
+        ----------
+        table: str
+            The name of the table.
+        data: pandas.DataFrame
+            The initial rows of the table, possibly none, that also set the types of the columns.
+        """
+        dfLocal = data
+        with self._connect() as con:
+            con.execute(f"CREATE TABLE {table} AS SELECT * FROM dfLocal")
+        self._catalog.invalidate(table)
+
+    def _get_views_names(self) -> List:
+        """Get the names of the external layers, i.e. the views over Parquet files."""
+        def load():
+            with self._connect() as con:
+                query = "SELECT view_name FROM duckdb_views() WHERE NOT internal"
+                return [row[0] for row in con.execute(query).fetchall()]
+        return self._catalog.get(("views",), load)
+
+    def _is_external(self, table:str) -> bool:
+        """Check if table is an external layer, i.e. a view over Parquet files."""
+        return table in self._get_views_names()
+
     def _get_table_rowids(self, table:str, limit:Union[int,None]=None) -> np.ndarray:
         if limit is None:
             query = f"SELECT rowid FROM {table}"
         else:
             query = f"SELECT rowid FROM {table} LIMIT {limit}"
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
+        with self._connect() as con:
             result = con.sql(query).fetchnumpy()
         return result['rowid']
 
@@ -64,21 +551,127 @@ class DButils:
             A pandas.DataFrame object.
         """
         dfLocal = data
+        # Errors roll back the transaction, so that a partially created layer is not kept.
+        with self._transaction() as con:
+            if self._table_exists(table):
+                self._drop_table(table)
+            query = "INSERT INTO tables_info (name) VALUES (?)"
+            con.execute(query, [table])
+            query = f"CREATE TABLE {table} AS SELECT * FROM 'dfLocal'" 
+            con.execute(query)
+            self._write_stats(table, stats.layer_stats(data.shape[0]))
+        self._catalog.invalidate(table)
+        self._index_layer(table)
+
+    def _create_table_from_csv(self, table:str, filename:str, options:dict) -> None:
+        """
+        Deletes previous created table if exists and creates table from a csv file using the parallel csv reader of duckdb.
+
+        Parameters
+        ----------
+        table: str
+            The name of the table.
+        filename: str
+            The input csv file. Compressed files like ".gz" are decompressed on the fly.
+        options: dict
+            Keywords of pandas.read_csv or options of duckdb read_csv. Column types are sniffed unless given.
+        """
+        options = utils.convert_to_duckdb_csv_options(options)
+        readCsv = "read_csv(?{})".format("".join(f", {key}=?" for key in options.keys()))
+        params = [str(filename)] + list(options.values())
         if self._table_exists(table):
             self._drop_table(table)
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
-            try:
-                query = "INSERT INTO tables_info (name) VALUES (?)"
-                con.execute(query, [table])
-                query = f"CREATE TABLE {table} AS SELECT * FROM 'dfLocal'" 
-                con.execute(query)
-            except Exception as error:
-                print(error)
-                if self._table_exists(table):
-                    self._drop_table(table)
-                if table in self._select_cols(table='tables_info', cols='name')['name'].values.tolist():
-                    self._delete_rows(table='tables_info', where_col="name", where_values=table)
+        with self._transaction() as con:
+            con.execute("INSERT INTO tables_info (name) VALUES (?)", [table])
+            con.execute(f"CREATE TABLE {table} AS SELECT * FROM {readCsv}", params)
+        self._catalog.invalidate(table)
+        self._index_layer(table)
+
+    def _create_table_from_parquet(self, table:str, filename:Union[str,List], external:bool=False) -> None:
+        """
+        Deletes previous created table if exists and creates table from one or more Parquet files.
+
+        Parameters
+        ----------
+        table: str
+            The name of the table.
+        filename: str, list
+            Parquet file, list of Parquet files or glob pattern (e.g. "counts/*.parquet").
+        external: bool
+            If True, a view over the Parquet files is created instead of copying the data in the database. The files of glob patterns are resolved when the view is created. The rowid of the view is the row number in the files, in the order of the files.
+        """
+        if isinstance(filename, str):
+            filenames = [filename]
+        else:
+            filenames = list(filename)
+        if external:
+            # Views keep the paths, so they should not depend on the working directory.
+            filenames = [str(Path(name).absolute()) for name in filenames]
+        if self._table_exists(table):
+            self._drop_table(table)
+        if external:
+            source = self._parquet_view_query(filenames)
+        with self._transaction() as con:
+            con.execute("INSERT INTO tables_info (name) VALUES (?)", [table])
+            if external:
+                con.execute(f"CREATE VIEW {table} AS {source}")
+            else:
+                con.execute(f"CREATE TABLE {table} AS SELECT * FROM read_parquet({self._files_list(filenames)})")
+        self._catalog.invalidate(table)
+        self._index_layer(table)
+
+    @staticmethod
+    def _files_list(filenames:List) -> str:
+        """List literal of file names."""
+        return "[{}]".format(",".join("'{}'".format(str(name).replace("'", "''")) for name in filenames))
+
+    def _parquet_view_query(self, filenames:List) -> str:
+        """
+        Query of the view of an external layer. The rowid of a row is its row number in its file plus the number of rows of the preceding files, which are read from the Parquet metadata. Rowids therefore do not depend on the order the files are scanned, and filters of the view are pushed down to the Parquet reader.
+
+        Parameters
+        ----------
+        filenames: list
+            Parquet files or glob patterns. The files of each pattern are sorted by name.
+        """
+        with self._connect() as con:
+            files = [row[0] for name in filenames for row in con.execute("SELECT file FROM glob(?) ORDER BY file", [name]).fetchall()]
+            if not files:
+                raise ValueError(f"No Parquet files were found for: {', '.join(filenames)}.")
+            nrows = dict(con.execute(f"SELECT file_name, num_rows FROM parquet_file_metadata({self._files_list(files)})").fetchall())
+        if len(files) == 1:
+            rowid = "file_row_number"
+        else:
+            offsets = np.concatenate([[0], np.cumsum([nrows[name] for name in files])[:-1]])
+            cases = " ".join("WHEN '{}' THEN {}".format(name.replace("'", "''"), offset) for name,offset in zip(files, offsets))
+            rowid = f"CASE filename {cases} END + file_row_number"
+        return f"SELECT {rowid} AS rowid, * EXCLUDE (filename, file_row_number) FROM read_parquet({self._files_list(files)}, filename=true, file_row_number=true)"
+
+    def _export_to_parquet(self, table:str, cols:str, filename:str, row_group_size:Union[int,None]=None, compression:str="zstd") -> None:
+        """
+        Write columns of table to a Parquet file without loading the table in memory.
+
+        Parameters
+        ----------
+        table: str
+            The name of the table.
+        cols: str
+            The sanitized and comma separated columns to be written, or "*" for all columns.
+        filename: str
+            The output Parquet file.
+        row_group_size: int, None
+            The number of rows in each row group. If None, the default of duckdb is used.
+        compression: str
+            One of "zstd", "snappy", "gzip", "lz4" or "uncompressed".
+        """
+        if cols == "*":
+            cols = self._all_columns
+        options = ["FORMAT parquet", f"COMPRESSION '{compression}'"]
+        if row_group_size is not None:
+            options.append(f"ROW_GROUP_SIZE {int(row_group_size)}")
+        filename = str(filename).replace("'", "''")
+        with self._connect() as con:
+            con.execute(f"COPY (SELECT {cols} FROM {table}) TO '{filename}' ({', '.join(options)})")
 
     def _insert_rows(self, table:str, data:pd.DataFrame, ordered:bool=False) -> None:
         """
@@ -98,9 +691,10 @@ class DButils:
             query = f"INSERT INTO {table} BY NAME SELECT * FROM 'dfLocal'"
         else:
             query = f"INSERT INTO {table} SELECT * FROM 'dfLocal'"
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
+        with self._transaction() as con:
             con.execute(query)
+            self._update_stats(table, lambda layerStats: stats.insert_rows(layerStats, data))
+        self._catalog.invalidate_shapes(table)
 
     def _get_tables_info(self, tag:Union[None,str]=None) -> pd.DataFrame:
         """
@@ -111,29 +705,40 @@ class DButils:
         tag: None, str
             If None, info from all tables will be returned. If str, info from tables that belogn to group tag will be returned.
         """
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
-            query = "SELECT table_name, estimated_size, column_count FROM duckdb_tables()"
-            tmp = con.sql(query).fetchdf()
-            tmp = tmp.set_index("table_name")
-            tmp['shape'] = [f"{r}x{c}" for r,c in zip(tmp['estimated_size'], tmp['column_count'])]
-            tmp = tmp.drop("tables_info") 
-
-            if tag is None:
-                query = "SELECT * FROM tables_info"
-                _tables = con.sql(query).fetchdf()
-            else:
-                query = f'SELECT * FROM tables_info WHERE tag="?"'
-                _tables = con.sql(query, tag).fetchdf()
-            _tables = _tables.set_index("name")
+        tables = self._get_tables_metadata()
+        if tag is not None:
+            tables = [row for row in tables if row['tag'] == tag]
+        shapes = self._get_tables_shapes()
+        df = pd.DataFrame(tables, columns=['name', 'tag', 'info'])
+        df['shape'] = [shapes.get(name) for name in df['name']]
+        return df[['name', 'tag', 'shape', 'info']]
+
+    def _get_tables_metadata(self) -> List:
+        """Get the rows of tables_info as dictionaries. Cached in the catalog."""
+        def load():
+            with self._connect() as con:
+                rows = con.execute("SELECT name, tag, info FROM tables_info").fetchall()
+            return [{'name':name, 'tag':tag, 'info':info} for name,tag,info in rows]
+        return self._catalog.get(("tables",), load)
+
+    def _get_table_shape(self, table:str) -> str:
+        """Get the shape of a table as "{rows}x{columns}". The number of rows is taken from the statistics of the layer, or counted if it is missing or stale."""
+        return f"{self._count_rows(table)}x{len(self._get_table_column_names(table))}"
 
-            tmp = tmp.loc[_tables.index, 'shape']
-            df = pd.concat([_tables, tmp], axis='columns')
-            df = df.reset_index()
-            df = df[['name', 'tag', 'shape', 'info']]
-        return df
+    def _get_tables_shapes(self) -> dict:
+        """Get the shape of each table as "{rows}x{columns}". The numbers of rows are taken from the statistics of the layers, or counted if they are missing or stale. Cached in the catalog."""
+        def load():
+            # Loads the statistics of all layers with one query.
+            self._load_all_stats()
+            tables = set(self._get_all_tables_names()) | set(self._get_views_names())
+            shapes = {}
+            for name in self._get_tables_names():
+                if name in tables:
+                    shapes[name] = self._get_table_shape(name)
+            return shapes
+        return self._catalog.get(("shapes",), load)
 
-    def _select_cols(self, table:str, cols:Union[str,List], limit:Union[int,None]=None) -> pd.DataFrame:
+    def _select_cols(self, table:str, cols:Union[str,List], limit:Union[int,None]=None, backend:str="pandas") -> pd.DataFrame:
         """
         Select columns from specified table.
 
@@ -145,21 +750,24 @@ class DButils:
             The name of one or more columns to select. If string is "*" then all columns will be selected.
         limit: int, None
             Number of rows to fetch. If None, all rows will be fetched.
+        backend: str
+            The format of the fetched data. One of utils.BACKENDS.
 
         Returns
         -------
-        The selected columns from the specified table as pandas.DataFrame.
+        The selected columns from the specified table as pandas.DataFrame, or in the format of the given backend.
         """
         if isinstance(cols, list):
             cols = ','.join(cols)
+        elif cols == "*":
+            cols = self._all_columns
+        # rowid is fetched in the same statement to build the index.
         if limit is None:
-            query = f"SELECT {cols} FROM {table}"
+            query = f"SELECT rowid,{cols} FROM {table}"
         else:
-            query = f"SELECT {cols} FROM {table} LIMIT {limit}"
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
-            df = con.sql(query).fetchdf()
-        return df.set_index(self._get_table_rowids(table, limit=limit))
+            query = f"SELECT rowid,{cols} FROM {table} LIMIT {limit}"
+        result = self._fetch(query, backend=backend)
+        return utils._set_rowid_index(result, backend, name=None)
 
     def _rename_table(self, table:str, new_name:str) -> None:
         """
@@ -172,10 +780,15 @@ class DButils:
         new_name: str
             The new name of the table.
         """
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
-            query = f"ALTER TABLE {table} RENAME TO {new_name}"
-            con.execute(query)
+        objectType = "VIEW" if self._is_external(table) else "TABLE"
+        with self._indexes_suspended(table, new_table=new_name):
+            with self._connect() as con:
+                query = f"ALTER {objectType} {table} RENAME TO {new_name}"
+                con.execute(query)
+                if self._stats_table_exists() and not self.read_only:
+                    con.execute("UPDATE tables_stats SET layer = ? WHERE layer = ?", [new_name, table])
+            self._catalog.invalidate(table)
+        self._catalog.invalidate(new_name)
 
     def _rename_column(self, table:str, col:str, new_name:str) -> None:
         """
@@ -190,12 +803,40 @@ class DButils:
         new_name: str
             New name of column.
         """
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
-            query = f"ALTER TABLE {table} RENAME {col} TO {new_name}"
-            con.execute(query)
+        with self._indexes_suspended(table, renamed={col:new_name}):
+            with self._connect() as con:
+                query = f"ALTER TABLE {table} RENAME {col} TO {new_name}"
+                con.execute(query)
+            self._update_stats(table, lambda layerStats: stats.rename_column(layerStats, col, new_name))
+        self._catalog.invalidate(table)
+        self._index_layer(table)
 
-    def _delete_rows(self, table:str, where_col:str, where_values:Union[str,int,float,List]) -> None:
+    @contextlib.contextmanager
+    def _staged_keys(self, cols:List, values):
+        """
+        Stage a key set as a relation that is joined with a table, instead of passing the keys as literals in the query. The enclosed statements run in a transaction, so that they see the relation.
+
+        Parameters
+        ----------
+        cols: list
+            The key columns of the table.
+        values: list, numpy.ndarray, pandas.Series, pandas.DataFrame
+            The key values. For multiple key columns, a list of tuples or a pandas.DataFrame.
+
+        Yields
+        ------
+        A tuple with the connection and the WHERE condition that matches the rows of the key set.
+        """
+        keys = utils._keys_dataframe(cols, values)
+        relation = f"_keys_{uuid.uuid4().hex}"
+        with self._transaction() as con:
+            con.register(relation, keys)
+            try:
+                yield con, utils._keys_condition(cols, relation)
+            finally:
+                con.unregister(relation)
+
+    def _delete_rows(self, table:str, where_col:Union[str,List], where_values:Union[str,int,float,List]) -> None:
         """
         Delete one or more rows from table based on column values. 
 
@@ -203,23 +844,27 @@ class DButils:
         ----------
         table: str
             Name of existing table.
-        where_col: str
-            Name of column that will be used as reference to delete table rows.
+        where_col: str, list
+            Name of column that will be used as reference to delete table rows. A list of columns for composite keys.
         where_values: str, int, float, list
-            The values of the reference column that are in the rows to be deleted. 
+            The values of the reference column that are in the rows to be deleted. For composite keys, a list of tuples or a pandas.DataFrame. Lists of values are staged as a relation and the rows are found with a semi-join.
         """
-        if isinstance(where_values, str):
-            query = f"DELETE FROM {table} WHERE {where_col} = '{where_values}'"
-        elif isinstance(where_values, int) or isinstance(where_values, float):
-            query = f"DELETE FROM {table} WHERE {where_col} = {where_values}"
+        if isinstance(where_values, str) or isinstance(where_values, int) or isinstance(where_values, float):
+            query = f"DELETE FROM {table} WHERE {where_col} = ?"
+            with self._transaction() as con:
+                deletedRows = con.execute(query, [where_values]).fetchone()[0]
+                self._update_stats(table, lambda layerStats: stats.remove_rows(layerStats, deletedRows))
         else:
-            values = ",".join(f"'{x}'" for x in where_values)
-            query = f"DELETE FROM {table} WHERE {where_col} IN ({values})"
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
-            con.execute(query)
+            whereCols = [where_col] if isinstance(where_col, str) else list(where_col)
+            with self._staged_keys(whereCols, where_values) as (con, condition):
+                deletedRows = con.execute(f"DELETE FROM {table} WHERE {condition}").fetchone()[0]
+                self._update_stats(table, lambda layerStats: stats.remove_rows(layerStats, deletedRows))
+        if table == "tables_info":
+            self._catalog.invalidate()
+        else:
+            self._catalog.invalidate_shapes(table)
 
-    def _select_rows(self, table:str, cols:Union[str,slice,List], where:str, values:Union[str,int,float,slice,np.ndarray,List], exclude:Union[str,List,None]=None) -> pd.DataFrame:
+    def _select_rows(self, table:str, cols:Union[str,slice,List], where:str, values:Union[str,int,float,slice,np.ndarray,List], exclude:Union[str,List,None]=None, backend:str="pandas") -> pd.DataFrame:
         """
         Select a given number of rows from a given table.
 
@@ -229,21 +874,28 @@ class DButils:
             Name of existing table.
         cols: str, slice, list
             Which columns to be included in the selected rows. If string is "*" then all columns will be selected.
-        where: str
-            Name of column that will be used as reference column to select rows.
+        where: str, list
+            Name of column that will be used as reference column to select rows. A list of columns for composite keys.
         values: str, int, float, slice, list, np.ndarray
-            Values of reference column that are in the rows to be selected.
+            Values of reference column that are in the rows to be selected. For composite keys, a list of tuples or a pandas.DataFrame. Lists of values are staged as a relation and the rows are found with a semi-join.
         exclude: None, str, list
             One or more columns to exclude when selecting rows. Useful when "*" is passed in the "cols" parameter.
+        backend: str
+            The format of the fetched data. One of utils.BACKENDS.
 
         Returns
         -------
-        Returns the rows of the columns specified by the "cols" parameter filtered by the values of reference columns as pandas.DataFrame.
+        Returns the rows of the columns specified by the "cols" parameter filtered by the values of reference columns as pandas.DataFrame, or in the format of the given backend.
         """
+        whereCols = [where] if isinstance(where, str) else list(where)
+        if len(whereCols) > 1 and (isinstance(values, (str, int, float, slice))):
+            raise ValueError("Pass a list of tuples or a pandas.DataFrame as values for composite keys.")
+        if isinstance(exclude, str):
+            exclude = [exclude]
+        if cols == "*" and self._is_external(table):
+            exclude = ["rowid"] + (exclude or [])
         if exclude is None:
             excludeString = ' '
-        elif isinstance(exlude, str):
-            excludeString = f' EXCLUDE ({exclude}) '
         else:
             excludeString = f' EXCLUDE ({",".join(exclude)}) '
 
@@ -262,45 +914,124 @@ class DButils:
                 else:
                     cols = ",".join(tableCols[start:end])
 
-        if where != "rowid":
-            if where not in cols.split(","):
-                colsToSelectString = f"SELECT rowid,{where},{cols}"
-            else:
-                colsToSelectString = f"SELECT rowid,{cols}"
+        if cols != "*":
+            missing = [col for col in whereCols if col != "rowid" and col not in cols.split(",")]
+            colsToSelectString = f"SELECT {','.join(['rowid'] + missing + [cols])}"
         else:
             colsToSelectString = f"SELECT rowid,{cols}"
 
-        if isinstance(values, str):
-            query = colsToSelectString + excludeString + f"FROM {table} WHERE {where} = '{values}'"
-        elif isinstance(values, int) or isinstance(values, float):
-            query = colsToSelectString + excludeString + f"FROM {table} WHERE {where} = {values}"
+        params = None
+        if isinstance(values, str) or isinstance(values, int) or isinstance(values, float):
+            query = colsToSelectString + excludeString + f"FROM {table} WHERE {where} = ?"
+            params = [values]
         elif isinstance(values, slice):
             start, end, _ = values.start, values.stop, values.step
             if start is None and end is None:
                 query = colsToSelectString + excludeString + f"FROM {table}"
             else:
-                rowIDS = self._get_table_rowids(table)
-                if start is None:
-                    start = rowIDS[0]
-                if end is None:
-                    end = rowIDS[-1]
-                else:
-                    end -= 1
-                query = colsToSelectString + excludeString + f"FROM {table} WHERE {where} BETWEEN {start} AND {end}"
+                bounds = []
+                if start is not None:
+                    bounds.append(f"{where} >= {start}")
+                if end is not None:
+                    bounds.append(f"{where} < {end}")
+                query = colsToSelectString + excludeString + f"FROM {table} WHERE {' AND '.join(bounds)}"
         else:
-            values = ",".join(f"'{x}'" for x in values)
-            query = colsToSelectString + excludeString + f"FROM {table} WHERE {where} IN ({values})"
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
-            df = con.sql(query).fetchdf()
-        return df.set_index("rowid")
-
-    def _execute_select_query(self, query) -> pd.DataFrame:
-        """Execute a SELECT query"""
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
-            df = con.sql(query).fetchdf()
-        return df
+            with self._staged_keys(whereCols, values) as (con, condition):
+                result = self._fetch(colsToSelectString + excludeString + f"FROM {table} WHERE {condition}", backend=backend)
+            return utils._set_rowid_index(result, backend)
+        result = self._fetch(query, backend=backend, params=params)
+        return utils._set_rowid_index(result, backend)
+
+    def _execute_select_query(self, query, backend:str="pandas", params:Union[List,dict,None]=None, table:Union[str,None]=None) -> pd.DataFrame:
+        """Execute a SELECT query. The table the query selects from is not needed, since DuckDB fetches columns with the dtypes of their types."""
+        return self._fetch(query, backend=backend, params=params)
+
+    def _iter_batches(self, query:str, batch_size:int, backend:str="pandas", params:Union[List,dict,None]=None, table:Union[str,None]=None):
+        """
+        Execute a SELECT query and yield the result in batches of rows. Batches are read with a record batch reader if pyarrow is installed, otherwise with fetchmany.
+
+        Parameters
+        ----------
+        query: str
+            The SELECT query to execute.
+        batch_size: int
+            The maximum number of rows of each batch.
+        backend: str
+            One of utils.BACKENDS. With the "arrow" backend, pyarrow.RecordBatch objects are yielded.
+        params: list, dict, None
+            Values bound to the placeholders of the query.
+        table: str, None
+            The table the query selects from. Not needed, since DuckDB fetches columns with the dtypes of their types.
+        """
+        utils._check_backend(backend)
+        try:
+            pa = utils._import_optional("pyarrow")
+        except ImportError:
+            if backend not in ["pandas", "numpy"]:
+                raise
+            pa = None
+        # A dedicated cursor keeps the result open while other queries run on the thread's cursor.
+        with self._connect(dedicated=True) as con:
+            result = con.execute(query, params)
+            if pa is not None:
+                if hasattr(result, "to_arrow_reader"):
+                    reader = result.to_arrow_reader(batch_size)
+                else:
+                    # Older duckdb versions
+                    reader = result.fetch_record_batch(batch_size)
+                for batch in reader:
+                    if backend == "arrow":
+                        yield batch
+                    elif backend == "numpy":
+                        yield {name:column.to_numpy(zero_copy_only=False) for name,column in zip(batch.schema.names, batch.columns)}
+                    elif backend == "polars":
+                        yield utils._import_optional("polars").from_arrow(batch)
+                    elif backend == "pandas_pyarrow":
+                        yield batch.to_pandas(types_mapper=pd.ArrowDtype)
+                    else:
+                        yield batch.to_pandas()
+            else:
+                cols = [description[0] for description in result.description]
+                while True:
+                    rows = result.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield utils._convert_dataframe(pd.DataFrame(rows, columns=cols), backend)
+
+    def _fetch(self, query:str, backend:str="pandas", params:Union[List,dict,None]=None):
+        """
+        Execute a SELECT query and fetch the result in the format of the given backend. Arrow, polars and numpy results are fetched without an intermediate pandas.DataFrame.
+
+        Parameters
+        ----------
+        query: str
+            The SELECT query to execute.
+        backend: str
+            One of utils.BACKENDS.
+        params: list, dict, None
+            Values bound to the placeholders of the query.
+        """
+        utils._check_backend(backend)
+        if backend in ["pandas_pyarrow", "arrow", "polars"]:
+            utils._import_optional("pyarrow")
+        if backend == "polars":
+            utils._import_optional("polars")
+        with self._connect() as con:
+            relation = con.sql(query, params=params)
+            if backend == "pandas":
+                return relation.fetchdf()
+            elif backend == "numpy":
+                return relation.fetchnumpy()
+            elif backend == "polars":
+                return relation.pl()
+            if hasattr(relation, "to_arrow_table"):
+                table = relation.to_arrow_table()
+            else:
+                # Older duckdb versions
+                table = relation.fetch_arrow_table()
+        if backend == "pandas_pyarrow":
+            return table.to_pandas(types_mapper=pd.ArrowDtype)
+        return table
 
     # def _add_column(self, table:str, col:str, data:Union[pd.Series,np.ndarray,List], where_col:str="rowid", where_values:Union[pd.Series,np.ndarray,List]=None) -> None:
     #     """
@@ -365,29 +1096,13 @@ class DButils:
         if where_col != "rowid" and not where_values.any():
             raise ValueError("Pass values for WHERE clause if WHERE column is not rowid.")
 
-        if where_col == "rowid":
-            rowids = self._get_table_rowids(table)
-
-            tmp_table_data = pd.DataFrame({
-                "where_col_vals": rowids,
-                "col_vals": data
-            })
-        else:
-            tmp_table_data = pd.DataFrame({
-                "where_col_vals": where_values,
-                "col_vals": data
-            })
-
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
-            query = f"ALTER TABLE {table} ADD COLUMN {col} {duckdbDtype}"
-            con.execute(query)
-
-            query = "CREATE TEMPORARY TABLE tmp_table AS SELECT * FROM tmp_table_data"
-            con.execute(query)
-
-            query = f"UPDATE {table} SET {col} = tmp_table.col_vals FROM tmp_table WHERE {table}.{where_col} = tmp_table.where_col_vals"
+        with self._connect() as con:
+            query = f'ALTER TABLE {table} ADD COLUMN "{col}" {duckdbDtype}'
             con.execute(query)
+        self._catalog.invalidate(table)
+        self._index_layer(table)
+        newData = utils._to_dataframe(data, [col])
+        self._update_columns(table, newData, where_col=where_col, where_values=where_values)
 
     def _add_multiple_columns(self, table:str, cols:List, data:pd.DataFrame) -> None:
         """
@@ -403,20 +1118,16 @@ class DButils:
             Dataframe containing the data to be added.
         """
         coltypes = utils.convert_to_duckdb_dtypes(data)
-        cols_n_types = [f"{x} {y}" for x,y in zip(cols, coltypes)]
-        query = ";".join([f"ALTER TABLE {table} ADD COLUMN {x}" for x in cols_n_types])
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
-            con.execute(query)
-        for i in range(len(data)):
-            values = data.iloc[i, :].values
-            updates = [f"{col} = {value}" for col,value in zip(cols, values)]
-            query = f"UPDATE {table} SET {','.join(updates)} WHERE rowid = {i}"
-            with duckdb.connect(self.db, read_only=self.read_only) as con:
-                self._configureDB(con)
+        with self._connect() as con:
+            for col,coltype in zip(cols, coltypes):
+                query = f'ALTER TABLE {table} ADD COLUMN "{col}" {coltype}'
                 con.execute(query)
+        self._catalog.invalidate(table)
+        self._index_layer(table)
+        newData = utils._to_dataframe(data, cols)
+        self._update_columns(table, newData)
 
-    def _update_column(self, table:str, col:str, data:Union[pd.Series, np.ndarray, List]) -> None:
+    def _update_column(self, table:str, col:str, data:Union[pd.Series, np.ndarray, List], rowids:Union[np.ndarray,List,None]=None) -> None:
         """
         Update the data of a given column in the table.
 
@@ -428,13 +1139,45 @@ class DButils:
             The name of the column in the table.
         data: pd.Series, np.ndarray, list
             The data containing the new values for the column.
+        rowids: np.ndarray, list, None
+            The rowids of the rows to be updated. If None, data should hold a value for every row of the table.
+        """
+        self._update_columns(table, utils._to_dataframe(data, [col]), where_values=rowids)
+
+    def _update_columns(self, table:str, data:pd.DataFrame, where_col:str="rowid", where_values:Union[pd.Series,np.ndarray,List,None]=None) -> None:
         """
-        rowids = self._get_table_rowids(table)
-        data = utils.create_data_array_for_duckdb_query(data, rowids=rowids)
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
-            query = f"UPDATE {table} SET {col} = ? WHERE rowid = ?"
-            con.executemany(query, data)
+        Update one or more columns of the table with a single join-based UPDATE. The new values are staged as a relation that is joined to the table on the reference column.
+
+        Parameters
+        ----------
+        table: str
+            The name of the table of the columns to be updated.
+        data: pd.DataFrame
+            Dataframe whose columns hold the new values of the table columns with the same names.
+        where_col: str
+            Name of column whose values will be used as reference for the update.
+        where_values: pandas.Series, numpy.ndarray, list, None
+            Values of reference column for each row of data. If None, the rows of data are matched to the rows of the table in order.
+        """
+        if where_values is None:
+            if where_col != "rowid":
+                raise ValueError("Pass values for WHERE clause if WHERE column is not rowid.")
+            where_values = self._get_table_rowids(table)
+        if len(where_values) != len(data):
+            raise ValueError(f"Number of values ({len(data)}) does not match the number of rows to update ({len(where_values)}).")
+
+        tmp_table_data = data.reset_index(drop=True)
+        tmp_table_data.insert(0, "where_col_vals", np.asarray(where_values))
+        updates = ",".join(f'"{col}" = tmp_table."{col}"' for col in data.columns)
+        query = f"UPDATE {table} SET {updates} FROM tmp_table WHERE {table}.{where_col} = tmp_table.where_col_vals"
+        with self._connect() as con:
+            con.register("tmp_table", tmp_table_data)
+            try:
+                con.execute(query)
+            finally:
+                con.unregister("tmp_table")
+        self._update_stats(table, lambda layerStats: stats.mark_stale(layerStats, list(data.columns)))
+        self._catalog.invalidate_data(table)
 
     def _update_tables_info(self, table:str, col:str, value:str) -> None:
         """
@@ -449,10 +1192,15 @@ class DButils:
         value: str
             The new value for the updated column.
         """
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
+        with self._connect() as con:
             query = f"UPDATE tables_info SET {col} = (?) WHERE name = (?)"
             con.execute(query, [value, table])
+        self._catalog.invalidate(table)
+        if col == "name":
+            self._unindex_layer(table)
+            self._index_layer(value)
+        else:
+            self._index_layer(table)
 
     def _get_from_tables_info(self, table:str, col:str) -> Union[str,List]:
         """
@@ -469,14 +1217,12 @@ class DButils:
         -------
             One or more columns from tables_info for a given layer.
         """
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
-            query = f"SELECT {col} FROM tables_info WHERE name='{table}'"
-            colValue = con.sql(query).fetchdf()[col].values.tolist()
-        if colValue:
-            return colValue[0]
-        else:
-            return colValue
+        for row in self._get_tables_metadata():
+            if row['name'] == table:
+                if col == "*":
+                    return list(row.values())
+                return row[col]
+        return []
 
     def _drop_column(self, table:str, col=str) -> None:
         """
@@ -489,10 +1235,53 @@ class DButils:
         col: str
             Name of column to delete.
         """
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
-            query = f"ALTER TABLE {table} DROP {col}"
-            con.execute(query)
+        with self._indexes_suspended(table, dropped=[col]):
+            with self._connect() as con:
+                query = f"ALTER TABLE {table} DROP {col}"
+                con.execute(query)
+            self._update_stats(table, lambda layerStats: stats.drop_column(layerStats, col))
+        self._catalog.invalidate(table)
+        self._index_layer(table)
+
+    def _convert_to_enum(self, table:str, col:str) -> None:
+        """
+        Convert column of strings to ENUM type with the distinct values of the column in natural order.
+
+        Parameters
+        ----------
+        table: str
+            Name of table that has the column.
+        col: str
+            Name of column to convert.
+        """
+        with self._connect() as con:
+            values = con.execute(f'SELECT DISTINCT "{col}" FROM {table} WHERE "{col}" IS NOT NULL').fetchnumpy()[col]
+            labels = ",".join("'{}'".format(str(value).replace("'", "''")) for value in sorted(values, key=utils._natural_sort_key))
+        if labels:
+            with self._indexes_suspended(table):
+                with self._connect() as con:
+                    con.execute(f'ALTER TABLE {table} ALTER "{col}" TYPE ENUM({labels})')
+        self._catalog.invalidate(table)
+
+    def _create_genomic_layout(self, table:str, chrom_col:str, pos_col:str) -> None:
+        """
+        Rewrite a table with its rows sorted by chromosome and position. Queries for genomic regions skip the row groups whose min/max statistics fall outside the regions. The rowids of the rows are renumbered.
+
+        Parameters
+        ----------
+        table: str
+            Name of the table.
+        chrom_col: str
+            Name of the column with the chromosomes.
+        pos_col: str
+            Name of the column with the positions.
+        """
+        if self._is_external(table):
+            raise ValueError(f"Layer '{table}' is backed by external Parquet files and cannot be rewritten.")
+        with self._indexes_suspended(table):
+            with self._connect() as con:
+                con.execute(f'CREATE OR REPLACE TABLE {table} AS SELECT * FROM {table} ORDER BY "{chrom_col}", "{pos_col}"')
+        self._catalog.invalidate(table)
 
     def _drop_table(self, table:str) -> None: 
         """
@@ -503,11 +1292,14 @@ class DButils:
         table: str
             Name of table to delete.
         """
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
-            query = f"DROP TABLE IF EXISTS {table}"
+        objectType = "VIEW" if self._is_external(table) else "TABLE"
+        with self._connect() as con:
+            query = f"DROP {objectType} IF EXISTS {table}"
             con.execute(query)
+            if self._stats_table_exists() and not self.read_only:
+                con.execute("DELETE FROM tables_stats WHERE layer = ?", [table])
         self._delete_rows(table="tables_info", where_col="name", where_values=table)
+        self._unindex_layer(table)
 
     def _get_tables_names(self, tag:str=None) -> List:
         """
@@ -522,14 +1314,7 @@ class DButils:
         -------
         List of fetched tables.
         """
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
-            if tag is None:
-                query = f"SELECT name FROM tables_info"
-            else:
-                query = f"SELECT name FROM tables_info WHERE tag='{tag}'"
-            tables = con.sql(query).fetchdf()['name'].values.tolist()
-        return tables
+        return [row['name'] for row in self._get_tables_metadata() if tag is None or row['tag'] == tag]
 
     def _get_table_column_names(self, table:str) -> List:
         """
@@ -544,18 +1329,46 @@ class DButils:
         -------
         List with column names from given table.
         """
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
-            query = f"DESCRIBE {table}"
-            cols = con.execute(query).fetchdf()['column_name'].values.tolist()
-        return cols
-
-    def _run_query(self, query:str, fetchdf=False) -> Union[pd.DataFrame, None]:
-        """Run an arbritary query."""
-        with duckdb.connect(self.db, read_only=self.read_only) as con:
-            self._configureDB(con)
-            if not fetchdf:
-                con.execute(query)
-            else:
-                 return con.sql(query).fetchdf()
+        return list(self._get_table_column_types(table).keys())
+
+    def _get_table_column_types(self, table:str) -> dict:
+        """
+        Get the column names and their duckdb types from a table. Cached in the catalog.
+
+        Parameters
+        ----------
+        table: str
+            Name of table to fetch column types from.
+
+        Returns
+        -------
+        Dictionary with column names as keys and column types as values.
+        """
+        def load():
+            with self._connect() as con:
+                query = f"DESCRIBE {table}"
+                cols = {row[0]:row[1] for row in con.execute(query).fetchall()}
+            if self._is_external(table):
+                cols.pop("rowid", None)
+            return cols
+        return self._catalog.get(("columns", table), load)
+
+    def _run_query(self, query:str, fetchdf=False, params:Union[List,dict,None]=None) -> Union[pd.DataFrame, None]:
+        """Run an arbritary query. The statistics of the layers the query may have written are marked to be recomputed."""
+        written = utils._written_tables(query)
+        try:
+            with self._connect() as con:
+                if not fetchdf:
+                    con.execute(query, params)
+                    result = None
+                else:
+                    result = con.sql(query, params=params).fetchdf()
+            if written is not None:
+                self._search_index_stale = True
+                self._mark_stats_stale(written)
+            return result
+        finally:
+            # A write may have changed any layer. Reads keep the cached metadata and results.
+            if written is not None:
+                self._catalog.invalidate()
 
@@ -1,31 +1,215 @@
 from typing import List, Union
 from pathlib import Path
-from duckdb import fetchall
 import numpy as np
 import pandas as pd
 from omilayers import utils
+from omilayers.utils import stats
+from omilayers.engines.catalog import Catalog
 import contextlib
+import threading
 import sqlite3
-import re
+import queue
+import difflib
+import os
+import uuid
+
+
+# PRAGMA settings applied to every new connection. The "profile" key of the
+# config dict selects one of them and any other key of the config dict is
+# applied as an additional PRAGMA, overriding the profile.
+PRAGMA_PROFILES = {
+    "default": {},
+    "bulk-load": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -262144,
+        "temp_store": "MEMORY",
+    },
+    "read-mostly": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+
+
+class _ConnectionPool:
+    """Thread-safe pool of configured sqlite3 connections."""
+
+    def __init__(self, connect, size:int):
+        self._connect = connect
+        self._size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._pid = os.getpid()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Yield an idle connection, or a new one if none is idle, and return it to the pool on exit."""
+        if self._pid != os.getpid():
+            # Connections inherited from a parent process must not be reused.
+            self._idle = queue.LifoQueue(maxsize=self._size)
+            self._pid = os.getpid()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self) -> None:
+        """Close all idle connections."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if self._pid == os.getpid():
+                conn.close()
 
 
 class DButils:
 
+    # Expansion of "*" in queries that also select the rowid.
+    _all_columns = "*"
+    # Declared types of the columns of the tables created from pandas.DataFrame objects, by dtype.
+    _declared_types = utils.SQLITE_TYPES
+
     def __init__(self, db, config, read_only):
         self.db = db
         self.config = config
         self.read_only = read_only
+        self._session = None
+        self._local = threading.local()
+        # Connections in use by each thread, so that their queries can be interrupted.
+        self._active = {}
+        self._catalog = Catalog()
+        self._search_index_stale = False
         if not Path(db).exists():
             self._create_table_for_tables_metadata()
+            self._create_table_for_tables_stats()
+            self._create_search_index()
+
+    def _get_pragmas(self) -> dict:
+        """Resolve the PRAGMA settings from the config dict."""
+        profile = self.config.get("profile", "default")
+        if profile not in PRAGMA_PROFILES:
+            raise ValueError(f"PRAGMA profile is not in supported profiles: {list(PRAGMA_PROFILES.keys())}")
+        pragmas = dict(PRAGMA_PROFILES[profile])
+        for key,value in self.config.items():
+            if key not in ["profile", "pool_size", "statement_cache_size"]:
+                pragmas[key] = value
+        if self.read_only:
+            # Journal mode cannot be changed through a read-only connection.
+            pragmas.pop("journal_mode", None)
+        return pragmas
+
+    def _new_connection(self) -> sqlite3.Connection:
+        """
+        Open a new connection configured with the PRAGMA settings. Transactions are managed explicitly by _transaction.
+
+        Each connection keeps the prepared statements of the last "statement_cache_size" query texts (default 128), so that parameterized queries are not parsed again when the connection is reused within a session.
+        """
+        cacheSize = self.config.get("statement_cache_size", 128)
+        if self.read_only:
+            conn = sqlite3.connect(f"{Path(self.db).absolute().as_uri()}?mode=ro", uri=True, isolation_level=None, check_same_thread=False, cached_statements=cacheSize)
+        else:
+            conn = sqlite3.connect(self.db, isolation_level=None, check_same_thread=False, cached_statements=cacheSize)
+        for key,value in self._get_pragmas().items():
+            if isinstance(value, int) or isinstance(value, float):
+                conn.execute(f"PRAGMA {key}={value}")
+            else:
+                conn.execute(f"PRAGMA {key}='{value}'")
+        return conn
+
+    def _open_session(self) -> None:
+        """Open a pool of long-lived connections that are reused by all subsequent calls."""
+        if self._session is None:
+            self._session = _ConnectionPool(self._new_connection, size=self.config.get("pool_size", 4))
+
+    def _close_session(self) -> None:
+        """Close the pooled connections."""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """
+        Yield a configured connection to the database.
+
+        Inside a transaction the connection of the transaction is yielded. Within a session a pooled connection is yielded, otherwise a new connection that is closed on exit.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+        elif self._session is not None:
+            with self._session.connection() as conn:
+                with self._track(conn):
+                    yield conn
+        else:
+            with contextlib.closing(self._new_connection()) as conn:
+                with self._track(conn):
+                    yield conn
+
+    @contextlib.contextmanager
+    def _track(self, conn):
+        """Register the connection used by the calling thread while the enclosed statements run."""
+        connections = self._active.setdefault(threading.get_ident(), [])
+        connections.append(conn)
+        try:
+            yield
+        finally:
+            connections.pop()
+
+    def _interrupt(self, thread:int) -> None:
+        """
+        Interrupt the query that a thread is running. The query raises an error in that thread.
+
+        Parameters
+        ----------
+        thread: int
+            The identifier of the thread, as returned by threading.get_ident().
+        """
+        for conn in list(self._active.get(thread, [])):
+            conn.interrupt()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Run all enclosed statements of the calling thread in a single transaction. Nested calls join the outer transaction."""
+        if getattr(self._local, "conn", None) is not None:
+            yield self._local.conn
+            return
+        with self._connect() as conn:
+            conn.execute("BEGIN")
+            self._local.conn = conn
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                self._catalog.invalidate()
+                raise
+            else:
+                conn.commit()
+            finally:
+                self._local.conn = None
 
     def _sqlite_execute_commit_query(self, query, values=None, get_changes=False) -> Union[str,None]:
-        with contextlib.closing(sqlite3.connect(self.db)) as conn:
+        with self._transaction() as conn:
             with contextlib.closing(conn.cursor()) as c:
                 if values is None:
                     c.execute(query)
                 else:
                     c.execute(query, values)
-                conn.commit()
                 if get_changes:
                     query = "SELECT changes()"
                     c.execute(query)
@@ -34,15 +218,17 @@ class DButils:
         return None
 
     def _sqlite_executemany_commit_query(self, query, values:List) -> None:
-        with contextlib.closing(sqlite3.connect(self.db)) as conn:
+        with self._transaction() as conn:
             with contextlib.closing(conn.cursor()) as c:
                 c.executemany(query, values)
-                conn.commit()
 
-    def _sqlite_execute_fetch_query(self, query, fetchall:bool) -> List:
-        with contextlib.closing(sqlite3.connect(self.db)) as conn:
+    def _sqlite_execute_fetch_query(self, query, fetchall:bool, values=None) -> List:
+        with self._connect() as conn:
             with contextlib.closing(conn.cursor()) as c:
-                c.execute(query)
+                if values is None:
+                    c.execute(query)
+                else:
+                    c.execute(query, values)
                 if fetchall:
                     results = c.fetchall()
                 else:
@@ -51,8 +237,277 @@ class DButils:
 
     def _create_table_for_tables_metadata(self) -> None:
         """Creates table with name 'tables_info' where layers info will be stored"""
-        query = "CREATE TABLE IF NOT EXISTS tables_info (name TEXT PRIMARY KEY, tag TEXT, shape TEXT, info TEXT)"
+        query = "CREATE TABLE IF NOT EXISTS tables_info (name TEXT PRIMARY KEY, tag TEXT, info TEXT)"
+        self._sqlite_execute_commit_query(query)
+
+    def _create_table_for_tables_stats(self) -> None:
+        """Creates table with name 'tables_stats' where the number of rows of the layers and the statistics of their columns are stored."""
+        query = "CREATE TABLE IF NOT EXISTS tables_stats (layer TEXT, col TEXT, nrows INTEGER, nulls INTEGER, min_num REAL, max_num REAL, min_text TEXT, max_text TEXT, distinct_count INTEGER, stale INTEGER, PRIMARY KEY (layer, col))"
+        self._sqlite_execute_commit_query(query)
+        self._catalog.discard(("statstable",))
+
+    def _stats_table_exists(self) -> bool:
+        """Check if the statistics table exists. Databases created by older versions get it when statistics are first stored. Cached in the catalog."""
+        def load():
+            query = "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = 'tables_stats'"
+            return self._sqlite_execute_fetch_query(query, fetchall=False)[0] > 0
+        return self._catalog.get(("statstable",), load)
+
+    def _load_all_stats(self) -> dict:
+        """Get the stored statistics of all layers with a single query and cache them in the catalog."""
+        if not self._stats_table_exists():
+            return {}
+        rows = self._sqlite_execute_fetch_query(f"SELECT {','.join(stats.STATS_COLUMNS)} FROM tables_stats", fetchall=True)
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row[0], []).append(row[1:])
+        allStats = {table:stats.from_rows(tableRows) for table,tableRows in grouped.items()}
+        for table,layerStats in allStats.items():
+            self._catalog.set(("stats", table), layerStats)
+        return allStats
+
+    def _load_stats(self, table:str) -> dict:
+        """Get the stored statistics of a layer. Empty if none are stored. Cached in the catalog."""
+        def load():
+            if not self._stats_table_exists():
+                return {}
+            query = f"SELECT {','.join(stats.STATS_COLUMNS[1:])} FROM tables_stats WHERE layer = ?"
+            return stats.from_rows(self._sqlite_execute_fetch_query(query, fetchall=True, values=[table]))
+        return self._catalog.get(("stats", table), load)
+
+    def _write_stats(self, table:str, layerStats:dict) -> None:
+        """Store the statistics of a layer. With a read-only connection, the statistics are kept only in the catalog."""
+        if not self.read_only:
+            with self._transaction():
+                if not self._stats_table_exists():
+                    self._create_table_for_tables_stats()
+                self._sqlite_execute_commit_query("DELETE FROM tables_stats WHERE layer = ?", values=[table])
+                query = f"INSERT INTO tables_stats VALUES ({','.join('?' * len(stats.STATS_COLUMNS))})"
+                self._sqlite_executemany_commit_query(query, stats.to_rows(table, layerStats))
+        self._catalog.set(("stats", table), layerStats)
+        self._catalog.discard(("shapes",))
+
+    def _update_stats(self, table:str, change) -> None:
+        """Apply change, a function of the current statistics, to the stored statistics of a layer. Layers without statistics are skipped, since their statistics are computed when requested."""
+        layerStats = self._load_stats(table)
+        if layerStats:
+            self._write_stats(table, change(layerStats))
+
+    def _compute_stats(self, table:str, cols:List) -> dict:
+        """Compute the number of rows of a layer and the statistics of the given columns from the table."""
+        types = self._get_table_column_types(table)
+        queries = stats.aggregate_queries(table, cols, types, approximate=False)
+        if not queries:
+            queries = [([], f"SELECT count(*) FROM {table}")]
+        layerStats = {}
+        for queryCols,query in queries:
+            result = self._sqlite_execute_fetch_query(query, fetchall=False)
+            layerStats.update(stats.parse_aggregate(result, queryCols, types))
+        return layerStats
+
+    def _get_table_stats(self, table:str) -> dict:
+        """
+        Get the number of rows of a layer and the statistics of its columns. Statistics that are missing or stale are computed from the table and stored.
+
+        Returns
+        -------
+        Dictionary with the statistics of each column and, under the key "", the number of rows.
+        """
+        layerStats = self._load_stats(table)
+        columns = self._get_table_column_names(table)
+        rowsNeeded, cols = stats.needs_update(layerStats, columns)
+        dropped = set(layerStats) - set(columns) - {stats.LAYER_ROW}
+        if rowsNeeded or cols or dropped:
+            layerStats = {col:row for col,row in layerStats.items() if col not in dropped}
+            layerStats.update(self._compute_stats(table, cols))
+            self._write_stats(table, layerStats)
+        return layerStats
+
+    def _count_rows(self, table:str) -> int:
+        """Get the number of rows of a layer from its statistics. If they are missing or stale, the rows are counted and the number is stored without computing the statistics of the columns."""
+        layerStats = self._load_stats(table)
+        layerRow = layerStats.get(stats.LAYER_ROW)
+        if layerRow is not None and not layerRow["stale"]:
+            return layerRow["nrows"]
+        nrows = self._sqlite_execute_fetch_query(f'SELECT count(*) FROM "{table}"', fetchall=False)[0]
+        self._write_stats(table, stats.set_nrows(layerStats, nrows))
+        return nrows
+
+    def _mark_stats_stale(self, tables:List) -> None:
+        """Mark the statistics of the given layers to be recomputed, e.g. after an arbitrary query wrote to them. Names are matched case-insensitively."""
+        tables = {table.lower() for table in tables}
+        layers = [name for name in self._get_tables_names() if name.lower() in tables]
+        if layers and not self.read_only and self._stats_table_exists():
+            self._sqlite_execute_commit_query(f"UPDATE tables_stats SET stale = 1 WHERE layer IN ({','.join('?' * len(layers))})", values=layers)
+
+    def _create_search_index(self) -> None:
+        """Creates table with name 'tables_search' that indexes the names, descriptions and columns of layers. FTS5 with the trigram tokenizer is used if available."""
+        try:
+            query = "CREATE VIRTUAL TABLE IF NOT EXISTS tables_search USING fts5(layer UNINDEXED, kind UNINDEXED, term, tokenize='trigram')"
+            self._sqlite_execute_commit_query(query)
+        except sqlite3.OperationalError:
+            query = "CREATE TABLE IF NOT EXISTS tables_search (layer TEXT, kind TEXT, term TEXT)"
+            self._sqlite_execute_commit_query(query)
+        self._catalog.invalidate()
+
+    def _get_search_index_sql(self) -> Union[str,None]:
+        """Get the statement that created the search index, or None if the index does not exist. Cached in the catalog."""
+        def load():
+            query = "SELECT sql FROM sqlite_master WHERE name='tables_search'"
+            result = self._sqlite_execute_fetch_query(query, fetchall=False)
+            return result[0] if result else None
+        return self._catalog.get(("search",), load)
+
+    def _ensure_search_index(self) -> bool:
+        """Create and fill the search index of databases created by older versions. Returns False if the index is missing and the database is read-only."""
+        if self._get_search_index_sql() is None:
+            if self.read_only:
+                return False
+            self._create_search_index()
+            self._rebuild_search_index()
+        elif self._search_index_stale and not self.read_only:
+            self._rebuild_search_index()
+        return True
+
+    def _search_index_rows(self, table:str) -> List:
+        """Get the rows of the search index for a layer."""
+        rows = [(table, "name", table)]
+        info = self._get_from_tables_info(table=table, col="info")
+        if info:
+            rows.append((table, "info", info))
+        rows.extend((table, "column", col) for col in self._get_table_column_names(table))
+        return rows
+
+    def _index_layer(self, table:str) -> None:
+        """Update the rows of a layer in the search index."""
+        if not self._ensure_search_index():
+            return
+        with self._transaction():
+            self._sqlite_execute_commit_query("DELETE FROM tables_search WHERE layer = ?", values=(table,))
+            if self._table_exists(table):
+                self._sqlite_executemany_commit_query("INSERT INTO tables_search (layer, kind, term) VALUES (?,?,?)", self._search_index_rows(table))
+
+    def _unindex_layer(self, table:str) -> None:
+        """Remove a layer from the search index."""
+        if self._get_search_index_sql() is not None and not self.read_only:
+            self._sqlite_execute_commit_query("DELETE FROM tables_search WHERE layer = ?", values=(table,))
+
+    def _rebuild_search_index(self) -> None:
+        """Fill the search index with all layers."""
+        with self._transaction():
+            self._sqlite_execute_commit_query("DELETE FROM tables_search")
+            rows = []
+            for table in self._get_tables_names():
+                rows.extend(self._search_index_rows(table))
+            self._sqlite_executemany_commit_query("INSERT INTO tables_search (layer, kind, term) VALUES (?,?,?)", rows)
+        self._search_index_stale = False
+
+    def _search_layers(self, term:str, fuzzy:bool=False) -> pd.DataFrame:
+        """
+        Search the index for a term.
+
+        Parameters
+        ----------
+        term: str
+            The term to search. Matched case-insensitively as substring of layer names, descriptions and columns.
+        fuzzy: bool
+            If True, layer names and columns similar to the term are also matched.
+
+        Returns
+        -------
+        pandas.DataFrame with the matched layer, the kind of the matched term ("name", "info" or "column"), the matched term and its score. Exact matches score 1, prefix matches 0.8, substring matches 0.6 and fuzzy matches up to 0.5.
+        """
+        if not self._ensure_search_index():
+            raise ValueError("The database has no search index. Open it once without read_only to build the index.")
+        searchSql = self._get_search_index_sql()
+        # The trigram index serves MATCH of terms with at least three characters. Shorter terms are searched by scanning the index.
+        if "fts5" in searchSql.lower() and len(term) >= 3:
+            condition, value = "term MATCH ?", '"{}"'.format(term.replace('"', '""'))
+        else:
+            condition, value = "instr(lower(term), lower(?)) > 0", term
+        query = f"""SELECT layer, kind, term,
+                CASE WHEN lower(term) = lower(?) THEN 1.0 WHEN instr(lower(term), lower(?)) = 1 THEN 0.8 ELSE 0.6 END AS score
+                FROM tables_search WHERE {condition}"""
+        hits = self._sqlite_execute_fetch_query(query, values=(term, term, value), fetchall=True)
+
+        if fuzzy:
+            trigrams = {term.lower()[i:i+3] for i in range(len(term) - 2)}
+            if "fts5" in searchSql.lower() and trigrams:
+                match = " OR ".join('"{}"'.format(trigram.replace('"', '""')) for trigram in trigrams)
+                query = "SELECT layer, kind, term FROM tables_search WHERE term MATCH ? AND kind != 'info' ORDER BY bm25(tables_search) LIMIT 1000"
+                candidates = self._sqlite_execute_fetch_query(query, values=(match,), fetchall=True)
+            else:
+                candidates = self._sqlite_execute_fetch_query("SELECT layer, kind, term FROM tables_search WHERE kind != 'info'", fetchall=True)
+            matched = {(layer, kind, text) for layer,kind,text,_ in hits}
+            for layer, kind, text in candidates:
+                similarity = difflib.SequenceMatcher(None, term.lower(), text.lower()).ratio()
+                if (layer, kind, text) not in matched and similarity >= 0.75:
+                    hits.append((layer, kind, text, 0.5 * similarity))
+        return pd.DataFrame(hits, columns=['layer', 'kind', 'term', 'score'])
+
+    def _get_indexes(self, table:str) -> List:
+        """
+        Get the secondary indexes of a table. Cached in the catalog.
+
+        Parameters
+        ----------
+        table: str
+            Name of the table.
+
+        Returns
+        -------
+        List of dictionaries with the name, the indexed columns and the uniqueness of each index.
+        """
+        def load():
+            indexes = []
+            query = f"SELECT name, \"unique\" FROM PRAGMA_INDEX_LIST('{table}') WHERE origin = 'c' ORDER BY name"
+            for name, unique in self._sqlite_execute_fetch_query(query, fetchall=True):
+                query = f"SELECT name FROM PRAGMA_INDEX_INFO('{name}') ORDER BY seqno"
+                cols = [res[0] for res in self._sqlite_execute_fetch_query(query, fetchall=True)]
+                indexes.append({'name':name, 'columns':cols, 'unique':bool(unique)})
+            return indexes
+        return self._catalog.get(("indexes", table), load)
+
+    def _create_index(self, table:str, cols:List, unique:bool=False, name:Union[str,None]=None) -> str:
+        """
+        Create a secondary index on one or more columns of a table.
+
+        Parameters
+        ----------
+        table: str
+            Name of the table.
+        cols: list
+            The columns to be indexed.
+        unique: bool
+            If True, the index enforces unique values.
+        name: str, None
+            The name of the index. If None, the name is created from the names of the table and the columns.
+
+        Returns
+        -------
+        The name of the index.
+        """
+        if name is None:
+            name = utils._index_name(table, cols)
+        uniqueString = "UNIQUE " if unique else ""
+        query = f'CREATE {uniqueString}INDEX "{name}" ON "{table}" ({",".join(utils._sanitize_column_names(cols))})'
         self._sqlite_execute_commit_query(query)
+        self._catalog.invalidate(table)
+        return name
+
+    def _drop_index(self, table:str, name:str) -> None:
+        """
+        Delete a secondary index of a table.
+
+        Parameters
+        ----------
+        table: str
+            Name of the table.
+        name: str
+            Name of the index.
+        """
+        self._sqlite_execute_commit_query(f'DROP INDEX IF EXISTS "{name}"')
+        self._catalog.invalidate(table)
 
     def _get_tables_names(self, tag:str=None) -> List:
         """
@@ -67,37 +522,76 @@ class DButils:
         -------
         List of fetched tables.
         """
-        if tag is None:
-            query = f"SELECT name FROM tables_info"
-        else:
-            query = f"SELECT name FROM tables_info WHERE tag='{tag}'"
-        results = self._sqlite_execute_fetch_query(query, fetchall=True)
-        if results:
-            tables = [res[0] for res in results]
-        else:
-            tables = []
-        return tables
+        return [row['name'] for row in self._get_tables_metadata() if tag is None or row['tag'] == tag]
+
+    def _get_tables_metadata(self) -> List:
+        """Get the name, tag and info of the rows of tables_info as dictionaries. Cached in the catalog."""
+        def load():
+            rows = self._sqlite_execute_fetch_query("SELECT name, tag, info FROM tables_info", fetchall=True)
+            return [{'name':name, 'tag':tag, 'info':info} for name,tag,info in rows]
+        return self._catalog.get(("tables",), load)
+
+    def _get_table_shape(self, table:str) -> str:
+        """Get the shape of a table as "{rows}x{columns}". The number of rows is taken from the statistics of the layer, or counted if it is missing or stale."""
+        return f"{self._count_rows(table)}x{len(self._get_table_column_names(table))}"
+
+    def _get_tables_shapes(self) -> dict:
+        """Get the shape of each table as "{rows}x{columns}". The numbers of rows are taken from the statistics of the layers, or counted if they are missing or stale. Cached in the catalog."""
+        def load():
+            # Loads the statistics of all layers with one query.
+            self._load_all_stats()
+            tables = self._get_all_tables_names()
+            shapes = {}
+            for name in self._get_tables_names():
+                if name in tables:
+                    shapes[name] = self._get_table_shape(name)
+            return shapes
+        return self._catalog.get(("shapes",), load)
+
+    def _get_all_tables_names(self) -> List:
+        """Get the names of all tables in the database, including the tables that are not layers. Cached in the catalog."""
+        def load():
+            query = "SELECT name FROM sqlite_master WHERE type = 'table'"
+            return [row[0] for row in self._sqlite_execute_fetch_query(query, fetchall=True)]
+        return self._catalog.get(("alltables",), load)
+
+    def _create_internal_table(self, table:str, data:pd.DataFrame) -> None:
+        """
+        Create a table that is not registered as a layer, e.g. the dictionary tables of matrix layers.
+
+        Parameters
+        ----------
+        table: str
+            The name of the table.
+        data: pandas.DataFrame
+            The initial rows of the table, possibly none, that also set the types of the columns.
+        """
+        with self._transaction():
+            query = 'CREATE TABLE "{}" ({})'.format(table, ", ".join(utils._dataframe_dtypes_to_sql_datatypes(data)))
+            self._sqlite_execute_commit_query(query)
+            if not data.empty:
+                query = f'INSERT INTO "{table}" VALUES {utils.create_query_placeholders(data)}'
+                self._sqlite_executemany_commit_query(query, utils._dataframe_to_sqlite_rows(data))
+        self._catalog.invalidate(table)
 
-    def _update_table_shape(self, table:str, nrows:int=0, ncols:int=0) -> None:
+    def _register_layer(self, table:str, shape:tuple) -> None:
         """
-        Update table's shape.
+        Add a layer whose data are not stored in a table of the database, e.g. a dense layer, to tables_info. The layer has no statistics, so its shape is not stored.
 
         Parameters
         ----------
         table: str
-            Name of table to update shape.
-        nrows: int
-            Number of new rows added.
-        ncols: int
-            Number of new columns added.
-        """
-        # Update table's shape
-        tableRows, tableCols = self._get_table_shape(table)
-        tableRows += nrows
-        tableCols += ncols
-        tableShape = f"{tableRows}x{tableCols}"
-        query = f"UPDATE tables_info SET shape='{tableShape}' WHERE name='{table}'"
-        self._sqlite_execute_commit_query(query)
+            The name of the layer.
+        shape: tuple
+            The number of rows and columns of the layer.
+        """
+        with self._transaction():
+            if self._table_exists(table):
+                self._drop_table(table)
+            query = "INSERT INTO tables_info (name) VALUES (?)"
+            self._sqlite_execute_commit_query(query, values=[table])
+        self._catalog.invalidate(table)
+        self._index_layer(table)
 
     def _table_exists(self, table:str) -> bool:
         tables = self._get_tables_names() 
@@ -117,18 +611,34 @@ class DButils:
             rowids = []
         return np.array(rowids)
 
-    def _get_table_shape(self, table:str) -> tuple:
-        query = f"SELECT shape from tables_info WHERE name='{table}'"
-        result = self._sqlite_execute_fetch_query(query, fetchall=False) 
-        if result:
-            Nrows, Ncols = result[0].split("x")
-            Nrows = int(Nrows)
-            Ncols = int(Ncols)
-        else:
-            Nrows, Ncols = 0, 0
-        return (Nrows, Ncols)
+    @contextlib.contextmanager
+    def _staged_keys(self, cols:List, values):
+        """
+        Stage a key set as a temporary table that is joined with a table, instead of passing the keys as literals in the query. The enclosed statements run in a transaction, so that they see the temporary table.
+
+        Parameters
+        ----------
+        cols: list
+            The key columns of the table.
+        values: list, numpy.ndarray, pandas.Series, pandas.DataFrame
+            The key values. For multiple key columns, a list of tuples or a pandas.DataFrame.
 
-    def _delete_rows(self, table:str, where_col:str, where_values:Union[str,int,float,List]) -> None:
+        Yields
+        ------
+        A tuple with the connection and the WHERE condition that matches the rows of the key set.
+        """
+        keys = utils._keys_dataframe(cols, values)
+        relation = f"_keys_{uuid.uuid4().hex}"
+        with self._transaction() as conn:
+            # Key columns without declared type take the affinity of the table columns they are compared to.
+            conn.execute(f"CREATE TEMP TABLE {relation} ({','.join(keys.columns)})")
+            try:
+                conn.executemany(f"INSERT INTO {relation} VALUES ({','.join('?' * keys.shape[1])})", utils._dataframe_to_sqlite_rows(keys))
+                yield conn, utils._keys_condition(cols, relation)
+            finally:
+                conn.execute(f"DROP TABLE temp.{relation}")
+
+    def _delete_rows(self, table:str, where_col:Union[str,List], where_values:Union[str,int,float,List]) -> None:
         """
         Delete one or more rows from table based on column values. 
 
@@ -136,20 +646,25 @@ class DButils:
         ----------
         table: str
             Name of existing table.
-        where_col: str
-            Name of column that will be used as reference to delete table rows.
+        where_col: str, list
+            Name of column that will be used as reference to delete table rows. A list of columns for composite keys.
         where_values: str, int, float, list
-            The values of the reference column that are in the rows to be deleted. 
+            The values of the reference column that are in the rows to be deleted. For composite keys, a list of tuples or a pandas.DataFrame. Lists of values are staged in a temporary table and the rows are found with a semi-join.
         """
-        if isinstance(where_values, str):
-            query = f"DELETE FROM {table} WHERE {where_col} = '{where_values}'"
-        elif isinstance(where_values, int) or isinstance(where_values, float):
-            query = f"DELETE FROM {table} WHERE {where_col} = {where_values}"
+        if isinstance(where_values, str) or isinstance(where_values, int) or isinstance(where_values, float):
+            query = f"DELETE FROM {table} WHERE {where_col} = ?"
+            with self._transaction():
+                deletedRows = self._sqlite_execute_commit_query(query, values=[where_values], get_changes=True)
+                self._update_stats(table, lambda layerStats: stats.remove_rows(layerStats, deletedRows))
+        else:
+            whereCols = [where_col] if isinstance(where_col, str) else list(where_col)
+            with self._staged_keys(whereCols, where_values) as (conn, condition):
+                deletedRows = self._sqlite_execute_commit_query(f"DELETE FROM {table} WHERE {condition}", get_changes=True)
+                self._update_stats(table, lambda layerStats: stats.remove_rows(layerStats, deletedRows))
+        if table == "tables_info":
+            self._catalog.invalidate()
         else:
-            values = ",".join(f"'{x}'" for x in where_values)
-            query = f"DELETE FROM {table} WHERE {where_col} IN ({values})"
-        deletedRows = self._sqlite_execute_commit_query(query, get_changes=True)
-        self._update_table_shape(table, nrows=(deletedRows * -1))
+            self._catalog.invalidate_shapes(table)
 
     def _drop_table(self, table:str) -> None: 
         """
@@ -160,9 +675,13 @@ class DButils:
         table: str
             Name of table to delete.
         """
-        query = f"DROP TABLE IF EXISTS {table}"
-        self._sqlite_execute_commit_query(query)
-        self._delete_rows(table="tables_info", where_col="name", where_values=table)
+        with self._transaction():
+            query = f"DROP TABLE IF EXISTS {table}"
+            self._sqlite_execute_commit_query(query)
+            if self._stats_table_exists():
+                self._sqlite_execute_commit_query("DELETE FROM tables_stats WHERE layer = ?", values=[table])
+            self._delete_rows(table="tables_info", where_col="name", where_values=table)
+            self._unindex_layer(table)
 
     def _create_table_from_pandas(self, table:str, data:pd.DataFrame) -> None:
         """
@@ -176,32 +695,31 @@ class DButils:
             A pandas.DataFrame object.
         """
 
-        if self._table_exists(table):
-            self._drop_table(table)
+        with self._transaction():
+            if self._table_exists(table):
+                self._drop_table(table)
 
-        try:
-            Nrows, Ncols = data.shape
-            query = "INSERT INTO tables_info (name,shape) VALUES (?,?)"
-            self._sqlite_execute_commit_query(query, values=(table,f"{Nrows}x{Ncols}"))
-        except Exception as error:
-            print(error)
-            if table in self._select_cols(table='tables_info', cols='name')['name'].values.tolist():
-                self._delete_rows(table='tables_info', where_col="name", where_values=table)
+            try:
+                query = "INSERT INTO tables_info (name) VALUES (?)"
+                self._sqlite_execute_commit_query(query, values=[table])
+            except Exception as error:
+                print(error)
+                if table in self._select_cols(table='tables_info', cols='name')['name'].values.tolist():
+                    self._delete_rows(table='tables_info', where_col="name", where_values=table)
 
-        try:
+            # Errors roll back the transaction, so that a partially created layer is not kept.
             query = 'CREATE TABLE "{}" ({})'.format(table, ", ".join(utils._dataframe_dtypes_to_sql_datatypes(data)))
             self._sqlite_execute_commit_query(query)
 
             queryPlaceHolders = utils.create_query_placeholders(data)
             sanitizedColumns = utils._sanitize_column_names(data.columns)
             query = f'INSERT INTO "{table}" ({",".join(sanitizedColumns)}) VALUES {queryPlaceHolders}'
-            self._sqlite_executemany_commit_query(query, [x.tolist() for x in data.to_records(index=False)])
-        except Exception as error:
-            print(error)
-            if self._table_exists(table):
-                self._drop_table(table)
+            self._sqlite_executemany_commit_query(query, utils._dataframe_to_sqlite_rows(data))
+            self._write_stats(table, stats.layer_stats(data.shape[0]))
+        self._catalog.invalidate(table)
+        self._index_layer(table)
 
-    def _select_cols(self, table:str, cols:Union[str,List], limit:Union[int,None]=None) -> pd.DataFrame:
+    def _select_cols(self, table:str, cols:Union[str,List], limit:Union[int,None]=None, backend:str="pandas") -> pd.DataFrame:
         """
         Select columns from specified table.
 
@@ -213,26 +731,85 @@ class DButils:
             The name of one or more columns to select. If string is "*" then all columns will be selected.
         limit: int, None
             Number of rows to fetch. If None, all rows will be fetched.
+        backend: str
+            The format of the fetched data. One of utils.BACKENDS.
 
         Returns
         -------
-        The selected columns from the specified table as pandas.DataFrame.
+        The selected columns from the specified table as pandas.DataFrame, or in the format of the given backend.
         """
         if isinstance(cols, str):
             if cols == "*":
-                cols = self._get_table_column_names(table)
+                colsString = "*"
             else:
-                cols = [cols]
-
-        colsString = ','.join(utils._sanitize_column_names(cols))
+                colsString = f'"{cols}"'
+        else:
+            colsString = ','.join(utils._sanitize_column_names(cols))
+        # rowid is fetched in the same statement to build the index.
         if limit is None:
-            query = f"SELECT {colsString} FROM {table}"
+            query = f"SELECT rowid,{colsString} FROM {table}"
         else:
-            query = f"SELECT {colsString} FROM {table} LIMIT {limit}"
-        data = self._sqlite_execute_fetch_query(query, fetchall=True)
-        df = pd.DataFrame(data, columns=cols)
-        return df.set_index(self._get_table_rowids(table, limit=limit))
+            query = f"SELECT rowid,{colsString} FROM {table} LIMIT {limit}"
+        result = self._fetch(query, backend=backend, table=table)
+        return utils._set_rowid_index(result, backend, name=None)
+
+    def _iter_batches(self, query:str, batch_size:int, backend:str="pandas", params:Union[List,dict,None]=None, table:Union[str,None]=None):
+        """
+        Execute a SELECT query and yield the result in batches of rows read with fetchmany.
 
+        Parameters
+        ----------
+        query: str
+            The SELECT query to execute.
+        batch_size: int
+            The maximum number of rows of each batch.
+        backend: str
+            One of utils.BACKENDS. With the "arrow" backend, pyarrow.RecordBatch objects are yielded.
+        params: list, dict, None
+            Values bound to the placeholders of the query.
+        table: str, None
+            The table the query selects from. If given, the columns of the batches get the dtypes of their declared types.
+        """
+        utils._check_backend(backend)
+        declaredTypes = self._get_table_column_types(table) if table is not None else {}
+        with self._connect() as conn:
+            with contextlib.closing(conn.cursor()) as c:
+                c.execute(query, params or ())
+                cols = [description[0] for description in c.description]
+                while True:
+                    rows = c.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    df = utils._sqlite_dataframe(rows, cols, declaredTypes)
+                    if backend == "arrow":
+                        yield utils._import_optional("pyarrow").RecordBatch.from_pandas(df, preserve_index=False)
+                    else:
+                        yield utils._convert_dataframe(df, backend)
+
+    def _fetch(self, query:str, backend:str="pandas", params:Union[List,dict,None]=None, table:Union[str,None]=None):
+        """
+        Execute a SELECT query and fetch the result in the format of the given backend. Column names are taken from the cursor description.
+
+        Parameters
+        ----------
+        query: str
+            The SELECT query to execute.
+        backend: str
+            One of utils.BACKENDS.
+        params: list, dict, None
+            Values bound to the placeholders of the query. The statements of the same query text are reused through the statement cache of the connection.
+        table: str, None
+            The table the query selects from. If given, the columns of the result get the dtypes of their declared types.
+        """
+        utils._check_backend(backend)
+        with self._connect() as conn:
+            with contextlib.closing(conn.cursor()) as c:
+                c.execute(query, params or ())
+                cols = [description[0] for description in c.description]
+                results = c.fetchall()
+        declaredTypes = self._get_table_column_types(table) if table is not None else {}
+        df = utils._sqlite_dataframe(results, cols, declaredTypes)
+        return utils._convert_dataframe(df, backend)
 
     def _get_table_column_names(self, table:str, sanitized:bool=False) -> List:
         """
@@ -247,15 +824,30 @@ class DButils:
         -------
         List with column names from given table.
         """
-        query = f"SELECT name FROM PRAGMA_TABLE_INFO('{table}');"
-        results = self._sqlite_execute_fetch_query(query, fetchall=True)
-        cols = [res[0] for res in results]
+        cols = list(self._get_table_column_types(table).keys())
         if sanitized:
-            cols = [f'"{res[0]}"' for res in results]
-        else:
-            cols = [res[0] for res in results]
+            cols = [f'"{col}"' for col in cols]
         return cols
 
+    def _get_table_column_types(self, table:str) -> dict:
+        """
+        Get the column names and their declared types from a table. Cached in the catalog.
+
+        Parameters
+        ----------
+        table: str
+            Name of table to fetch column types from.
+
+        Returns
+        -------
+        Dictionary with column names as keys and column types as values.
+        """
+        def load():
+            query = f"SELECT name, type FROM PRAGMA_TABLE_INFO('{table}');"
+            results = self._sqlite_execute_fetch_query(query, fetchall=True)
+            return {name:coltype for name,coltype in results}
+        return self._catalog.get(("columns", table), load)
+
     def _insert_rows(self, table:str, data:pd.DataFrame, ordered:bool=False) -> None:
         """
         Insert one or more rows to table using pandas.DataFrame object.
@@ -276,8 +868,10 @@ class DButils:
         queryPlaceHolders = utils.create_query_placeholders(data)
         sanitizedCols = utils._sanitize_column_names(data.columns)
         query = f"INSERT INTO {table} ({','.join(sanitizedCols)}) VALUES {queryPlaceHolders}"
-        self._sqlite_executemany_commit_query(query, [x.tolist() for x in data.to_records(index=False)])
-        self._update_table_shape(table, nrows=data.shape[0])
+        with self._transaction():
+            self._sqlite_executemany_commit_query(query, utils._dataframe_to_sqlite_rows(data))
+            self._update_stats(table, lambda layerStats: stats.insert_rows(layerStats, data))
+        self._catalog.invalidate_shapes(table)
 
     def _get_tables_info(self, tag:Union[None,str]=None) -> pd.DataFrame:
         """
@@ -288,14 +882,13 @@ class DButils:
         tag: None, str
             If None, info from all tables will be returned. If str, info from tables that belogn to group tag will be returned.
         """
-        cols = ['name', 'tag', 'shape', 'info']
-        if tag is None: 
-            query = f"SELECT {','.join(cols)} from tables_info"
-        else:
-            query = f"SELECT {','.join(cols)} from tables_info WHERE tag='{tag}'"
-        results = self._sqlite_execute_fetch_query(query, fetchall=True)
-        df = pd.DataFrame(results, columns=cols)
-        return df
+        tables = self._get_tables_metadata()
+        if tag is not None:
+            tables = [row for row in tables if row['tag'] == tag]
+        shapes = self._get_tables_shapes()
+        df = pd.DataFrame(tables, columns=['name', 'tag', 'info'])
+        df['shape'] = [shapes.get(name) for name in df['name']]
+        return df[['name', 'tag', 'shape', 'info']]
 
     def _rename_table(self, table:str, new_name:str) -> None:
         """
@@ -308,8 +901,13 @@ class DButils:
         new_name: str
             The new name of the table.
         """
-        query = f"ALTER TABLE {table} RENAME TO {new_name}"
-        self._sqlite_execute_commit_query(query)
+        with self._transaction():
+            query = f"ALTER TABLE {table} RENAME TO {new_name}"
+            self._sqlite_execute_commit_query(query)
+            if self._stats_table_exists() and not self.read_only:
+                self._sqlite_execute_commit_query("UPDATE tables_stats SET layer = ? WHERE layer = ?", values=[new_name, table])
+        self._catalog.invalidate(table)
+        self._catalog.invalidate(new_name)
 
     def _rename_column(self, table:str, col:str, new_name:str) -> None:
         """
@@ -324,10 +922,14 @@ class DButils:
         new_name: str
             New name of column.
         """
-        query = f'ALTER TABLE {table} RENAME COLUMN "{col}" TO "{new_name}"'
-        self._sqlite_execute_commit_query(query)
+        with self._transaction():
+            query = f'ALTER TABLE {table} RENAME COLUMN "{col}" TO "{new_name}"'
+            self._sqlite_execute_commit_query(query)
+            self._update_stats(table, lambda layerStats: stats.rename_column(layerStats, col, new_name))
+        self._catalog.invalidate(table)
+        self._index_layer(table)
 
-    def _select_rows(self, table:str, cols:Union[str,slice,List], where:str, values:Union[str,int,float,slice,np.ndarray,List], exclude:Union[str,List,None]=None) -> pd.DataFrame:
+    def _select_rows(self, table:str, cols:Union[str,slice,List], where:str, values:Union[str,int,float,slice,np.ndarray,List], exclude:Union[str,List,None]=None, backend:str="pandas") -> pd.DataFrame:
         """
         Select a given number of rows from a given table.
 
@@ -337,28 +939,36 @@ class DButils:
             Name of existing table.
         cols: str, slice, list
             Which columns to be included in the selected rows. If string is "*" then all columns will be selected.
-        where: str
-            Name of column that will be used as reference column to select rows.
+        where: str, list
+            Name of column that will be used as reference column to select rows. A list of columns for composite keys.
         values: str, int, float, slice, list, np.ndarray
-            Values of reference column that are in the rows to be selected.
+            Values of reference column that are in the rows to be selected. For composite keys, a list of tuples or a pandas.DataFrame. Lists of values are staged in a temporary table and the rows are found with a semi-join.
         exclude: None, str, list
             One or more columns to exclude when selecting rows. Useful when "*" is passed in the "cols" parameter.
+        backend: str
+            The format of the fetched data. One of utils.BACKENDS.
 
         Returns
         -------
-        Returns the rows of the columns specified by the "cols" parameter filtered by the values of reference columns as pandas.DataFrame.
+        Returns the rows of the columns specified by the "cols" parameter filtered by the values of reference columns as pandas.DataFrame, or in the format of the given backend.
         """
+        whereCols = [where] if isinstance(where, str) else list(where)
+        if len(whereCols) > 1 and (isinstance(values, (str, int, float, slice))):
+            raise ValueError("Pass a list of tuples or a pandas.DataFrame as values for composite keys.")
         if exclude is None:
             exclude = []
-        elif isinstance(exlude, str):
+        elif isinstance(exclude, str):
             exclude = [exclude]
 
+        if cols == "*" and exclude:
+            cols = self._get_table_column_names(table)
+
         if isinstance(cols, list):
-            cols = np.setdiff1d(np.array(cols), np.array(exclude)).tolist()
+            cols = [col for col in cols if col not in exclude]
             cols = ",".join(utils._sanitize_column_names(cols))
         elif isinstance(cols, slice):
             tableCols = self._get_table_column_names(table)
-            tableCols = np.setdiff1d(np.array(tableCols), np.array(exclude)).tolist()
+            tableCols = [col for col in tableCols if col not in exclude]
             start, end, _ = cols.start, cols.stop, cols.step
             if start is None and end is None:
                 cols = ",".join(utils._sanitize_column_names(tableCols))
@@ -370,65 +980,38 @@ class DButils:
                 else:
                     cols = ",".join(utils._sanitize_column_names(tableCols[start:end]))
 
-        if where != "rowid":
-            if where not in cols.split(","):
-                colsToSelectString = f'rowid,"{where}",{cols}'
-            else:
-                colsToSelectString = f'rowid,{cols}'
+        if cols != "*":
+            selected = [col.strip('"') for col in cols.split(",")]
+            missing = [f'"{col}"' for col in whereCols if col != "rowid" and col not in selected]
+            colsToSelectString = ",".join(['rowid'] + missing + [cols])
         else:
             colsToSelectString = f'rowid,{cols}'
 
-        if isinstance(values, str):
-            query = f'SELECT {colsToSelectString} FROM {table} WHERE {where} = "{values}"'
-        elif isinstance(values, int) or isinstance(values, float):
-            query = f'SELECT {colsToSelectString} FROM {table} WHERE {where} = {values}'
+        params = None
+        if isinstance(values, str) or isinstance(values, int) or isinstance(values, float):
+            query = f'SELECT {colsToSelectString} FROM {table} WHERE {where} = ?'
+            params = [values]
         elif isinstance(values, slice):
             start, end, _ = values.start, values.stop, values.step
             if start is None and end is None:
                 query = f'SELECT {colsToSelectString} FROM {table}'
             else:
-                rowIDS = self._get_table_rowids(table)
-                if start is None:
-                    start = rowIDS[0]
-                if end is None:
-                    end = rowIDS[-1]
-                else:
-                    end -= 1
-                query = f'SELECT {colsToSelectString} FROM {table} WHERE {where} BETWEEN {start} AND {end}'
+                bounds = []
+                if start is not None:
+                    bounds.append(f"{where} >= {start}")
+                if end is not None:
+                    bounds.append(f"{where} < {end}")
+                query = f'SELECT {colsToSelectString} FROM {table} WHERE {" AND ".join(bounds)}'
         else:
-            values = ",".join(f'"{x}"' for x in values)
-            query = f'SELECT {colsToSelectString} FROM {table} WHERE {where} IN ({values})'
-        results = self._sqlite_execute_fetch_query(query, fetchall=True)
-        df = pd.DataFrame(results, columns=[x.replace('"', '') for x in colsToSelectString.split(",")])
-        return df.set_index("rowid")
+            with self._staged_keys(whereCols, values) as (conn, condition):
+                result = self._fetch(f'SELECT {colsToSelectString} FROM {table} WHERE {condition}', backend=backend, table=table)
+            return utils._set_rowid_index(result, backend)
+        result = self._fetch(query, backend=backend, params=params, table=table)
+        return utils._set_rowid_index(result, backend)
 
-    def _execute_select_query(self, query) -> pd.DataFrame:
-        """Execute a SELECT query"""
-        results = self._sqlite_execute_fetch_query(query, fetchall=True)
-
-        pattern = r"(?i)select\s+([\w,\s\*\"]+)\s+from\s+(\w+)\s*"
-        match = re.search(pattern, query)
-
-        tableName = match.group(2).strip(" ")
-
-        cols = match.group(1).strip(" ")
-        if "," in cols:
-            cols = cols.split(",")
-            parsedCols = []
-            for col in cols:
-                col = col.strip(" ")
-                if col == "*":
-                    parsedCols.extend(self._get_table_column_names(tableName, sanitized=False))
-                else:
-                    parsedCols.append(col.replace('"', ''))
-            df = pd.DataFrame(results, columns=parsedCols)
-        else:
-            if col == "*":
-                cols = self._get_table_column_names(tableName, sanitized=False)
-            else:
-                cols = [cols.replace('"', '')]
-            df = pd.DataFrame(results, columns=cols)
-        return df
+    def _execute_select_query(self, query, backend:str="pandas", params:Union[List,dict,None]=None, table:Union[str,None]=None) -> pd.DataFrame:
+        """Execute a SELECT query. If the table the query selects from is given, the columns of the result get the dtypes of their declared types."""
+        return self._fetch(query, backend=backend, params=params, table=table)
 
     def _add_column(self, table:str, col:str, data:Union[pd.Series,np.ndarray,List], where_col:str="rowid", where_values:Union[pd.Series,np.ndarray,List]=None) -> None:
         """
@@ -455,18 +1038,13 @@ class DButils:
         if where_col != "rowid" and not where_values.any():
             raise ValueError("Pass values for WHERE clause if WHERE column is not rowid.")
 
-        if where_col == "rowid":
-            rowids = self._get_table_rowids(table)
-            data = utils.create_data_array_for_sqlite_query(data, rowids=rowids)
-        else:
-            data = [(val,row) for val,row in zip(data, where_values)] 
-
-        query = f'ALTER TABLE {table} ADD COLUMN "{col}" {sqlDtype}'
-        self._sqlite_execute_commit_query(query)
-
-        query = f'UPDATE {table} SET "{col}" = ? WHERE {where_col} = ?'
-        self._sqlite_executemany_commit_query(query, values=data)
-        self._update_table_shape(table, ncols=1)
+        with self._transaction():
+            query = f'ALTER TABLE {table} ADD COLUMN "{col}" {sqlDtype}'
+            self._sqlite_execute_commit_query(query)
+            newData = utils._to_dataframe(data, [col])
+            self._update_columns(table, newData, where_col=where_col, where_values=where_values)
+        self._catalog.invalidate(table)
+        self._index_layer(table)
 
     def _add_multiple_columns(self, table:str, cols:List, data:pd.DataFrame) -> None:
         """
@@ -484,17 +1062,16 @@ class DButils:
         coltypes = utils.convert_to_sqlite_dtypes(data)
         cols_n_types = [f'"{x}" {y}' for x,y in zip(cols, coltypes)]
 
-        for item in cols_n_types:
-            query = f"ALTER TABLE {table} ADD COLUMN {item}"
-            self._sqlite_execute_commit_query(query)
-        for i in range(len(data)):
-            values = data.iloc[i, :].values
-            updates = [f'"{col}" = {value}' for col,value in zip(cols, values)]
-            query = f'UPDATE {table} SET {','.join(updates)} WHERE rowid = {i}'
-            self._sqlite_execute_commit_query(query)
-        self._update_table_shape(table, ncols=len(cols))
+        with self._transaction():
+            for item in cols_n_types:
+                query = f"ALTER TABLE {table} ADD COLUMN {item}"
+                self._sqlite_execute_commit_query(query)
+            newData = utils._to_dataframe(data, cols)
+            self._update_columns(table, newData)
+        self._catalog.invalidate(table)
+        self._index_layer(table)
 
-    def _update_column(self, table:str, col:str, data:Union[pd.Series, np.ndarray, List]) -> None:
+    def _update_column(self, table:str, col:str, data:Union[pd.Series, np.ndarray, List], rowids:Union[np.ndarray,List,None]=None) -> None:
         """
         Update the data of a given column in the table.
 
@@ -506,11 +1083,47 @@ class DButils:
             The name of the column in the table.
         data: pd.Series, np.ndarray, list
             The data containing the new values for the column.
+        rowids: np.ndarray, list, None
+            The rowids of the rows to be updated. If None, data should hold a value for every row of the table.
+        """
+        self._update_columns(table, utils._to_dataframe(data, [col]), where_values=rowids)
+
+    def _update_columns(self, table:str, data:pd.DataFrame, where_col:str="rowid", where_values:Union[pd.Series,np.ndarray,List,None]=None) -> None:
+        """
+        Update one or more columns of the table with a single join-based UPDATE. The new values are staged in a temporary table that is joined to the table on the reference column.
+
+        Parameters
+        ----------
+        table: str
+            The name of the table of the columns to be updated.
+        data: pd.DataFrame
+            Dataframe whose columns hold the new values of the table columns with the same names.
+        where_col: str
+            Name of column whose values will be used as reference for the update.
+        where_values: pandas.Series, numpy.ndarray, list, None
+            Values of reference column for each row of data. If None, the rows of data are matched to the rows of the table in order.
         """
-        rowids = self._get_table_rowids(table)
-        data = utils.create_data_array_for_sqlite_query(data, rowids=rowids)
-        query = f'UPDATE {table} SET "{col}" = (?) WHERE rowid = (?)'
-        self._sqlite_executemany_commit_query(query, values=data)
+        if where_values is None:
+            if where_col != "rowid":
+                raise ValueError("Pass values for WHERE clause if WHERE column is not rowid.")
+            where_values = self._get_table_rowids(table)
+        if len(where_values) != len(data):
+            raise ValueError(f"Number of values ({len(data)}) does not match the number of rows to update ({len(where_values)}).")
+
+        tmp_table_data = data.reset_index(drop=True)
+        tmp_table_data.insert(0, "where_col_vals", np.asarray(where_values))
+        sanitizedCols = utils._sanitize_column_names(tmp_table_data.columns)
+        updates = ",".join(f'"{col}" = tmp_table."{col}"' for col in data.columns)
+        with self._transaction():
+            self._sqlite_execute_commit_query("DROP TABLE IF EXISTS temp.tmp_table")
+            self._sqlite_execute_commit_query(f"CREATE TEMP TABLE tmp_table ({','.join(sanitizedCols)})")
+            query = f"INSERT INTO tmp_table VALUES {utils.create_query_placeholders(tmp_table_data)}"
+            self._sqlite_executemany_commit_query(query, utils._dataframe_to_sqlite_rows(tmp_table_data))
+            query = f'UPDATE {table} SET {updates} FROM tmp_table WHERE "{table}".{where_col} = tmp_table.where_col_vals'
+            self._sqlite_execute_commit_query(query)
+            self._sqlite_execute_commit_query("DROP TABLE tmp_table")
+            self._update_stats(table, lambda layerStats: stats.mark_stale(layerStats, list(data.columns)))
+        self._catalog.invalidate_data(table)
 
     def _update_tables_info(self, table:str, col:str, value:str) -> None:
         """
@@ -527,6 +1140,12 @@ class DButils:
         """
         query = f'UPDATE tables_info SET "{col}" = (?) WHERE name = (?)'
         self._sqlite_execute_commit_query(query, values=(value, table))
+        self._catalog.invalidate(table)
+        if col == "name":
+            self._unindex_layer(table)
+            self._index_layer(value)
+        else:
+            self._index_layer(table)
 
     def _get_from_tables_info(self, table:str, col:str) -> Union[str,List]:
         """
@@ -543,11 +1162,14 @@ class DButils:
         -------
             One or more columns from tables_info for a given layer.
         """
-        query = f'SELECT {col} FROM tables_info WHERE name="{table}"'
-        result = self._sqlite_execute_fetch_query(query, fetchall=False)
-        if len(result) == 1:
-            result = result[0]
-        return result
+        if col == "shape":
+            return self._get_tables_shapes().get(table, [])
+        for row in self._get_tables_metadata():
+            if row['name'] == table:
+                if col == "*":
+                    return [row['name'], row['tag'], self._get_tables_shapes().get(table), row['info']]
+                return row[col]
+        return []
 
     def _drop_column(self, table:str, col=str) -> None:
         """
@@ -560,18 +1182,61 @@ class DButils:
         col: str
             Name of column to delete.
         """
-        query = f'ALTER TABLE {table} DROP "{col}"'
-        self._sqlite_execute_commit_query(query)
-        self._update_table_shape(table, ncols=-1)
-
-    def _run_query(self, query:str, fetchdf=False) -> Union[pd.DataFrame, None]:
-        """Run an arbritary query."""
-        if not fetchdf:
+        with self._transaction():
+            # SQLite can not drop indexed columns.
+            for index in self._get_indexes(table):
+                if col in index['columns']:
+                    self._drop_index(table, index['name'])
+            query = f'ALTER TABLE {table} DROP "{col}"'
             self._sqlite_execute_commit_query(query)
-        else:
-            cols = query.split(" ", 1)[1]
-            cols = cols.lower().split("from")[0].strip(" ")
-            data = self._sqlite_execute_fetch_query(query, fetchall=True)
-            df = pd.DataFrame(data, columns=cols)
-            return df
+            self._update_stats(table, lambda layerStats: stats.drop_column(layerStats, col))
+        self._catalog.invalidate(table)
+        self._index_layer(table)
+
+    def _convert_to_enum(self, table:str, col:str) -> None:
+        """
+        SQLite has no ENUM type. Columns of strings are kept as TEXT.
+
+        Parameters
+        ----------
+        table: str
+            Name of table that has the column.
+        col: str
+            Name of column to convert.
+        """
+        pass
+
+    def _create_genomic_layout(self, table:str, chrom_col:str, pos_col:str) -> None:
+        """
+        Index a table by chromosome and position so that queries for genomic regions read only the rows in the regions.
+
+        Parameters
+        ----------
+        table: str
+            Name of the table.
+        chrom_col: str
+            Name of the column with the chromosomes.
+        pos_col: str
+            Name of the column with the positions.
+        """
+        if not any(index['columns'] == [chrom_col, pos_col] for index in self._get_indexes(table)):
+            self._create_index(table, [chrom_col, pos_col])
+
+    def _run_query(self, query:str, fetchdf=False, params:Union[List,dict,None]=None) -> Union[pd.DataFrame, None]:
+        """Run an arbritary query. The statistics of the layers the query may have written are marked to be recomputed."""
+        written = utils._written_tables(query)
+        try:
+            if not fetchdf:
+                self._sqlite_execute_commit_query(query, values=params)
+                result = None
+            else:
+                result = self._fetch(query, params=params)
+            if written is not None:
+                self._search_index_stale = True
+                self._mark_stats_stale(written)
+            return result
+        finally:
+            # A write may have changed any layer. Reads keep the cached metadata and results.
+            if written is not None:
+                self._catalog.invalidate()
 
@@ -1,34 +1,166 @@
+import re
 import duckdb
 import numpy as np
 import pandas as pd
 from typing import List, Union
+import importlib
 import warnings
 
+# Output formats of layer reads. "pandas_pyarrow" is a pandas.DataFrame with pyarrow-backed dtypes.
+BACKENDS = ["pandas", "pandas_pyarrow", "arrow", "polars", "numpy"]
+
+# DuckDB types of numpy and pandas dtypes. Nullable pandas dtypes are mapped as their numpy counterparts.
+DUCKDB_TYPES = {
+    "bool":"BOOLEAN", "int8":"TINYINT", "int16":"SMALLINT", "int32":"INTEGER", "int64":"BIGINT",
+    "uint8":"UTINYINT", "uint16":"USMALLINT", "uint32":"UINTEGER", "uint64":"UBIGINT",
+    "float32":"FLOAT", "float64":"DOUBLE", "datetime":"TIMESTAMP", "datetimetz":"TIMESTAMPTZ",
+    }
+
+# SQLite declared types of numpy and pandas dtypes. SQLite stores integers in as few bytes as their values need, but the declared type is used to restore the dtype on read.
+# Declared types that contain "INT" have integer affinity and those that contain "TEXT" have text affinity. INTEGER, REAL and TEXT are the types of layers created by older versions.
+# INT32 and UINT32 are used instead of the standard INT, which is also declared by arbitrary queries (e.g. ALTER TABLE ... ADD COLUMN x INT) for 64-bit values.
+SQLITE_TYPES = {
+    "bool":"BOOLEAN", "int8":"TINYINT", "int16":"SMALLINT", "int32":"INT32", "int64":"INTEGER",
+    "uint8":"UTINYINT", "uint16":"USMALLINT", "uint32":"UINT32", "uint64":"UBIGINT",
+    "float32":"FLOAT", "float64":"REAL", "category":"ENUM TEXT", "datetime":"TIMESTAMP", "datetimetz":"TIMESTAMPTZ",
+    }
+
+# Dtypes of the SQLite declared types that pandas does not infer from the fetched values.
+SQLITE_DTYPES = {sqlType:dtype for dtype,sqlType in SQLITE_TYPES.items() if dtype not in ["int64", "float64"]}
+
+# First keywords of statements that only read, e.g. SELECT, or that change settings of the connection, e.g. PRAGMA and SET.
+READ_STATEMENTS = ["SELECT", "WITH", "VALUES", "FROM", "TABLE", "EXPLAIN", "DESCRIBE", "DESC", "SHOW", "SUMMARIZE", "PIVOT", "UNPIVOT", "PRAGMA", "SET", "RESET"]
+
+# Clauses of statements that write to a table, followed by the name of the table.
+WRITE_TARGET = re.compile(r'\b(?:INSERT\s+(?:OR\s+\w+\s+)?INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM|TRUNCATE(?:\s+TABLE)?|COPY|(?:ALTER|DROP)\s+(?:TABLE|VIEW)(?:\s+IF\s+EXISTS)?|CREATE\s+(?:OR\s+REPLACE\s+)?(?:TEMP(?:ORARY)?\s+)?(?:TABLE|VIEW)(?:\s+IF\s+NOT\s+EXISTS)?)\s+((?:(?:"(?:[^"]|"")+"|\w+)\.)*(?:"(?:[^"]|"")+"|\w+))', re.IGNORECASE)
+
+# Nullable pandas dtypes used on read when a column has missing values.
+NULLABLE_DTYPES = {
+    "bool":"boolean", "int8":"Int8", "int16":"Int16", "int32":"Int32", "int64":"Int64",
+    "uint8":"UInt8", "uint16":"UInt16", "uint32":"UInt32", "uint64":"UInt64",
+    }
+
+def _dtype_key(dtype) -> str:
+    """Name of a numpy or pandas dtype in the keys of DUCKDB_TYPES and SQLITE_TYPES. Nullable dtypes have the name of their numpy counterparts."""
+    if isinstance(dtype, pd.CategoricalDtype):
+        return "category"
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        return "datetimetz"
+    name = str(dtype).lower()
+    if name.startswith("datetime64"):
+        return "datetime"
+    if name == "boolean":
+        return "bool"
+    return name
+
+def _duckdb_type(values:pd.Series) -> str:
+    """DuckDB type of the values of a column. Categoricals of strings are stored as ENUM with the same categories."""
+    key = _dtype_key(values.dtype)
+    if key == "category":
+        categories = values.cat.categories
+        if categories.dtype.kind in "OUT" or pd.api.types.is_string_dtype(categories.dtype):
+            labels = ",".join("'{}'".format(str(label).replace("'", "''")) for label in categories)
+            return f"ENUM({labels})"
+        key = _dtype_key(categories.dtype)
+    return DUCKDB_TYPES.get(key, "VARCHAR")
+
 def convert_to_duckdb_dtypes(data:Union[pd.DataFrame, pd.Series, np.array, List]) -> List:
     """Convert data types of input data to duckdb data types."""
-    duckdbDtypes = []
     data = pd.DataFrame(data)
-    for col in data.columns:
-        if data[col].dtype == "int":
-            duckdbDtypes.append("INTEGER")
-        elif data[col].dtype == "float":
-            duckdbDtypes.append("DOUBLE")
-        else:
-            duckdbDtypes.append("VARCHAR")
-    return duckdbDtypes
+    return [_duckdb_type(data.iloc[:, i]) for i in range(data.shape[1])]
 
 def convert_to_sqlite_dtypes(data:Union[pd.DataFrame, pd.Series, np.array, List]) -> List:
     """Convert data types of input data to sqlite data types."""
-    sqliteDtypes = []
     data = pd.DataFrame(data)
+    return [SQLITE_TYPES.get(_dtype_key(dtype), "TEXT") for dtype in data.dtypes]
+
+def _restore_sqlite_dtypes(data:pd.DataFrame, declaredTypes:dict) -> pd.DataFrame:
+    """
+    Convert the columns of a result fetched from SQLite to the dtypes of their declared types.
+
+    Parameters
+    ----------
+    data: pandas.DataFrame
+        The fetched result.
+    declaredTypes: dict
+        The declared type of each column of the table the result was fetched from.
+    """
     for col in data.columns:
-        if data[col].dtype == "int":
-            sqliteDtypes.append("INTEGER")
-        elif data[col].dtype == "float":
-            sqliteDtypes.append("REAL")
+        dtype = SQLITE_DTYPES.get(declaredTypes.get(col))
+        if dtype is None:
+            continue
+        values = data[col]
+        if dtype == "category":
+            data[col] = values.astype("category")
+        elif dtype == "datetime":
+            data[col] = pd.to_datetime(values, format="ISO8601")
+        elif dtype == "datetimetz":
+            data[col] = pd.to_datetime(values, format="ISO8601", utc=True)
         else:
-            sqliteDtypes.append("TEXT")
-    return sqliteDtypes
+            if dtype in NULLABLE_DTYPES and dtype != "bool" and not _fits_integer_dtype(values, dtype):
+                # Values written by arbitrary queries may not fit the declared type and are kept as 64-bit integers.
+                dtype = "int64"
+            data[col] = values.astype(NULLABLE_DTYPES[dtype] if values.isna().any() and dtype in NULLABLE_DTYPES else dtype)
+    return data
+
+def _fits_integer_dtype(values:pd.Series, dtype:str) -> bool:
+    """Check whether the non-null values of a column are within the range of an integer dtype."""
+    notNull = values.dropna()
+    if len(notNull) == 0:
+        return True
+    info = np.iinfo(dtype)
+    return info.min <= notNull.min() and notNull.max() <= info.max
+
+def _sqlite_dataframe(rows:List, cols:List, declaredTypes:dict) -> pd.DataFrame:
+    """
+    Create a pandas.DataFrame from the rows fetched from SQLite with the dtypes of the declared types of the columns. Integer columns with missing values get a nullable integer dtype, like with DuckDB, instead of float64, which would round integers above 2^53.
+
+    Parameters
+    ----------
+    rows: list
+        The fetched rows.
+    cols: list
+        The names of the columns.
+    declaredTypes: dict
+        The declared type of each column of the table the rows were fetched from.
+    """
+    data = pd.DataFrame(rows, columns=cols)
+    for i,col in enumerate(cols):
+        sqlType = declaredTypes.get(col, "").upper()
+        if "INT" not in sqlType:
+            continue
+        values = [row[i] for row in rows]
+        if None in values and all(isinstance(value, int) for value in values if value is not None):
+            data[col] = pd.array(values, dtype="UInt64" if sqlType == "UBIGINT" else "Int64")
+    return _restore_sqlite_dtypes(data, declaredTypes)
+
+def _duckdb_csv_type(dtype) -> str:
+    """DuckDB type of a dtype passed to pandas.read_csv. Strings that are not dtypes, e.g. DuckDB types, are passed as they are."""
+    try:
+        dtype = pd.api.types.pandas_dtype(dtype)
+    except TypeError:
+        return dtype
+    return DUCKDB_TYPES.get(_dtype_key(dtype), "VARCHAR")
+
+def convert_to_duckdb_csv_options(options:dict) -> dict:
+    """Convert pandas.read_csv keywords to the corresponding options of duckdb read_csv. Other options are passed as they are."""
+    pandasToDuckdb = {"sep":"delim", "delimiter":"delim", "skiprows":"skip", "na_values":"nullstr"}
+    duckdbOptions = {}
+    for key,value in options.items():
+        if key == "dtype":
+            if isinstance(value, dict):
+                duckdbOptions["types"] = {col:_duckdb_csv_type(dtype) for col,dtype in value.items()}
+            elif _duckdb_csv_type(value) == "VARCHAR":
+                duckdbOptions["all_varchar"] = True
+            else:
+                raise ValueError("The native csv reader takes a single dtype only for strings. Pass the dtypes as a dictionary by column.")
+        elif key == "header":
+            duckdbOptions["header"] = value is not None and value is not False
+        elif key == "compression":
+            duckdbOptions["compression"] = "auto" if value == "infer" else value
+        else:
+            duckdbOptions[pandasToDuckdb.get(key, key)] = value
+    return duckdbOptions
 
 def create_query_placeholders(data:Union[List, np.ndarray, pd.DataFrame, pd.Series]):
     if isinstance(data, pd.DataFrame):
@@ -102,16 +234,8 @@ def create_data_array_for_sqlite_query(data:Union[List, np.ndarray, pd.Series, p
 
 def _dataframe_dtypes_to_sql_datatypes(df:pd.DataFrame) -> List:
     sqlDataTypes = []
-    for item in df.dtypes.items():
-        colName, colType = item
-        if str(colType).startswith("int"):
-            sqlDataTypes.append(f'"{colName}" INTEGER')
-        elif str(colType).startswith("float"):
-            sqlDataTypes.append(f'"{colName}" REAL')
-        elif str(colType).startswith("object"):
-            sqlDataTypes.append(f'"{colName}" TEXT')
-        else:
-            sqlDataTypes.append(f'"{colName}" TEXT')
+    for colName,sqlType in zip(df.columns, convert_to_sqlite_dtypes(df)):
+        sqlDataTypes.append(f'"{colName}" {sqlType}')
     return sqlDataTypes
 
 def _sanitize_column_names(cols:Union[np.ndarray, List]) -> List:
@@ -119,3 +243,172 @@ def _sanitize_column_names(cols:Union[np.ndarray, List]) -> List:
     for col in cols:
         sanitizedCols.append(f'"{col}"')
     return sanitizedCols
+
+def _to_dataframe(data:Union[pd.DataFrame, pd.Series, np.ndarray, List], cols:List) -> pd.DataFrame:
+    """Convert column data to a pandas.DataFrame with a default index and the given column names."""
+    if isinstance(data, pd.DataFrame):
+        df = data.reset_index(drop=True)
+    elif isinstance(data, pd.Series):
+        df = data.reset_index(drop=True).to_frame()
+    else:
+        df = pd.DataFrame(data)
+    if df.shape[1] != len(cols):
+        raise ValueError(f"Data have {df.shape[1]} columns but {len(cols)} column names were passed.")
+    df.columns = cols
+    return df
+
+def _dataframe_to_sqlite_rows(data:pd.DataFrame):
+    """Iterate over the rows of a pandas.DataFrame as tuples of Python objects that sqlite3 can bind."""
+    columns = []
+    for i in range(data.shape[1]):
+        col = data.iloc[:, i]
+        if _dtype_key(col.dtype) in ["datetime", "datetimetz"]:
+            # Timestamps are stored as ISO 8601 strings, which the date functions of SQLite understand.
+            columns.append(col.astype(str).where(col.notna(), None).tolist())
+        elif _dtype_key(col.dtype) == "uint64" and col.max() > np.iinfo("int64").max:
+            raise ValueError(f"Column '{data.columns[i]}' has values above {np.iinfo('int64').max}, which SQLite cannot store as integers. Convert it to float64 or str.")
+        elif pd.api.types.is_extension_array_dtype(col.dtype):
+            columns.append(col.astype(object).where(col.notna(), None).tolist())
+        else:
+            columns.append(col.to_numpy().tolist())
+    return zip(*columns)
+
+def _keys_dataframe(cols:List, values) -> pd.DataFrame:
+    """
+    Key set for selecting or deleting the rows of a table by the values of one or more columns.
+
+    Parameters
+    ----------
+    cols: list
+        The key columns of the table.
+    values: list, numpy.ndarray, pandas.Series, pandas.DataFrame
+        The key values. For multiple key columns, a list of tuples or a pandas.DataFrame with one column per key column.
+
+    Returns
+    -------
+    pandas.DataFrame with the columns k0, k1, ... in the order of the key columns.
+    """
+    names = [f"k{i}" for i in range(len(cols))]
+    if isinstance(values, pd.DataFrame):
+        keys = values[cols] if set(cols).issubset(values.columns) else values
+        keys = keys.reset_index(drop=True)
+    elif len(cols) == 1:
+        keys = pd.DataFrame({names[0]:pd.Series(values).to_numpy()})
+    else:
+        if isinstance(values, tuple):
+            values = [values]
+        keys = pd.DataFrame(list(values))
+    if keys.shape[1] != len(cols):
+        raise ValueError(f"Key values should have {len(cols)} column(s), one for each of: {', '.join(cols)}.")
+    keys.columns = names
+    return keys
+
+def _keys_condition(cols:List, relation:str) -> str:
+    """WHERE condition that matches the rows whose key columns are in the staged key set."""
+    names = ",".join(f"k{i}" for i in range(len(cols)))
+    if len(cols) == 1:
+        return f'"{cols[0]}" IN (SELECT {names} FROM {relation})'
+    return f'({",".join(_sanitize_column_names(cols))}) IN (SELECT {names} FROM {relation})'
+
+def _index_name(table:str, cols:List) -> str:
+    """Default name of the index of a table on the given columns."""
+    return re.sub(r"\W", "_", f"idx_{table}_{'_'.join(cols)}")
+
+def _written_tables(query:str) -> Union[List,None]:
+    """
+    Tables that an arbitrary query may write, i.e. the tables after its INSERT, UPDATE, DELETE, COPY, CREATE, ALTER and DROP clauses.
+
+    Returns
+    -------
+    None if the query only reads or changes settings. Otherwise, the list of the written tables, which is empty for writes to other objects (e.g. CREATE INDEX).
+    """
+    targets = []
+    for name in WRITE_TARGET.findall(query):
+        name = re.findall(r'"((?:[^"]|"")+)"|(\w+)', name)[-1]
+        targets.append(name[0].replace('""', '"') if name[0] else name[1])
+    statement = re.sub(r"^(?:\s|\(|--[^\n]*\n?|/\*.*?\*/)+", "", query, flags=re.DOTALL)
+    firstKeyword = re.match(r"\w*", statement).group(0).upper()
+    if firstKeyword in READ_STATEMENTS and not targets:
+        return None
+    return targets
+
+def _natural_sort_key(value:str) -> List:
+    """Sort key that orders numbers within strings by value (e.g. chr2 before chr10)."""
+    return [(0, int(part), "") if part.isdigit() else (1, 0, part) for part in re.split(r"(\d+)", str(value))]
+
+def _check_backend(backend:str) -> None:
+    """Raise error if backend is not supported."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend is not in supported backends: {BACKENDS}")
+
+def _import_optional(module:str):
+    """Import an optional dependency or raise an informative error."""
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise ImportError(f"Package '{module}' is required for this operation. Install it with 'pip install {module}'.") from None
+
+def _convert_dataframe(data:pd.DataFrame, backend:str):
+    """Convert pandas.DataFrame to the given backend."""
+    if backend == "pandas":
+        return data
+    elif backend == "numpy":
+        return {col:data[col].values for col in data.columns}
+    pa = _import_optional("pyarrow")
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    if backend == "arrow":
+        return table
+    elif backend == "pandas_pyarrow":
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    return _import_optional("polars").from_arrow(table)
+
+def _arrow_schema(declaredTypes:dict, typesByDtype:dict):
+    """
+    pyarrow.Schema of columns from their declared types, so that batches where a column has only nulls are written with the type of the column.
+
+    Parameters
+    ----------
+    declaredTypes: dict
+        The declared type of each column.
+    typesByDtype: dict
+        The declared types of the engine by dtype, i.e. DUCKDB_TYPES or SQLITE_TYPES. Other declared types are mapped by their SQLite affinity.
+    """
+    pa = _import_optional("pyarrow")
+    dtypes = {sqlType:dtype for dtype,sqlType in typesByDtype.items()}
+    fields = []
+    for col,sqlType in declaredTypes.items():
+        dtype = dtypes.get(sqlType.upper())
+        if dtype == "category":
+            arrowType = pa.dictionary(pa.int32(), pa.string())
+        elif dtype == "datetime":
+            arrowType = pa.timestamp("ns")
+        elif dtype == "datetimetz":
+            arrowType = pa.timestamp("ns", tz="UTC")
+        elif dtype is not None:
+            arrowType = pa.from_numpy_dtype(np.dtype(dtype))
+        elif "INT" in sqlType.upper():
+            arrowType = pa.int64()
+        elif re.search(r"REAL|FLOA|DOUB", sqlType.upper()):
+            arrowType = pa.float64()
+        else:
+            arrowType = pa.string()
+        fields.append(pa.field(col, arrowType))
+    return pa.schema(fields)
+
+def _set_rowid_index(data, backend:str, name:Union[str,None]="rowid"):
+    """Use rowid column as index for the pandas backends. The other backends keep rowid as column."""
+    if backend not in ["pandas", "pandas_pyarrow"]:
+        return data
+    data = data.set_index("rowid")
+    data.index.name = name
+    return data
+
+def _squeeze(data, backend:str):
+    """Return the values of single-column results as numpy.ndarray for the pandas and numpy backends."""
+    if backend in ["pandas", "pandas_pyarrow"] and data.shape[1] == 1:
+        return data.iloc[:, 0].values
+    elif backend == "numpy":
+        cols = [col for col in data.keys() if col != "rowid"]
+        if len(cols) == 1:
+            return data[cols[0]]
+    return data
@@ -0,0 +1,200 @@
+import re
+from typing import List, Union
+import pandas as pd
+
+# Value of the "col" column for the row that holds the number of rows of a layer.
+LAYER_ROW = ""
+
+# Columns of the tables_stats table.
+STATS_COLUMNS = ["layer", "col", "nrows", "nulls", "min_num", "max_num", "min_text", "max_text", "distinct_count", "stale"]
+
+# Number of columns whose statistics are computed by a single aggregate query.
+COLUMNS_PER_QUERY = 200
+
+
+def is_numeric_type(sqlType:str) -> bool:
+    """Check whether the declared SQL type of a column holds numbers. Booleans count as numbers."""
+    sqlType = sqlType.upper()
+    if sqlType.startswith("ENUM") or sqlType.startswith("INTERVAL"):
+        return False
+    return re.search(r"INT|REAL|FLOA|DOUB|DEC|NUMERIC|BOOL", sqlType) is not None
+
+def _empty_row(nrows:Union[int,None]=None) -> dict:
+    """Row of statistics. The number of rows is kept only in the row of the layer."""
+    return {"nrows":nrows, "nulls":None, "min_num":None, "max_num":None, "min_text":None, "max_text":None, "distinct_count":None, "stale":False}
+
+def column_stats(values:pd.Series, distinct:bool=True) -> dict:
+    """
+    Compute the statistics of the values of a column.
+
+    Parameters
+    ----------
+    values: pandas.Series
+        The values of the column.
+    distinct: bool
+        If False, the number of distinct values is not computed and is left unknown.
+    """
+    row = _empty_row()
+    notNull = values.dropna()
+    row["nulls"] = int(len(values) - len(notNull))
+    if distinct:
+        row["distinct_count"] = int(notNull.nunique())
+    if len(notNull) == 0:
+        return row
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        row["min_num"] = float(notNull.min())
+        row["max_num"] = float(notNull.max())
+    else:
+        text = notNull.astype(str)
+        row["min_text"] = text.min()
+        row["max_text"] = text.max()
+    return row
+
+def frame_stats(data:pd.DataFrame, distinct:bool=True) -> dict:
+    """Compute the statistics of a pandas.DataFrame as a dictionary with a row for the layer and a row for each column."""
+    layerStats = {LAYER_ROW:_empty_row(data.shape[0])}
+    for col in data.columns:
+        layerStats[str(col)] = column_stats(data[col], distinct=distinct)
+    return layerStats
+
+def layer_stats(nrows:int) -> dict:
+    """Statistics of a new layer that hold only its number of rows. The statistics of the columns are computed when they are requested."""
+    return {LAYER_ROW:_empty_row(nrows)}
+
+def set_nrows(layerStats:dict, nrows:int) -> dict:
+    """Store the counted number of rows of a layer. The statistics of the columns are kept."""
+    return {**layerStats, LAYER_ROW:_empty_row(nrows)}
+
+def _min(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+def _max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+def merge_stats(layerStats:dict, newStats:dict) -> dict:
+    """
+    Merge the statistics of inserted rows to the statistics of a layer. Counts, minimums and maximums stay exact. The number of distinct values becomes unknown, unless the layer was empty.
+    """
+    merged = {}
+    wasEmpty = layerStats[LAYER_ROW]["nrows"] == 0
+    for col,row in layerStats.items():
+        new = newStats.get(col)
+        if col == LAYER_ROW:
+            merged[col] = dict(row, nrows=row["nrows"] + new["nrows"])
+        elif new is None:
+            # Columns missing from the inserted rows are filled with nulls.
+            merged[col] = dict(row, nulls=None if row["nulls"] is None else row["nulls"] + newStats[LAYER_ROW]["nrows"])
+        else:
+            merged[col] = dict(row,
+                nulls=None if row["nulls"] is None else row["nulls"] + new["nulls"],
+                min_num=_min(row["min_num"], new["min_num"]),
+                max_num=_max(row["max_num"], new["max_num"]),
+                min_text=_min(row["min_text"], new["min_text"]),
+                max_text=_max(row["max_text"], new["max_text"]),
+                distinct_count=new["distinct_count"] if wasEmpty else None,
+                )
+    return merged
+
+def insert_rows(layerStats:dict, data:pd.DataFrame) -> dict:
+    """Merge the statistics of rows inserted to a layer. Only the columns that already have statistics are scanned."""
+    cols = [col for col in data.columns if str(col) in layerStats]
+    return merge_stats(layerStats, frame_stats(data[cols], distinct=False))
+
+def remove_rows(layerStats:dict, nrows:int) -> dict:
+    """Subtract deleted rows from the number of rows of a layer. The statistics of the columns are marked to be recomputed."""
+    removed = mark_stale(layerStats, [col for col in layerStats if col != LAYER_ROW])
+    removed[LAYER_ROW] = dict(layerStats[LAYER_ROW], nrows=layerStats[LAYER_ROW]["nrows"] - nrows)
+    return removed
+
+def rename_column(layerStats:dict, col:str, new_name:str) -> dict:
+    """Rename a column in the statistics of a layer."""
+    return {new_name if name == col else name:row for name,row in layerStats.items()}
+
+def drop_column(layerStats:dict, col:str) -> dict:
+    """Remove a column from the statistics of a layer."""
+    return {name:row for name,row in layerStats.items() if name != col}
+
+def mark_stale(layerStats:dict, cols:Union[List,None]=None) -> dict:
+    """Mark the statistics of the given columns, or of all columns and the number of rows, to be recomputed."""
+    cols = list(layerStats.keys()) if cols is None else cols
+    return {col:dict(row, stale=True) if col in cols else row for col,row in layerStats.items()}
+
+def needs_update(layerStats:dict, columns:List) -> tuple:
+    """Check which statistics have to be computed from the table. Returns whether the number of rows is needed and the list of columns."""
+    layerRow = layerStats.get(LAYER_ROW)
+    rowsNeeded = layerRow is None or layerRow["stale"]
+    cols = [col for col in columns if col not in layerStats or layerStats[col]["stale"] or layerStats[col]["distinct_count"] is None]
+    return rowsNeeded, cols
+
+def aggregate_queries(table:str, cols:List, types:dict, approximate:bool) -> List:
+    """
+    Aggregate queries that compute the statistics of the given columns. Each query returns one row with the number of non-null values, the minimum, the maximum and the number of distinct values of each column.
+
+    Parameters
+    ----------
+    table: str
+        The name of the table.
+    cols: list
+        The columns of the table.
+    types: dict
+        The declared SQL types of the columns.
+    approximate: bool
+        If True, the number of distinct values is approximated with approx_count_distinct (DuckDB).
+    """
+    queries = []
+    for start in range(0, len(cols), COLUMNS_PER_QUERY):
+        expressions = ["count(*)"]
+        for col in cols[start:start+COLUMNS_PER_QUERY]:
+            quoted = '"{}"'.format(col.replace('"', '""'))
+            value = f"CAST({quoted} AS DOUBLE)" if is_numeric_type(types[col]) else f"CAST({quoted} AS VARCHAR)" if approximate else f"CAST({quoted} AS TEXT)"
+            distinct = f"approx_count_distinct({quoted})" if approximate else f"count(DISTINCT {quoted})"
+            expressions.extend([f"count({quoted})", f"min({value})", f"max({value})", distinct])
+        queries.append((cols[start:start+COLUMNS_PER_QUERY], f"SELECT {','.join(expressions)} FROM {table}"))
+    return queries
+
+def parse_aggregate(result:tuple, cols:List, types:dict) -> dict:
+    """Statistics of columns from the result of a query of aggregate_queries."""
+    nrows = int(result[0])
+    layerStats = {LAYER_ROW:_empty_row(nrows)}
+    for i,col in enumerate(cols):
+        count, minimum, maximum, distinct = result[1 + 4*i:5 + 4*i]
+        row = _empty_row()
+        row["nulls"] = nrows - int(count)
+        row["distinct_count"] = int(distinct)
+        if is_numeric_type(types[col]):
+            row["min_num"], row["max_num"] = minimum, maximum
+        else:
+            row["min_text"], row["max_text"] = minimum, maximum
+        layerStats[col] = row
+    return layerStats
+
+def to_rows(table:str, layerStats:dict) -> List:
+    """Rows of tables_stats for the statistics of a layer."""
+    return [(table, col) + tuple(row[key] for key in STATS_COLUMNS[2:]) for col,row in layerStats.items()]
+
+def from_rows(rows:List) -> dict:
+    """Statistics of a layer from the rows of tables_stats without the layer column."""
+    layerStats = {}
+    for row in rows:
+        values = dict(zip(STATS_COLUMNS[1:], row))
+        col = values.pop("col")
+        values["stale"] = bool(values["stale"])
+        layerStats[col] = values
+    return layerStats
+
+def to_dataframe(layerStats:dict, columns:List) -> pd.DataFrame:
+    """Statistics of the columns of a layer as pandas.DataFrame."""
+    records = []
+    nrows = layerStats[LAYER_ROW]["nrows"]
+    for col in columns:
+        row = layerStats[col]
+        numeric = row["min_num"] is not None or row["min_text"] is None
+        records.append({
+            "column": col,
+            "count": nrows - row["nulls"],
+            "nulls": row["nulls"],
+            "min": row["min_num"] if numeric else row["min_text"],
+            "max": row["max_num"] if numeric else row["max_text"],
+            "distinct": row["distinct_count"],
+            })
+    return pd.DataFrame(records, columns=["column", "count", "nulls", "min", "max", "distinct"])
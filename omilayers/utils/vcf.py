@@ -0,0 +1,260 @@
+import gzip
+import itertools
+import re
+from typing import List, Union, Iterator, TextIO
+import numpy as np
+import pandas as pd
+
+# Columns of the VCF header line before the sample columns.
+FIXED_COLUMNS = ['CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', 'FORMAT']
+
+# Columns of the long layout that identify a variant.
+VARIANT_COLUMNS = ['CHROM', 'POS', 'ID', 'REF', 'ALT']
+
+# Pandas dtypes for the VCF types of INFO and FORMAT fields with a single value.
+VCF_DTYPES = {"Integer":"Int32", "Float":"float32", "Flag":"bool", "String":"str", "Character":"str"}
+
+# Order in which the dtypes of fields that are not defined in the meta lines are widened across chunks. None means that no value was seen.
+INFERRED_DTYPES = [None, "bool", "float32", "str"]
+
+
+def open_vcf(filename:str) -> TextIO:
+    """Open plain or gzip/bgzip compressed VCF file for reading."""
+    with open(filename, 'rb') as infile:
+        magic = infile.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(filename, 'rt')
+    return open(filename, 'rt')
+
+def read_vcf_header(handle:TextIO) -> tuple:
+    """
+    Read the meta lines and the header line of a VCF file.
+
+    Parameters
+    ----------
+    handle: TextIO
+        Opened VCF file. On return, the handle is positioned at the first record.
+
+    Returns
+    -------
+    A tuple with a dictionary that holds the INFO and FORMAT definitions by ID, and the list of column names.
+    """
+    meta = {"INFO":{}, "FORMAT":{}}
+    while True:
+        line = handle.readline()
+        if not line:
+            raise ValueError("VCF header line '#CHROM' was not found.")
+        if line.startswith("##"):
+            match = re.match(r"##(INFO|FORMAT)=<(.*)>", line.rstrip("\n"))
+            if match:
+                attributes = dict(re.findall(r'(\w+)=("[^"]*"|[^,]*)', match.group(2)))
+                meta[match.group(1)][attributes["ID"]] = attributes
+        elif line.startswith("#"):
+            return meta, line[1:].rstrip("\n").split("\t")
+
+def _field_dtype(definition:Union[dict,None]) -> Union[str,None]:
+    """Pandas dtype of INFO or FORMAT field from its definition in the meta lines. None if the field is not defined."""
+    if definition is None:
+        return None
+    if definition.get("Type") == "Flag":
+        return "bool"
+    if definition.get("Number") != "1":
+        return "str"
+    return VCF_DTYPES.get(definition.get("Type"), "str")
+
+def _infer_dtype(values:pd.Series) -> Union[str,None]:
+    """Infer dtype of field that is not defined in the meta lines. Numeric fields are stored as float32. None if the field has no values."""
+    values = values[values.notna() & (values != ".") & (values != "")]
+    if len(values) == 0:
+        return None
+    if pd.to_numeric(values, errors="coerce").notna().all():
+        return "float32"
+    return "str"
+
+def _widen(dtype:Union[str,None], other:Union[str,None]) -> Union[str,None]:
+    """Dtype that can hold the values of a field inferred as dtype in some chunks and as other in the rest."""
+    return max(dtype, other, key=INFERRED_DTYPES.index)
+
+def _convert(values:pd.Series, dtype:str, name:str) -> pd.Series:
+    """Convert values of field name from strings to dtype. Missing values ('.') become null for numeric fields."""
+    if dtype in ["Int32", "float32"]:
+        try:
+            return pd.to_numeric(values.where((values != ".") & (values != ""))).astype(dtype)
+        except (ValueError, TypeError) as error:
+            raise ValueError(f"Values of field '{name}' cannot be converted to {dtype}: {error}") from error
+    return values
+
+def _parse_info(info:pd.Series, keys:List, dtypes:dict, sep:str) -> pd.DataFrame:
+    """Split INFO column into one column per key."""
+    parsed = {}
+    escapedSep = re.escape(sep)
+    for key in keys:
+        escapedKey = re.escape(key)
+        if dtypes[key] == "bool":
+            parsed[key] = info.str.contains(rf"(?:^|{escapedSep}){escapedKey}(?:{escapedSep}|$)", regex=True)
+        else:
+            values = info.str.extract(rf"(?:^|{escapedSep}){escapedKey}=([^{escapedSep}]*)", expand=False)
+            parsed[key] = _convert(values, dtypes[key], key)
+    return pd.DataFrame(parsed, index=info.index)
+
+def _discover_info_keys(info:pd.Series, sep:str) -> dict:
+    """Find INFO keys and infer their dtypes. Keys without values are flags."""
+    items = info[info != "."].str.split(sep).explode()
+    items = items[items.notna() & (items != "")].str.split("=", n=1, expand=True)
+    if items.shape[1] == 1:
+        items[1] = None
+    keys = {}
+    for key, values in items.groupby(0, sort=False)[1]:
+        if values.isna().all():
+            keys[key] = "bool"
+        else:
+            keys[key] = _infer_dtype(values)
+    return keys
+
+def _split_format(values:pd.Series, subfields:List, fields:List) -> dict:
+    """Split sample values into the requested FORMAT fields. Fields missing from FORMAT are null."""
+    parts = values.str.split(":", expand=True)
+    result = {}
+    for field in fields:
+        if field in subfields and subfields.index(field) < parts.shape[1]:
+            result[field] = parts[subfields.index(field)]
+        else:
+            result[field] = pd.Series(None, index=values.index, dtype=object)
+    return result
+
+def _split_samples(chunk:pd.DataFrame, samples:List, fields:List) -> dict:
+    """Split the values of all samples into the requested FORMAT fields. Each field has one value per variant and sample, ordered by variant."""
+    values = pd.Series(chunk[samples].to_numpy().ravel())
+    formats = pd.Series(np.repeat(chunk["FORMAT"].values, len(samples)))
+    columns = {field:[] for field in fields}
+    for fmt in formats.unique():
+        splitted = _split_format(values[formats == fmt], fmt.split(":"), fields)
+        for field in fields:
+            columns[field].append(splitted[field])
+    return {field:pd.concat(columns[field]).reindex(values.index) for field in fields}
+
+def _iter_records(filename:str, header:List, chunksize:int) -> Iterator[pd.DataFrame]:
+    """Read the records of a VCF file in chunks of strings."""
+    with open_vcf(filename) as handle:
+        read_vcf_header(handle)
+        yield from pd.read_csv(handle, sep="\t", header=None, names=header, dtype=str, na_filter=False, chunksize=chunksize)
+
+def _scan_dtypes(records:Iterator[pd.DataFrame], samples:List, infoKeys:bool, formatFields:List, sep:str) -> tuple:
+    """
+    Infer the dtypes of the INFO keys and the FORMAT fields that are not defined in the meta lines from all records.
+
+    Parameters
+    ----------
+    records: iterator
+        Chunks of the records of the VCF file.
+    samples: list
+        The sample columns.
+    infoKeys: bool
+        If True, the INFO keys of all records are collected.
+    formatFields: list
+        The FORMAT fields whose dtypes are inferred.
+    sep: str
+        The separator of the INFO key/value pairs.
+
+    Returns
+    -------
+    A tuple with the dtypes of the INFO keys by key in order of appearance and the dtypes of the FORMAT fields.
+    """
+    infoDtypes = {}
+    formatDtypes = {field:None for field in formatFields}
+    for chunk in records:
+        if infoKeys:
+            for key,dtype in _discover_info_keys(chunk["INFO"], sep).items():
+                infoDtypes[key] = _widen(infoDtypes.get(key), dtype)
+        if formatFields:
+            for field,values in _split_samples(chunk, samples, formatFields).items():
+                formatDtypes[field] = _widen(formatDtypes[field], _infer_dtype(values))
+    infoDtypes = {key:dtype or "str" for key,dtype in infoDtypes.items()}
+    formatDtypes = {field:dtype or "str" for field,dtype in formatDtypes.items()}
+    return infoDtypes, formatDtypes
+
+def iter_vcf_chunks(filename:str, fields:Union[List,None]=None, layout:str="wide", info:Union[bool,List]=True, info_sep:str=";", chunksize:int=100000) -> Iterator[pd.DataFrame]:
+    """
+    Stream a VCF file as typed pandas.DataFrame chunks.
+
+    Parameters
+    ----------
+    filename: str
+        Plain or gzip compressed VCF file.
+    fields: list, None
+        FORMAT fields to be stored for each sample. If None, the fields in the FORMAT of the first record are used.
+    layout: str
+        If "wide", each chunk has one row per variant and one column per sample and field named as "{sample}_{field}". If "long", each chunk has one row per variant and sample with the columns CHROM, POS, ID, REF, ALT, SAMPLE and one column per field.
+    info: bool, list
+        Only for the wide layout. If True, all INFO keys are stored in separate columns. If list, only the given keys are stored. If False, the INFO column is stored as is.
+    info_sep: str
+        The separator of the INFO key/value pairs.
+    chunksize: int
+        The number of variants in each chunk.
+
+    Yields
+    ------
+    pandas.DataFrame with POS as int32, QUAL as float32 and typed INFO/FORMAT fields. The types of INFO keys and FORMAT fields that are not defined in the meta lines are inferred from all records. Values of numeric fields that cannot be converted raise ValueError.
+    """
+    if layout not in ["wide", "long"]:
+        raise ValueError("Layout should be 'wide' or 'long'.")
+    with open_vcf(filename) as handle:
+        meta, header = read_vcf_header(handle)
+        samples = header[len(FIXED_COLUMNS):]
+        reader = pd.read_csv(handle, sep="\t", header=None, names=header, dtype=str, na_filter=False, chunksize=chunksize)
+        first = next(reader, None)
+        if first is None:
+            return
+        if fields is None:
+            fields = first["FORMAT"].iloc[0].split(":") if samples else []
+        fields = fields if samples else []
+
+        # Types of fields missing from the meta lines are inferred from all records, so that every chunk has the same columns and dtypes.
+        formatDtypes = {field:_field_dtype(meta["FORMAT"].get(field)) for field in fields}
+        formatDtypes = {field:"str" if dtype is None and field == "GT" else dtype for field,dtype in formatDtypes.items()}
+        infoDtypes = None
+        if layout == "wide" and info is not False:
+            infoDtypes = {key:_field_dtype(definition) for key,definition in meta["INFO"].items()}
+            if info is not True:
+                infoDtypes = {key:infoDtypes.get(key) for key in info}
+        discoverInfo = infoDtypes is not None and (not infoDtypes or None in infoDtypes.values())
+        undefinedFields = [field for field,dtype in formatDtypes.items() if dtype is None]
+        if discoverInfo or undefinedFields:
+            discovered, inferred = _scan_dtypes(_iter_records(filename, header, chunksize), samples, discoverInfo, undefinedFields, info_sep)
+            formatDtypes.update(inferred)
+            if not infoDtypes:
+                infoDtypes = discovered
+            elif discoverInfo:
+                infoDtypes = {key:discovered.get(key, "str") if dtype is None else dtype for key,dtype in infoDtypes.items()}
+
+        for chunk in itertools.chain([first], reader):
+            df = pd.DataFrame({
+                "CHROM": chunk["CHROM"],
+                "POS": chunk["POS"].astype("int32"),
+                "ID": chunk["ID"],
+                "REF": chunk["REF"],
+                "ALT": chunk["ALT"],
+                })
+            sampleValues = _split_samples(chunk, samples, fields) if fields else {}
+            Nvariants, Nsamples = len(chunk), len(samples)
+
+            if layout == "wide":
+                df["QUAL"] = _convert(chunk["QUAL"], "float32", "QUAL")
+                df["FILTER"] = chunk["FILTER"]
+                if info is False:
+                    df["INFO"] = chunk["INFO"]
+                else:
+                    df = pd.concat([df, _parse_info(chunk["INFO"], list(infoDtypes.keys()), infoDtypes, info_sep)], axis="columns")
+                sampleData = {}
+                for field in fields:
+                    values = sampleValues[field].to_numpy().reshape(Nvariants, Nsamples)
+                    for i,sample in enumerate(samples):
+                        sampleData[(sample, field)] = _convert(pd.Series(values[:, i], index=chunk.index), formatDtypes[field], field)
+                columns = {f"{sample}_{field}":sampleData[(sample, field)] for sample in samples for field in fields}
+                df = pd.concat([df, pd.DataFrame(columns, index=chunk.index)], axis="columns")
+            else:
+                df = pd.DataFrame({col:np.repeat(df[col].values, Nsamples) for col in df.columns})
+                df["SAMPLE"] = np.tile(np.array(samples, dtype=object), Nvariants)
+                for field in fields:
+                    df[field] = _convert(sampleValues[field], formatDtypes[field], field)
+            yield df
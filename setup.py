@@ -27,6 +27,10 @@ setup(
     long_description=long_description,
     keywords=["duckdb", "sqlite3", "omics", "bioinformatics", "data analysis"],
     install_requires=read_file("requirements.txt"),
+    extras_require={
+        "arrow": ["pyarrow"],
+        "polars": ["pyarrow", "polars"],
+    },
     packages=find_packages(),
     classifiers=[
         "Development Status :: 1 - Planning",
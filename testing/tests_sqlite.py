@@ -1,9 +1,14 @@
 import unittest
+import asyncio
 from pathlib import Path
 import pandas as pd
 import numpy as np
+import importlib.util
 import os
-from omilayers import Omilayers
+import subprocess
+import sys
+import shutil
+from omilayers import Omilayers, ResultCache, AsyncOmilayers
 from omilayers.engines.sqlite.dbclass import DButils
 
 class TestSqlEngine(unittest.TestCase):
@@ -18,6 +23,9 @@ class TestSqlEngine(unittest.TestCase):
     def tearDownClass(cls):
         if Path(cls.db).exists:
             os.remove(cls.db)
+        for suffix in ["-wal", "-shm"]:
+            if Path(cls.db + suffix).exists():
+                os.remove(cls.db + suffix)
 
     def test_01_initialization(self):
         omi = Omilayers(self.db, engine=self.engine)
@@ -152,6 +160,607 @@ class TestSqlEngine(unittest.TestCase):
         layersNames = self._dbutils._get_tables_names()
         self.assertNotIn("renamed_layer", layersNames)
 
+    def test_18_persistent_session(self):
+        df = pd.DataFrame({'col1': np.arange(1, 6), 'col2': np.arange(6, 11)})
+        with Omilayers(self.db, engine=self.engine) as omi:
+            session = omi._dbutils._session
+            omi.layers['session_layer'] = df
+            omi.layers['session_layer'].set_info("Layer created in session.")
+            self.assertTrue(omi.layers['session_layer'].exists)
+            self.assertEqual(omi.layers['session_layer'].info, "Layer created in session.")
+            self.assertTrue(np.array_equal(omi.layers['session_layer'].to_df().values, df.values))
+            # The same connection was used throughout the session
+            self.assertIs(omi._dbutils._session, session)
+        self.assertIsNone(omi._dbutils._session)
+        omi = Omilayers(self.db, engine=self.engine)
+        self.assertIn('session_layer', omi.layers._layers)
+        omi.layers.drop('session_layer')
+
+    def test_19_pragma_profiles_and_transactions(self):
+        omi = Omilayers(self.db, config={"profile":"read-mostly", "cache_size":-2000}, engine=self.engine)
+        with omi._dbutils._connect() as conn:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            self.assertEqual(conn.execute("PRAGMA cache_size").fetchone()[0], -2000)
+        omi.layers['tx_layer'] = pd.DataFrame({'col1': np.arange(1, 6)})
+        # Statements in a failed transaction are rolled back
+        with self.assertRaises(ZeroDivisionError):
+            with omi._dbutils._transaction():
+                omi.layers['tx_layer'].insert({'col1': [6]})
+                1/0
+        self.assertTrue(np.array_equal(omi.layers['tx_layer']['col1'], np.arange(1, 6)))
+        omi.layers.drop('tx_layer')
+        # Read-only connections cannot write
+        omi = Omilayers(self.db, config={"profile":"read-mostly"}, read_only=True, engine=self.engine)
+        with self.assertRaises(Exception):
+            omi.run("CREATE TABLE foo (col1 INTEGER)")
+
+    def test_20_rowids_as_index(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        omi.layers['rowid_layer'] = pd.DataFrame({'col1': np.arange(10, 20), 'col2': np.arange(20, 30)})
+        omi.layers['rowid_layer'].drop(col='col1', values=[10, 11])
+        df = omi.layers['rowid_layer'].to_df()
+        rowids = omi._dbutils._get_table_rowids("rowid_layer")
+        self.assertTrue(np.array_equal(df.index.values, rowids))
+        self.assertTrue(np.array_equal(df['col1'].values, np.arange(12, 20)))
+        dfSliced = omi.layers['rowid_layer'].loc[slice(None, 5), ['col1']]
+        self.assertTrue(np.array_equal(dfSliced['col1'].values, df.loc[df.index < 5, 'col1'].values))
+        omi.layers.drop('rowid_layer')
+
+    def test_21_bulk_column_updates(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        omi.layers['update_layer'] = pd.DataFrame({'col1': np.arange(0, 10), 'col2': np.arange(10, 20)})
+        layer = omi.layers['update_layer']
+        layer['col2'] = np.arange(100, 110)
+        self.assertTrue(np.array_equal(layer['col2'], np.arange(100, 110)))
+        # Sparse update of selected rows
+        rowids = layer.to_df().index.values
+        layer.update('col1', [-1, -2], rowids=rowids[[2, 5]])
+        self.assertTrue(np.array_equal(layer['col1'], np.array([0, 1, -1, 3, 4, -2, 6, 7, 8, 9])))
+        # Update existing and add new columns at once
+        layer.assign(pd.DataFrame({'col2': np.arange(10), 'col3': np.arange(20, 30), 'col4': ['a']*10}))
+        df = layer.to_df()
+        self.assertEqual(list(df.columns), ['col1', 'col2', 'col3', 'col4'])
+        self.assertTrue(np.array_equal(df['col2'].values, np.arange(10)))
+        self.assertTrue(np.array_equal(df['col3'].values, np.arange(20, 30)))
+        self.assertTrue((df['col4'] == 'a').all())
+        with self.assertRaises(ValueError):
+            layer['col2'] = np.arange(5)
+        omi.layers.drop('update_layer')
+
+    def test_22_numpy_backend_and_exclude(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        omi.layers['backend_layer'] = pd.DataFrame({'col1': np.arange(5), 'col2': np.arange(5, 10), 'col3': list('abcde')})
+        result = omi.layers['backend_layer'].to_df(backend="numpy")
+        self.assertEqual(set(result.keys()), {'rowid', 'col1', 'col2', 'col3'})
+        self.assertTrue(np.array_equal(result['col2'], np.arange(5, 10)))
+        result = omi.layers['backend_layer'].select(cols='*', exclude='col3', where='col1', values=[1, 2])
+        self.assertEqual(list(result.columns), ['col1', 'col2'])
+        omi.layers['backend_layer'].backend = "numpy"
+        self.assertTrue(np.array_equal(omi.layers['backend_layer']['col1'], np.arange(5)))
+        with self.assertRaises(ValueError):
+            omi.layers['backend_layer'].to_df(backend="foo")
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+    def test_23_arrow_backends(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        table = omi.layers['backend_layer'].to_arrow()
+        self.assertEqual(table.column_names, ['rowid', 'col1', 'col2', 'col3'])
+        self.assertEqual(table.column('col3').to_pylist(), list('abcde'))
+        df = omi.layers['backend_layer'].query("col1 > 2", cols=['col3'], backend="pandas_pyarrow")
+        self.assertIsInstance(df['col3'].dtype, pd.ArrowDtype)
+        self.assertEqual(df['col3'].tolist(), ['d', 'e'])
+        if importlib.util.find_spec("polars"):
+            df = omi.layers['backend_layer'].to_polars(cols=['col1', 'col2'])
+            self.assertEqual(df.columns, ['rowid', 'col1', 'col2'])
+            self.assertEqual(df['col2'].to_list(), list(range(5, 10)))
+        omi.layers.drop('backend_layer')
+
+    def test_24_iterate_over_layer_in_batches(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        omi.layers['batch_layer'] = pd.DataFrame({'col1': np.arange(1000), 'col2': np.arange(1000, 2000)})
+        batches = list(omi.layers['batch_layer'].iter_batches(300, cols=['col2'], condition="col1 >= 100"))
+        self.assertEqual([len(batch) for batch in batches], [300, 300, 300])
+        self.assertEqual(list(batches[0].columns), ['col2'])
+        self.assertTrue(np.array_equal(pd.concat(batches)['col2'].values, np.arange(1100, 2000)))
+        # Layer can be modified while iterating
+        with Omilayers(self.db, engine=self.engine) as omi:
+            for batch in omi.layers['batch_layer'].iter_batches(500, backend="numpy"):
+                omi.layers['batch_layer'].update('col2', batch['col1'], rowids=batch['rowid'])
+            self.assertTrue(np.array_equal(omi.layers['batch_layer']['col2'], np.arange(1000)))
+        omi.layers.drop('batch_layer')
+
+    def test_25_create_layer_from_csv_with_native_reader(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        df = pd.DataFrame({'#CHROM': ['chr1']*5, 'POS': np.arange(100, 105), 'DS': np.linspace(0, 1, 5)})
+        filename = self.db + ".csv.gz"
+        df.to_csv(filename, sep='\t', index=False)
+        omi.layers['csv_layer'] = df
+        omi.layers.from_csv('csv_layer', filename, native=True, sep='\t')
+        os.remove(filename)
+        self.assertIn('csv_layer', omi._dbutils._get_tables_names())
+        dfStored = omi.layers['csv_layer'].to_df()
+        self.assertEqual(list(dfStored.columns), ['#CHROM', 'POS', 'DS'])
+        self.assertTrue(np.array_equal(dfStored['POS'].values, np.arange(100, 105)))
+        self.assertTrue(np.allclose(dfStored['DS'].values, np.linspace(0, 1, 5)))
+        omi.layers.drop('csv_layer')
+
+    def test_26_create_layer_from_vcf(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        lines = ['##fileformat=VCFv4.2',
+                 '##FORMAT=<ID=DS,Number=1,Type=Float,Description="Dosage">',
+                 '\t'.join(['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', 'FORMAT', 'S1', 'S2'])]
+        for i in range(5):
+            lines.append('\t'.join([f'chr{1 + i % 2}', str(100 + i), '.', 'A', 'T', '.', 'PASS', f'AF=0.{i};IMPUTED', 'GT:DS', '0|1:0.5', '1|1:.']))
+        filename = self.db + ".vcf"
+        with open(filename, 'w') as outfile:
+            outfile.write('\n'.join(lines) + '\n')
+        omi.layers.from_vcf('vcf_wide', filename, chunksize=2)
+        omi.layers.from_vcf('vcf_long', filename, fields=['DS'], layout='long', chunksize=2)
+        os.remove(filename)
+        dfWide = omi.layers['vcf_wide'].to_df()
+        self.assertEqual(list(dfWide.columns), ['CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'AF', 'IMPUTED', 'S1_GT', 'S1_DS', 'S2_GT', 'S2_DS'])
+        self.assertTrue(np.array_equal(dfWide['POS'].values, np.arange(100, 105)))
+        self.assertTrue(np.allclose(dfWide['AF'].values, [0, 0.1, 0.2, 0.3, 0.4]))
+        self.assertTrue(np.allclose(dfWide['S1_DS'].values, 0.5))
+        self.assertTrue(dfWide['S2_DS'].isna().all())
+        dfLong = omi.layers['vcf_long'].to_df()
+        self.assertEqual(list(dfLong.columns), ['CHROM', 'POS', 'ID', 'REF', 'ALT', 'SAMPLE', 'DS'])
+        self.assertEqual(dfLong['SAMPLE'].astype(str).tolist(), ['S1', 'S2'] * 5)
+        omi.layers.drop('vcf_wide')
+        omi.layers.drop('vcf_long')
+        # Keys and types of fields missing from the meta lines come from all records.
+        lines = ['##fileformat=VCFv4.2',
+                 '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">',
+                 '\t'.join(['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', 'FORMAT', 'S_1', 'S2'])]
+        for i in range(5):
+            info = f'AF=0.{i}' if i < 3 else f'AF=0.{i};LATE=x{i}'
+            lines.append('\t'.join(['chr1', str(100 + i), '.', 'A', 'T', '.', 'PASS', info, 'GT:AB_C:Q:DP', f'0|1:{i}:.:{i}', f'1|1:.:{"a" if i == 4 else i}:{i}']))
+        with open(filename, 'w') as outfile:
+            outfile.write('\n'.join(lines) + '\n')
+        omi.layers.from_vcf('vcf_wide', filename, chunksize=2)
+        dfWide = omi.layers['vcf_wide'].to_df()
+        self.assertEqual(list(dfWide.columns), ['CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'AF', 'LATE', 'S_1_GT', 'S_1_AB_C', 'S_1_Q', 'S_1_DP', 'S2_GT', 'S2_AB_C', 'S2_Q', 'S2_DP'])
+        self.assertEqual(dfWide['LATE'].tolist()[3:], ['x3', 'x4'])
+        self.assertTrue(np.allclose(dfWide['S_1_AB_C'].values, np.arange(5)))
+        self.assertEqual(dfWide['S2_Q'].astype(str).tolist(), ['0', '1', '2', '3', 'a'])
+        self.assertEqual(dfWide['S2_DP'].tolist(), [0, 1, 2, 3, 4])
+        omi.layers.drop('vcf_wide')
+        with open(filename, 'w') as outfile:
+            outfile.write('\n'.join(lines).replace('1|1:.:a:4', '1|1:.:a:x') + '\n')
+        with self.assertRaises(ValueError):
+            omi.layers.from_vcf('vcf_wide', filename, chunksize=2)
+        omi.layers.drop('vcf_wide')
+        os.remove(filename)
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+    def test_27_parquet_import_export(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        df = pd.DataFrame({'gene': ['g1', 'g2', 'g3', 'g4'], 'counts': np.arange(4.0), 'note': [None, None, 'x', 'y']})
+        omi.layers['parquet_layer'] = df
+        filename = self.db + ".parquet"
+        # The first row group has only nulls in "note".
+        omi.layers['parquet_layer'].to_parquet(filename, row_group_size=2)
+        omi.layers.from_parquet('parquet_copy', filename, batch_size=3)
+        dfStored = omi.layers['parquet_copy'].to_df()
+        self.assertEqual(list(dfStored.columns), ['gene', 'counts', 'note'])
+        self.assertTrue(np.array_equal(dfStored['counts'].values, df['counts'].values))
+        self.assertEqual(dfStored['note'].tolist()[2:], ['x', 'y'])
+        # External layers need the DuckDB engine
+        with self.assertRaises(NotImplementedError):
+            omi.layers.from_parquet('parquet_external', filename, external=True)
+        os.remove(filename)
+        omi.layers.drop('parquet_layer')
+        omi.layers.drop('parquet_copy')
+
+    def test_28_catalog_cache(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        omi.layers['catalog_layer'] = pd.DataFrame({'col1': np.arange(3), 'col2': ['a', 'b', 'c']})
+        layer = omi.layers['catalog_layer']
+        self.assertEqual(layer.columns, ['col1', 'col2'])
+        self.assertIn(('columns', 'catalog_layer'), omi._dbutils._catalog._entries)
+        self.assertEqual(layer.dtypes['col1'], 'INTEGER')
+        # Write paths invalidate the cached metadata
+        layer['col3'] = [1.0, 2.0, 3.0]
+        self.assertEqual(layer.columns, ['col1', 'col2', 'col3'])
+        layer.drop('col2')
+        self.assertEqual(layer.columns, ['col1', 'col3'])
+        layer.set_info('cached description')
+        self.assertEqual(layer.info, 'cached description')
+        omi.layers.rename('catalog_layer', 'catalog_renamed')
+        self.assertFalse(omi._dbutils._table_exists('catalog_layer'))
+        self.assertEqual(omi.layers['catalog_renamed'].columns, ['col1', 'col3'])
+        # Changes from another instance are seen after refresh
+        other = Omilayers(self.db, engine=self.engine)
+        other.layers['catalog_other'] = pd.DataFrame({'col1': np.arange(3)})
+        self.assertFalse(omi._dbutils._table_exists('catalog_other'))
+        omi.layers.refresh()
+        self.assertTrue(omi._dbutils._table_exists('catalog_other'))
+        self.assertTrue(omi.layers['catalog_other'].exists)
+        omi.layers.drop('catalog_renamed')
+        omi.layers.drop('catalog_other')
+
+    def test_29_search_index(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        omi.layers['search_counts'] = pd.DataFrame({'ENSG00000123': [1], 'ENSG00000456': [2]})
+        omi.layers['search_metabolites'] = pd.DataFrame({'glucose': [1.0], 'lactate': [2.0]})
+        omi.layers['search_metabolites'].set_info('Serum metabolite levels')
+        # Prefix of feature columns
+        df = omi.layers.search('ensg0000')
+        self.assertEqual(df['name'].tolist(), ['search_counts'])
+        self.assertEqual(df['score'].tolist(), [0.8])
+        # Exact matches rank first
+        df = omi.layers.search('lactate')
+        self.assertEqual(df['name'].tolist(), ['search_metabolites'])
+        self.assertEqual(df['score'].tolist(), [1.0])
+        self.assertEqual(omi.layers.search('serum')['name'].tolist(), ['search_metabolites'])
+        self.assertEqual(omi.layers.search('serum')['shape'].tolist(), ['1x2'])
+        # Wildcards are matched literally and short terms are matched as substrings
+        omi.layers['search_genes'] = pd.DataFrame({'gene_id%': ['g1']})
+        self.assertEqual(omi.layers.search('gene_id%')['score'].tolist(), [1.0])
+        self.assertTrue(omi.layers.search('gene_i%d').empty)
+        self.assertTrue(omi.layers.search('geneXid').empty)
+        self.assertEqual(omi.layers.search('ct')['name'].tolist(), ['search_metabolites'])
+        omi.layers.drop('search_genes')
+        # Fuzzy terms
+        self.assertTrue(omi.layers.search('glucse').empty)
+        self.assertEqual(omi.layers.search('glucse', fuzzy=True)['name'].tolist(), ['search_metabolites'])
+        # Index follows the write paths
+        omi.layers['search_metabolites'].rename('glucose', 'Glc')
+        self.assertTrue(omi.layers.search('glucose').empty)
+        omi.layers.drop('search_counts')
+        self.assertTrue(omi.layers.search('ENSG').empty)
+        omi.layers.drop('search_metabolites')
+
+    def test_30_secondary_indexes(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        omi.layers['indexed_layer'] = pd.DataFrame({'ID': ['rs1', 'rs2', 'rs3'], 'POS': [10, 20, 30], 'REF': ['A', 'C', 'G']})
+        layer = omi.layers['indexed_layer']
+        name = layer.create_index('ID', unique=True)
+        self.assertEqual(name, 'idx_indexed_layer_ID')
+        layer.create_index(['POS', 'REF'])
+        self.assertEqual(layer.indexes['columns'].tolist(), [['ID'], ['POS', 'REF']])
+        self.assertEqual(layer.indexes['unique'].tolist(), [True, False])
+        self.assertEqual(layer.select('POS', where='ID', values='rs2')['POS'].tolist(), [20])
+        # Indexes follow renamed and dropped columns
+        layer.rename('ID', 'rsid')
+        layer.drop('REF')
+        self.assertEqual(layer.indexes['columns'].tolist(), [['rsid']])
+        # Indexes are rebuilt when the data of the layer are replaced
+        layer.set_data(pd.DataFrame({'rsid': ['rs4', 'rs5']}))
+        self.assertEqual(layer.indexes['name'].tolist(), ['idx_indexed_layer_ID'])
+        layer.drop_index('idx_indexed_layer_ID')
+        self.assertTrue(layer.indexes.empty)
+        omi.layers.drop('indexed_layer')
+
+    def test_31_genomic_ranges(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        omi.layers['ranges_layer'] = pd.DataFrame({'CHROM': ['chr2', 'chr1', 'chr1', 'chr2', 'chr1'], 'POS': [100, 300, 100, 250, 200], 'ID': ['rs1', 'rs2', 'rs3', 'rs4', 'rs5']})
+        layer = omi.layers['ranges_layer']
+        layer.set_genomic_layout()
+        self.assertEqual(sorted(layer.range('chr1', 150, 300)['ID'].tolist()), ['rs2', 'rs5'])
+        self.assertTrue(layer.range('chr3', 0, 1000).empty)
+        regions = pd.DataFrame({'chrom': ['chr2', 'chr1'], 'start': [200, 100], 'end': [300, 200]}, index=['regionA', 'regionB'])
+        df = layer.ranges(regions, cols=['ID', 'POS'])
+        self.assertEqual(df['region'].tolist(), ['regionA', 'regionB', 'regionB'])
+        self.assertEqual(df[df['region'] == 'regionB'].sort_values('POS')['ID'].tolist(), ['rs3', 'rs5'])
+        self.assertRaises(ValueError, layer.ranges, regions.rename(columns={'chrom': 'CHROM'}))
+        omi.layers.drop('ranges_layer')
+
+    def test_32_staged_key_sets(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        omi.layers['keys_layer'] = pd.DataFrame({'CHROM': ['chr1', 'chr1', 'chr2', 'chr2'], 'POS': [10, 20, 10, 20], 'ID': ["rs1", "rs'2", "rs3", "rs4"]})
+        layer = omi.layers['keys_layer']
+        ids = ["rs'2", "rs4"] + [f"rs{i}" for i in range(10, 5000)]
+        self.assertEqual(layer.select('POS', where='ID', values=ids)['POS'].tolist(), [20, 20])
+        self.assertEqual(layer.select('ID', where='POS', values=np.array([10]))['ID'].tolist(), ['rs1', 'rs3'])
+        df = layer.select(['ID'], where=['CHROM', 'POS'], values=[('chr1', 20), ('chr2', 10), ('chr3', 10)])
+        self.assertEqual(df['ID'].tolist(), ["rs'2", 'rs3'])
+        keys = pd.DataFrame({'POS': [20], 'CHROM': ['chr2']})
+        self.assertEqual(layer.select('ID', where=['CHROM', 'POS'], values=keys)['ID'].tolist(), ['rs4'])
+        self.assertRaises(ValueError, layer.select, 'ID', ['CHROM', 'POS'], 'chr1')
+        layer.drop(['CHROM', 'POS'], values=[('chr1', 10), ('chr2', 20)])
+        self.assertEqual(layer['ID'].tolist(), ["rs'2", 'rs3'])
+        layer.drop('ID', values=["rs'2"])
+        self.assertEqual(layer['ID'].tolist(), ['rs3'])
+        omi.layers.drop('keys_layer')
+
+    def test_33_parameterized_queries(self):
+        omi = Omilayers(self.db, engine=self.engine, config={'statement_cache_size': 256})
+        omi.layers['params_layer'] = pd.DataFrame({'ID': ["rs1", "rs'2", "rs3"], 'POS': [10, 20, 30]})
+        layer = omi.layers['params_layer']
+        self.assertEqual(layer.query("ID = ?", params=["rs'2"])['POS'].tolist(), [20])
+        self.assertEqual(layer.query("POS BETWEEN :low AND :high", cols='ID', params={'low': 15, 'high': 40})['ID'].tolist(), ["rs'2", 'rs3'])
+        batches = list(layer.iter_batches(batch_size=1, condition="POS > ?", params=[15]))
+        self.assertEqual(len(batches), 2)
+        omi.run("UPDATE params_layer SET POS = ? WHERE ID = ?", params=[15, 'rs1'])
+        df = omi.run("SELECT ID FROM params_layer WHERE POS < ?", fetchdf=True, params=[20])
+        self.assertEqual(df['ID'].tolist(), ['rs1'])
+        self.assertEqual(list(layer.select('ID', where='ID', values="rs'2")), ["rs'2"])
+        omi.layers.drop('params_layer')
+
+    def test_34_dtype_preserving_types(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        df = pd.DataFrame({
+            'int8': np.array([1, 2, 3], dtype='int8'),
+            'uint16': np.array([1, 2, 3], dtype='uint16'),
+            'float32': np.array([0.5, 1.5, 2.5], dtype='float32'),
+            'bool': [True, False, True],
+            'category': pd.Categorical(['a', 'b', 'a']),
+            'nullable': pd.array([1, None, 3], dtype='Int32'),
+            'nullable64': pd.array([2**60 + 1, None, 3], dtype='Int64'),
+            'nullable_float': pd.array([1.5, None, 3], dtype='Float64'),
+            'timestamp': pd.to_datetime(['2020-01-01', '2021-06-15 10:30:00', None], format='ISO8601'),
+            })
+        omi.layers['types_layer'] = df
+        layer = omi.layers['types_layer']
+        self.assertEqual(layer.dtypes['float32'], 'FLOAT')
+        self.assertEqual(layer.dtypes['bool'], 'BOOLEAN')
+        layer['float32_added'] = df['float32']
+        layer['category_added'] = df['category']
+        out = layer.to_df()
+        for col in df.columns:
+            self.assertEqual(out[col].dtype.kind, df[col].dtype.kind, col)
+        self.assertEqual(out['float32_added'].dtype, np.float32)
+        self.assertIsInstance(out['category_added'].dtype, pd.CategoricalDtype)
+        self.assertEqual(str(out['nullable'].dtype), 'Int32')
+        self.assertEqual(str(out['nullable64'].dtype), 'Int64')
+        self.assertEqual(out['nullable64'].iloc[0], 2**60 + 1)
+        self.assertTrue(out['nullable_float'].isna().iloc[1])
+        self.assertTrue(out['timestamp'].isna().iloc[2])
+        self.assertEqual(layer.query("int8 > 1", cols='uint16')['uint16'].dtype, np.uint16)
+        # Columns declared by arbitrary queries and values that do not fit the declared type keep 64 bits
+        omi.run("ALTER TABLE types_layer ADD COLUMN big INT")
+        omi.run("UPDATE types_layer SET big = 5000000000, int8 = 1000 WHERE rowid = 1")
+        out = layer.to_df()
+        self.assertEqual(out['big'].iloc[0], 5000000000)
+        self.assertEqual(out['int8'].tolist(), [1000, 2, 3])
+        omi.layers.drop('types_layer')
+        omi.layers['int32_layer'] = pd.DataFrame({'a': np.array([1, 2], dtype='int32')})
+        self.assertEqual(omi.layers['int32_layer'].to_df()['a'].dtype, np.int32)
+        omi.layers.drop('int32_layer')
+        # Unsigned integers above the range of SQLite integers are rejected
+        omi.layers['uint64_layer'] = pd.DataFrame({'a': np.array([2**64 - 1], dtype='uint64')})
+        self.assertNotIn('uint64_layer', omi._dbutils._get_tables_names())
+        omi.layers['uint64_layer'] = pd.DataFrame({'a': np.array([1], dtype='uint64')})
+        with self.assertRaises(ValueError):
+            omi.layers['uint64_layer'].insert(pd.DataFrame({'a': np.array([2**63], dtype='uint64')}))
+        self.assertEqual(omi.layers['uint64_layer'].to_df()['a'].tolist(), [1])
+        omi.layers.drop('uint64_layer')
+
+    def test_35_matrix_layers(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        df = pd.DataFrame([[0, 1.5, 0], [2, 0, 0]], index=['s1', 's2'], columns=['g1', 'g2', 'g3'])
+        matrix = omi.layers.create_matrix('matrix_layer', df, dtype='float32')
+        matrix.add_sample('s3', {'g1': 1, 'g4': 3})
+        self.assertEqual(matrix.shape, (3, 4))
+        self.assertEqual(matrix.nnz, 4)
+        self.assertEqual(matrix.get_sample('s3').tolist(), [1, 0, 0, 3])
+        self.assertEqual(matrix.get_feature('g1', dense=False).to_dict(), {'s2': 2, 's3': 1})
+        dense = matrix.to_dense()
+        self.assertEqual(dense.loc['s1', 'g2'], 1.5)
+        self.assertEqual(dense['g1'].dtype, np.float32)
+        with self.assertRaises(ValueError):
+            matrix.add_sample('s1', {'g1': 1})
+        matrix64 = omi.layers.create_matrix('matrix_float64', df)
+        dense = matrix64.to_dense()
+        self.assertTrue((dense.dtypes == np.float64).all())
+        self.assertEqual(dense['g2'].tolist(), [1.5, 0.0])
+        self.assertEqual(matrix64.get_sample('s1').dtype, np.float64)
+        omi.layers.drop('matrix_float64')
+        omi = Omilayers(self.db, engine=self.engine)
+        self.assertEqual(omi.layers['matrix_layer'].samples, ['s1', 's2', 's3'])
+        omi.layers.rename('matrix_layer', 'matrix_renamed')
+        self.assertEqual(omi.layers['matrix_renamed'].features, ['g1', 'g2', 'g3', 'g4'])
+        omi.layers.drop('matrix_renamed')
+        self.assertFalse(omi.layers._dbutils._table_exists('matrix_renamed__samples'))
+
+    def test_36_dense_layers(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        df = pd.DataFrame(np.arange(12, dtype='float32').reshape(3, 4), index=['s1', 's2', 's3'], columns=['g1', 'g2', 'g3', 'g4'])
+        layer = omi.layers.create_dense('dense_layer', df)
+        layer.set_info('dense values')
+        self.assertEqual(layer.shape, (3, 4))
+        self.assertEqual(layer.dtype, np.float32)
+        self.assertTrue(layer.to_df().equals(df))
+        values = layer.to_numpy()
+        self.assertIsInstance(values, np.memmap)
+        self.assertEqual(layer['g2'].tolist(), [1, 5, 9])
+        self.assertEqual(layer[['g4', 'g1']].columns.tolist(), ['g4', 'g1'])
+        self.assertEqual(layer[1:3].shape, (3, 2))
+        with self.assertRaises(ValueError):
+            omi.layers.create_dense('dense_strings', pd.DataFrame({'a': ['x', 'y']}))
+        omi = Omilayers(self.db, engine=self.engine)
+        self.assertEqual(omi.layers['dense_layer'].info, 'dense values')
+        omi.layers.rename('dense_layer', 'dense_renamed')
+        self.assertEqual(omi.layers['dense_renamed'].index.tolist(), ['s1', 's2', 's3'])
+        omi.layers.drop('dense_renamed')
+        self.assertFalse(Path(self.db + '.arrays').exists())
+
+    def test_37_result_cache(self):
+        cache = ResultCache(max_bytes=10**6)
+        omi = Omilayers(self.db, engine=self.engine, cache=cache)
+        omi.layers['cache_layer'] = pd.DataFrame({'a': np.arange(10), 'b': list('abcdefghij')})
+        layer = omi.layers['cache_layer']
+        first = layer.query("a > 5")
+        first.loc[first.index[0], 'a'] = 100
+        second = layer.query("a  >  5")
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(second['a'].tolist(), [6, 7, 8, 9])
+        layer.insert(pd.DataFrame({'a': [10], 'b': ['k']}))
+        self.assertEqual(len(layer.query("a > 5")), 5)
+        layer['a'] = np.arange(11) * 2
+        self.assertEqual(layer.query("a > 5")['a'].tolist(), [6, 8, 10, 12, 14, 16, 18, 20])
+        layer.drop(values=[1, 2])
+        self.assertEqual(len(layer.to_df()), 9)
+        self.assertEqual(len(layer.to_df()), 9)
+        self.assertEqual(cache.stats['hits'], 2)
+        # Reads through run keep the cached results and writes drop them
+        self.assertEqual(omi.run("SELECT count(*) AS n FROM cache_layer", fetchdf=True)['n'].tolist(), [9])
+        self.assertEqual(len(layer.to_df()), 9)
+        self.assertEqual(cache.stats['hits'], 3)
+        omi.run("DELETE FROM cache_layer WHERE a = (SELECT max(a) FROM cache_layer)")
+        self.assertEqual(len(layer.to_df()), 8)
+        small = ResultCache(max_bytes=1)
+        omi = Omilayers(self.db, engine=self.engine, cache=small)
+        omi.layers['cache_layer'].to_df()
+        self.assertEqual(small.stats['entries'], 0)
+        omi.layers.drop('cache_layer')
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+    def test_38_result_cache_on_disk(self):
+        diskDir = self.db + '.cache'
+        omi = Omilayers(self.db, engine=self.engine, cache=ResultCache(disk_dir=diskDir))
+        omi.layers['disk_cache_layer'] = pd.DataFrame({'a': np.arange(5), 'b': list('abcde')})
+        expected = omi.layers['disk_cache_layer'].to_df()
+        cache = ResultCache(disk_dir=diskDir)
+        omi = Omilayers(self.db, engine=self.engine, cache=cache)
+        result = omi.layers['disk_cache_layer'].to_df()
+        self.assertEqual(cache.stats['disk_hits'], 1)
+        self.assertTrue(result.equals(expected))
+        omi.layers.drop('disk_cache_layer')
+        cache.clear()
+        shutil.rmtree(diskDir)
+
+    def test_39_lazy_queries(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        omi.layers['lazy_layer'] = pd.DataFrame({'ID': [f'r{i}' for i in range(10)], 'POS': np.arange(10)[::-1], 'SA010': np.arange(10) * 1.5, 'col 1': 1})
+        layer = omi.layers['lazy_layer']
+        base = layer.lazy().filter("POS > ?", params=[2])
+        query = base.filter("`col 1` = ?", params=[1])[['ID', 'SA010']].sort('POS').head(3)
+        df = query.collect()
+        self.assertEqual(df.columns.tolist(), ['ID', 'SA010'])
+        self.assertEqual(df['ID'].tolist(), ['r6', 'r5', 'r4'])
+        self.assertTrue(query.sql.startswith('SELECT rowid,"ID","SA010" FROM'))
+        self.assertEqual(len(base.collect()), 7)
+        self.assertEqual(layer.lazy().sort('POS', descending=True).head(2).collect()['POS'].tolist(), [9, 8])
+        with self.assertRaises(ValueError):
+            layer.lazy().head(2).filter("POS > 1")
+        with self.assertRaises(ValueError):
+            layer.lazy().filter("POS > ?", params=[1]).filter("ID = $id", params={'id': 'r1'})
+        omi.layers.drop('lazy_layer')
+
+    def test_40_layer_stats(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        omi.layers['stats_layer'] = pd.DataFrame({'ID': ['a', 'b', 'c', None], 'DP': [5, 1, 9, 3]})
+        layer = omi.layers['stats_layer']
+        stats = layer.stats.set_index('column')
+        self.assertEqual(stats.loc['ID', 'nulls'], 1)
+        self.assertEqual(stats.loc['ID', 'min'], 'a')
+        self.assertEqual(stats.loc['DP', 'max'], 9)
+        self.assertEqual(stats.loc['DP', 'distinct'], 4)
+        layer.insert(pd.DataFrame({'ID': ['d'], 'DP': [20]}))
+        stats = layer.stats.set_index('column')
+        self.assertEqual(stats.loc['DP', 'count'], 5)
+        self.assertEqual(stats.loc['DP', 'max'], 20)
+        self.assertEqual(stats.loc['ID', 'distinct'], 4)
+        layer.drop('DP', values=[20, 9])
+        stats = layer.stats.set_index('column')
+        self.assertEqual(stats.loc['DP', 'max'], 5)
+        self.assertEqual(stats.loc['DP', 'count'], 3)
+        layer['ALT'] = [1, 2, 3]
+        layer.drop('ID')
+        self.assertEqual(layer.stats['column'].tolist(), ['DP', 'ALT'])
+        shapes = omi.layers().set_index('name')['shape']
+        self.assertEqual(shapes['stats_layer'], '3x2')
+        omi.layers.drop('stats_layer')
+    def test_41_write_batches(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        df = pd.DataFrame({'ID': ['a', 'b'], 'DP': [1, 2]})
+        with omi.batch():
+            for i in range(3):
+                omi.layers[f'batch_layer_{i}'] = df
+                omi.layers[f'batch_layer_{i}'].set_tag('batch')
+                omi.layers[f'batch_layer_{i}'].set_info(f'Layer {i}.')
+        layers = omi.layers('batch')
+        self.assertEqual(sorted(layers['name']), ['batch_layer_0', 'batch_layer_1', 'batch_layer_2'])
+        self.assertEqual(layers.set_index('name').loc['batch_layer_1', 'info'], 'Layer 1.')
+        with self.assertRaises(RuntimeError):
+            with omi.transaction():
+                omi.layers['batch_layer_3'] = df
+                omi.layers['batch_layer_0'].insert(pd.DataFrame({'ID': ['c'], 'DP': [3]}))
+                raise RuntimeError("Rolled back.")
+        self.assertFalse(omi.layers['batch_layer_3'].exists)
+        self.assertEqual(omi.layers['batch_layer_0'].to_df().shape[0], 2)
+        for i in range(3):
+            omi.layers.drop(f'batch_layer_{i}')
+    def test_42_async_api(self):
+        # Query that runs until it is interrupted.
+        heavyQuery = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x+1 FROM c) SELECT count(*) FROM c"
+
+        async def main():
+            async with AsyncOmilayers(self.db, engine=self.engine, max_workers=2, max_pending=4) as omi:
+                await omi.layers.set('async_layer', pd.DataFrame({'ID': [f'r{i}' for i in range(20)], 'DP': np.arange(20)}))
+                await omi.layers['async_layer'].set_tag('async')
+                results = await asyncio.gather(*[omi.layers['async_layer'].query("DP = ?", params=[i]) for i in range(20)])
+                self.assertEqual([df['ID'].iloc[0] for df in results], [f'r{i}' for i in range(20)])
+                self.assertEqual(await omi.layers['async_layer'].columns(), ['ID', 'DP'])
+                self.assertEqual((await omi.layers('async'))['name'].tolist(), ['async_layer'])
+                task = asyncio.create_task(omi.run(heavyQuery, fetchdf=True))
+                await asyncio.sleep(0.2)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+                self.assertEqual((await omi.layers['async_layer'].to_df()).shape, (20, 2))
+                await omi.layers.drop('async_layer')
+        asyncio.run(main())
+    def test_43_parallel_reads(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        omi.layers['parallel_layer'] = pd.DataFrame({'CHROM': ['chr1', 'chr2'] * 50, 'POS': np.arange(100), 'SA010': np.arange(100) * 0.5})
+        regions = [['chr1', pos] for pos in range(0, 40, 2)] + [['chr2', 1000]]
+        layer = omi.layers['parallel_layer']
+        results = layer.select_many("CHROM = ? AND POS = ?", params=regions, cols=['SA010'], workers=3)
+        self.assertEqual(len(results), len(regions))
+        self.assertEqual([df['SA010'].tolist() for df in results[:-1]], [[pos * 0.5] for chrom,pos in regions[:-1]])
+        self.assertTrue(results[-1].empty)
+        counts = omi.parallel_map(lambda omi, chrom: len(omi.layers['parallel_layer'].query("CHROM = ?", params=[chrom])), ['chr1', 'chr2', 'chr3'], workers=2)
+        self.assertEqual(counts, [50, 50, 0])
+        # The session opened by parallel_map is closed when it returns, so that other processes can open the database
+        self.assertIsNone(omi._dbutils._session)
+        opened = subprocess.run([sys.executable, "-c", f"import sqlite3; con = sqlite3.connect({self.db!r}); con.execute('BEGIN EXCLUSIVE'); con.rollback()"])
+        self.assertEqual(opened.returncode, 0)
+        with self.assertRaises(ValueError):
+            omi.parallel_map(lambda omi, item: item, [1], workers=0)
+        omi.close()
+        omi.layers.drop('parallel_layer')
+    def test_44_create_layer_from_csv_with_workers(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        df = pd.DataFrame({'CHROM': ['chr1', 'chr2'] * 25, 'POS': np.arange(50), 'DS': np.linspace(0, 1, 50)})
+        filename = self.db + ".csv.gz"
+        df.to_csv(filename, sep='\t', index=False)
+        omi.layers.from_csv('csv_workers_layer', filename, chunksize=7, workers=2, sep='\t')
+        with self.assertRaises(ValueError):
+            omi.layers.from_csv('csv_workers_failed', filename, chunksize=7, workers=2, sep='\t', nrows=10)
+        os.remove(filename)
+        dfStored = omi.layers['csv_workers_layer'].to_df()
+        self.assertEqual(list(dfStored.columns), ['CHROM', 'POS', 'DS'])
+        self.assertEqual(dfStored['CHROM'].tolist(), df['CHROM'].tolist())
+        self.assertTrue(np.array_equal(dfStored['POS'].values, np.arange(50)))
+        self.assertTrue(np.allclose(dfStored['DS'].values, np.linspace(0, 1, 50)))
+        self.assertEqual(omi.layers().set_index('name').loc['csv_workers_layer', 'shape'], '50x3')
+        omi.layers.drop('csv_workers_layer')
+
+    def test_45_run_marks_written_layers_stale(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        omi.layers['run_layer'] = pd.DataFrame({'ID': ['a', 'b'], 'DP': [1, 2]})
+        omi.layers['run_other'] = pd.DataFrame({'ID': ['c'], 'DP': [3]})
+        omi.run("CREATE TABLE run_table (x INTEGER)")
+        omi.run("INSERT INTO run_layer VALUES ('c', 3)")
+        self.assertTrue(omi._dbutils._load_stats('run_layer')['']['stale'])
+        self.assertFalse(omi._dbutils._load_stats('run_other')['']['stale'])
+        self.assertEqual(omi.layers().set_index('name').loc['run_layer', 'shape'], '3x2')
+        omiRead = Omilayers(self.db, engine=self.engine, read_only=True)
+        self.assertEqual(omiRead.run("SELECT 1 AS x", fetchdf=True)['x'].tolist(), [1])
+        omiRead.run("SELECT 1")
+        omiRead.run("PRAGMA cache_size=1000")
+        omi.run("DROP TABLE run_table")
+        omi.layers.drop('run_layer')
+        omi.layers.drop('run_other')
+
+    def test_46_failed_layer_creation_is_rolled_back(self):
+        omi = Omilayers(self.db, engine=self.engine)
+        omi.layers['failed_layer'] = pd.DataFrame({'a': ['x', 'y', [1]]})
+        self.assertNotIn('failed_layer', omi._dbutils._get_tables_names())
+        self.assertNotIn('failed_layer', omi._dbutils._get_all_tables_names())
 
 if __name__ == '__main__':
     unittest.main()